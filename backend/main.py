@@ -17,7 +17,7 @@ sys.path.insert(0, project_root)
 
 # 导入核心引擎模块
 from core.engine.simulation import simulation_engine, CharacterState, GameEvent, Memory, SimulationResult
-from core.engine.character import CharacterInitializer
+from core.engine.character import character_initializer
 from core.engine.validator import RuleValidator, EraRules
 from core.engine.macro_events import macro_event_system, MacroEventType
 from core.engine.sensitive_events import hs_handler, SensitivityLevel, HandlingMode, HighSensitivityEventType
@@ -169,9 +169,6 @@ async def health_check():
 async def create_profile(request: CreateProfileRequest):
     """创建角色档案（集成核心引擎）"""
     try:
-        # 使用核心引擎创建角色
-        character_initializer = CharacterInitializer()
-        
         # 创建档案数据
         profile_data = {
             "id": f"profile_{datetime.now().timestamp()}",
@@ -187,7 +184,7 @@ async def create_profile(request: CreateProfileRequest):
         
         # 初始化角色状态
         profile_obj = LifeProfile(**profile_data)
-        initial_state = await character_initializer.initialize_character_state(profile_obj)
+        initial_state = character_initializer.initialize_character_state_sync(profile_obj)
         
         # 保存到数据库
         db_manager.create_profile(profile_data)
@@ -606,9 +603,7 @@ async def set_ai_level(level: str):
         if level not in valid_levels:
             return APIResponse(success=False, error=f"无效的AI级别，可选值: {valid_levels}")
         
-        ai_level = AILevel(f"L{level[1]}_LOCAL" if level == "L0" else 
-                          f"L{level[1]}_TEMPLATE" if level == "L1" else
-                          f"L{level[1]}_FREE_API" if level == "L2" else "L3_ADVANCED")
+        ai_level = AILevel.from_value_str(level)
         ai_service.set_level(ai_level)
         
         return APIResponse(
@@ -651,9 +646,7 @@ async def generate_events_ai(profile_id: str, num_events: int = 3, level: str =
         
         force_level = None
         if level != "auto":
-            force_level = AILevel(f"L{level[1]}_LOCAL" if level == "L0" else
-                                f"L{level[1]}_TEMPLATE" if level == "L1" else
-                                f"L{level[1]}_FREE_API" if level == "L2" else "L3_ADVANCED")
+            force_level = AILevel.from_value_str(level)
         
         result = await ai_service.generate_events(
             state,
@@ -0,0 +1,8 @@
+"""
+core.ai 各模块共用的Python版本兼容设置
+"""
+
+import sys
+
+# Python 3.10+ 启用 __slots__：@dataclass(**DATACLASS_SLOTS)
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
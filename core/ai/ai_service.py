@@ -7,24 +7,59 @@ import os
 import json
 import asyncio
 import hashlib
+from collections import namedtuple
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-from enum import Enum
+from enum import IntEnum
 
-# AI推演级别
-class AILevel(Enum):
-    L0_LOCAL = "L0"  # 本地规则引擎（免费）
-    L1_LOCAL_MODEL = "L1"  # 本地量化模型（免费）
-    L2_FREE_API = "L2"  # 免费API（有限额）
-    L3_ADVANCED = "L3"  # 高级API（付费）
+from .llm_cache import LLMCompletionCache
 
-class APIProvider(Enum):
-    LOCAL = "local"  # 本地生成
-    LOCAL_MODEL = "local_model"  # 本地量化模型
-    SILICON_FLOW = "silicon_flow"  # 硅基流动
-    ZHIPU = "zhipu"  # 智谱AI
-    BAIDU = "baidu"  # 百度
-    ALIBABA = "alibaba"  # 阿里
+# AI推演级别（IntEnum：比较走整数快速路径，序列化使用 value_str）
+class AILevel(IntEnum):
+    L0_LOCAL = 0  # 本地规则引擎（免费）
+    L1_LOCAL_MODEL = 1  # 本地量化模型（免费）
+    L2_FREE_API = 2  # 免费API（有限额）
+    L3_ADVANCED = 3  # 高级API（付费）
+    L1_TEMPLATE = 1  # 兼容旧名称，等同 L1_LOCAL_MODEL
+    
+    @property
+    def value_str(self) -> str:
+        """序列化用的级别字符串，如 L0"""
+        return f"L{int(self)}"
+    
+    @classmethod
+    def from_value_str(cls, value: str) -> "AILevel":
+        """从级别字符串（如 L2）解析"""
+        for level in cls:
+            if level.value_str == value:
+                return level
+        raise ValueError(f"无效的AI级别: {value}")
+
+class APIProvider(IntEnum):
+    LOCAL = 0  # 本地生成
+    LOCAL_MODEL = 1  # 本地量化模型
+    SILICON_FLOW = 2  # 硅基流动
+    ZHIPU = 3  # 智谱AI
+    BAIDU = 4  # 百度
+    ALIBABA = 5  # 阿里
+    
+    @property
+    def value_str(self) -> str:
+        """序列化用的提供商字符串，如 silicon_flow"""
+        return self.name.lower()
+
+# 角色状态只读视图：一次性提取推演所需字段，避免各生成路径重复 getattr
+_StateView = namedtuple("_StateView", ["age", "life_stage", "dimensions"])
+
+def _view(state: Any) -> _StateView:
+    """提取角色状态视图"""
+    if isinstance(state, _StateView):
+        return state
+    return _StateView(
+        getattr(state, 'age', 25),
+        getattr(state, 'life_stage', '青年'),
+        getattr(state, 'dimensions', None)
+    )
 
 class AIService:
     """AI服务管理器"""
@@ -33,8 +68,12 @@ class AIService:
         self.current_level = AILevel.L0_LOCAL
         self.current_provider = APIProvider.LOCAL
         self.api_keys = self._load_api_keys()
+        self._refresh_api_flags()
         # 硅基流动默认模型
         self.silicon_flow_model = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"
+        self.zhipu_model = "glm-4-flash"
+        # API生成结果持久化缓存
+        self._llm_cache = LLMCompletionCache()
         self.fallback_chain = [
             APIProvider.LOCAL,
             APIProvider.LOCAL_MODEL,
@@ -43,6 +82,14 @@ class AIService:
             APIProvider.BAIDU
         ]
         
+        # 推演级别 -> 生成方法
+        self._dispatch = {
+            AILevel.L0_LOCAL: self._generate_local,
+            AILevel.L1_LOCAL_MODEL: self._generate_local_model,
+            AILevel.L2_FREE_API: self._generate_with_api,
+            AILevel.L3_ADVANCED: self._generate_advanced
+        }
+        
         # 本地模型管理器
         self.local_model = None
         self._init_local_model()
@@ -108,15 +155,27 @@ class AIService:
         
         return api_keys
     
+    def _refresh_api_flags(self):
+        """根据当前密钥刷新API可用标记"""
+        self._has_sf = bool(self.api_keys.get('silicon_flow'))
+        self._has_zhipu = bool(self.api_keys.get('zhipu'))
+        self._has_baidu = bool(self.api_keys.get('baidu'))
+        self._has_alibaba = bool(self.api_keys.get('alibaba'))
+    
+    def set_api_key(self, provider: str, key: str):
+        """设置API密钥"""
+        self.api_keys[provider] = key
+        self._refresh_api_flags()
+    
     def set_level(self, level: AILevel):
         """设置AI推演级别"""
         self.current_level = level
-        print(f"[AI] 推演级别已切换到: {level.value}")
+        print(f"[AI] 推演级别已切换到: {level.name}")
     
     def set_provider(self, provider: APIProvider):
         """设置API提供商"""
         self.current_provider = provider
-        print(f"[AI] 当前API提供商: {provider.value}")
+        print(f"[AI] 当前API提供商: {provider.name}")
     
     async def generate_events(
         self,
@@ -125,30 +184,24 @@ class AIService:
         force_level: Optional[AILevel] = None
     ) -> Dict[str, Any]:
         """生成事件候选（自动路由）"""
-        level = force_level or self.current_level
+        level = force_level if force_level is not None else self.current_level
+        state = _view(state)
+        
+        handler = self._dispatch.get(level, self._generate_local)
         
         try:
-            if level == AILevel.L0_LOCAL:
-                return await self._generate_local(state, num_events)
-            elif level == AILevel.L1_LOCAL_MODEL:
-                return await self._generate_local_model(state, num_events)
-            elif level == AILevel.L2_FREE_API:
-                return await self._generate_with_api(state, num_events)
-            elif level == AILevel.L3_ADVANCED:
-                return await self._generate_advanced(state, num_events)
+            return await handler(state, num_events)
         except Exception as e:
             print(f"[AI] 生成失败，尝试降级: {e}")
             # 降级到本地
             return await self._generate_local(state, num_events)
     
-    async def _generate_local(self, state: Any, num_events: int) -> Dict[str, Any]:
+    async def _generate_local(self, state: _StateView, num_events: int) -> Dict[str, Any]:
         """L0: 本地规则引擎生成"""
         events = []
-        age = getattr(state, 'age', 25)
-        life_stage = getattr(state, 'life_stage', '青年')
         
         # 基于年龄和人生阶段生成事件模板
-        templates = self._get_event_templates(age, life_stage)
+        templates = self._get_event_templates(state.age, state.life_stage)
         
         for i, template in enumerate(templates[:num_events]):
             event = {
@@ -173,11 +226,11 @@ class AIService:
             "cost": 0
         }
     
-    async def _generate_template(self, state: Any, num_events: int) -> Dict[str, Any]:
+    async def _generate_template(self, state: _StateView, num_events: int) -> Dict[str, Any]:
         """L1: 模板增强生成（已弃用，使用本地模型）"""
         return await self._generate_local_model(state, num_events)
     
-    async def _generate_local_model(self, state: Any, num_events: int) -> Dict[str, Any]:
+    async def _generate_local_model(self, state: _StateView, num_events: int) -> Dict[str, Any]:
         """L1: 本地量化模型生成"""
         if not self.local_model:
             # 回退到本地规则
@@ -207,17 +260,17 @@ class AIService:
             print(f"[AI] 本地模型出错: {e}")
             return await self._generate_local(state, num_events)
     
-    async def _generate_with_api(self, state: Any, num_events: int) -> Dict[str, Any]:
+    async def _generate_with_api(self, state: _StateView, num_events: int) -> Dict[str, Any]:
         """L2: 使用免费API生成"""
         # 尝试硅基流动API
-        if self.api_keys.get('silicon_flow'):
+        if self._has_sf:
             try:
                 return await self._call_silicon_flow(state, num_events)
             except Exception as e:
                 print(f"[AI] 硅基流动API失败: {e}")
         
         # 回退到智谱AI
-        if self.api_keys.get('zhipu'):
+        if self._has_zhipu:
             try:
                 return await self._call_zhipu(state, num_events)
             except Exception as e:
@@ -227,7 +280,7 @@ class AIService:
         print("[AI] API不可用，降级到本地生成")
         return await self._generate_local(state, num_events)
     
-    async def _generate_advanced(self, state: Any, num_events: int) -> Dict[str, Any]:
+    async def _generate_advanced(self, state: _StateView, num_events: int) -> Dict[str, Any]:
         """L3: 高级API生成"""
         # 尝试所有可用API
         for provider in self.fallback_chain:
@@ -238,28 +291,33 @@ class AIService:
                     result = await self._generate_local_model(state, num_events)
                     if result.get("events"):
                         return result
-                elif provider == APIProvider.SILICON_FLOW and self.api_keys.get('silicon_flow'):
+                elif provider == APIProvider.SILICON_FLOW and self._has_sf:
                     return await self._call_silicon_flow(state, num_events)
-                elif provider == APIProvider.ZHIPU and self.api_keys.get('zhipu'):
+                elif provider == APIProvider.ZHIPU and self._has_zhipu:
                     return await self._call_zhipu(state, num_events)
             except (ConnectionError, TimeoutError, Exception):
                 continue
         
         return await self._generate_local(state, num_events)
     
-    async def _call_silicon_flow(self, state: Any, num_events: int) -> Dict[str, Any]:
-        """调用硅基流动API"""
-        import aiohttp
-        
-        age = getattr(state, 'age', 25)
-        life_stage = getattr(state, 'life_stage', '青年')
-        
-        prompt = f"""请为以下角色生成{num_events}个人生事件：
-- 年龄：{age}岁
-- 人生阶段：{life_stage}
-- 当前状态：{state.dimensions if hasattr(state, 'dimensions') else '正常'}
+    def _build_prompt(self, state: _StateView, num_events: int) -> str:
+        """构建API事件生成提示词"""
+        return f"""请为以下角色生成{num_events}个人生事件：
+- 年龄：{state.age}岁
+- 人生阶段：{state.life_stage}
+- 当前状态：{state.dimensions if state.dimensions is not None else '正常'}
 
 请生成JSON格式的事件列表，包含：title, description, eventType, choices, impacts"""
+    
+    async def _call_silicon_flow(self, state: _StateView, num_events: int) -> Dict[str, Any]:
+        """调用硅基流动API"""
+        prompt = self._build_prompt(state, num_events)
+        cache_key = self._llm_cache.make_key("silicon_flow", self.silicon_flow_model, prompt)
+        cached = self._llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        import aiohttp
         
         async with aiohttp.ClientSession() as session:
             async with session.post(
@@ -280,7 +338,7 @@ class AIService:
                     # 解析JSON
                     try:
                         events = json.loads(content)
-                        return {
+                        result = {
                             "events": events if isinstance(events, list) else [events],
                             "reasoning": "AI智能生成",
                             "confidence": 0.95,
@@ -288,24 +346,22 @@ class AIService:
                             "provider": "silicon_flow",
                             "cost": 0.001
                         }
+                        self._llm_cache.set(cache_key, result)
+                        return result
                     except (KeyError, ValueError, TypeError):
                         pass
         
         raise Exception("API响应解析失败")
     
-    async def _call_zhipu(self, state: Any, num_events: int) -> Dict[str, Any]:
+    async def _call_zhipu(self, state: _StateView, num_events: int) -> Dict[str, Any]:
         """调用智谱AI API"""
-        import aiohttp
-        
-        age = getattr(state, 'age', 25)
-        life_stage = getattr(state, 'life_stage', '青年')
+        prompt = self._build_prompt(state, num_events)
+        cache_key = self._llm_cache.make_key("zhipu", self.zhipu_model, prompt)
+        cached = self._llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        prompt = f"""请为以下角色生成{num_events}个人生事件：
-- 年龄：{age}岁
-- 人生阶段：{life_stage}
-- 当前状态：{state.dimensions if hasattr(state, 'dimensions') else '正常'}
-
-请生成JSON格式的事件列表，包含：title, description, eventType, choices, impacts"""
+        import aiohttp
         
         async with aiohttp.ClientSession() as session:
             async with session.post(
@@ -315,7 +371,7 @@ class AIService:
                     'Content-Type': 'application/json'
                 },
                 json={
-                    "model": "glm-4-flash",
+                    "model": self.zhipu_model,
                     "messages": [{"role": "user", "content": prompt}],
                     "max_tokens": 1000
                 }
@@ -325,7 +381,7 @@ class AIService:
                     content = data['choices'][0]['message']['content']
                     try:
                         events = json.loads(content)
-                        return {
+                        result = {
                             "events": events if isinstance(events, list) else [events],
                             "reasoning": "智谱AI智能生成",
                             "confidence": 0.93,
@@ -333,6 +389,8 @@ class AIService:
                             "provider": "zhipu",
                             "cost": 0.0005
                         }
+                        self._llm_cache.set(cache_key, result)
+                        return result
                     except (KeyError, ValueError, TypeError):
                         pass
         
@@ -400,15 +458,15 @@ class AIService:
     def get_status(self) -> Dict[str, Any]:
         """获取AI服务状态"""
         return {
-            "current_level": self.current_level.value,
-            "current_provider": self.current_provider.value,
+            "current_level": self.current_level.value_str,
+            "current_provider": self.current_provider.value_str,
             "available_apis": {
-                "silicon_flow": bool(self.api_keys.get('silicon_flow')),
-                "zhipu": bool(self.api_keys.get('zhipu')),
-                "baidu": bool(self.api_keys.get('baidu')),
-                "alibaba": bool(self.api_keys.get('alibaba'))
+                "silicon_flow": self._has_sf,
+                "zhipu": self._has_zhipu,
+                "baidu": self._has_baidu,
+                "alibaba": self._has_alibaba
             },
-            "fallback_chain": [p.value for p in self.fallback_chain]
+            "fallback_chain": [p.value_str for p in self.fallback_chain]
         }
 
 # 全局AI服务实例
@@ -6,12 +6,23 @@ import platform
 import subprocess
 import json
 import os
+import functools
+import shutil
+import importlib.util
+import hashlib
 from typing import Dict, List, Any, Optional
 from enum import Enum
 import sys
-from dataclasses import asdict
+from dataclasses import dataclass, asdict
 
-class Architecture(Enum):
+from ._compat import DATACLASS_SLOTS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Architecture(str, Enum):
     """CPU架构"""
     X86_64 = "x86_64"
     ARM64 = "arm64"
@@ -19,35 +30,203 @@ class Architecture(Enum):
     X86 = "x86"
     UNKNOWN = "unknown"
 
-class OSPlatform(Enum):
+class OSPlatform(str, Enum):
     """操作系统平台"""
     WINDOWS = "windows"
     LINUX = "linux"
     MACOS = "macos"
     UNKNOWN = "unknown"
 
+# 支持的Python版本
+_SUPPORTED_PY = frozenset({(3, 8), (3, 9), (3, 10), (3, 11)})
+
+# platform.machine() 常见取值 -> CPU架构
+_ARCH_MAP = {
+    "x86_64": Architecture.X86_64,
+    "amd64": Architecture.X86_64,
+    "aarch64": Architecture.ARM64,
+    "arm64": Architecture.ARM64,
+    "i386": Architecture.X86,
+    "i686": Architecture.X86
+}
+
+# sys.platform 为解释器编译期常量，无需 uname
+_SYS_PLATFORMS = {"win32": "windows", "linux": "linux", "darwin": "macos"}
+
+# 平台信息在进程生命周期内不变，只探测一次（Windows上 platform.* 可能启动子进程）
+@functools.lru_cache(maxsize=1)
+def _cached_machine() -> str:
+    return platform.machine().lower()
+
+@functools.lru_cache(maxsize=1)
+def _cached_processor() -> str:
+    return platform.processor()
+
+@functools.lru_cache(maxsize=1)
+def _cached_cpu_counts() -> tuple:
+    """(逻辑核心数, 物理核心数)"""
+    import psutil
+    return psutil.cpu_count(logical=True), psutil.cpu_count(logical=False)
+
+@functools.lru_cache(maxsize=1)
+def _cached_cpu_brand() -> str:
+    """macOS CPU型号（machdep.cpu.brand_string），优先直接调用 sysctlbyname"""
+    name = b"machdep.cpu.brand_string"
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        size = ctypes.c_size_t(0)
+        if libc.sysctlbyname(name, None, ctypes.byref(size), None, 0) == 0 and size.value:
+            buf = ctypes.create_string_buffer(size.value)
+            if libc.sysctlbyname(name, buf, ctypes.byref(size), None, 0) == 0:
+                return buf.value.decode("utf-8", "ignore").strip()
+    except (OSError, AttributeError, TypeError):
+        pass
+    
+    try:
+        result = subprocess.run([
+            "sysctl", "-n", name.decode()
+        ], capture_output=True, text=True)
+        if result.returncode == 0:
+            return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return ""
+
+def _probe_nvml_gpus() -> Optional[List[Dict[str, Any]]]:
+    """通过NVML读取NVIDIA GPU列表，失败返回None（在子进程中执行）"""
+    try:
+        import pynvml
+    except ImportError:
+        return None
+    
+    try:
+        pynvml.nvmlInit()
+    except pynvml.NVMLError:
+        return None
+    
+    gpus = []
+    try:
+        driver_version = pynvml.nvmlSystemGetDriverVersion()
+        if isinstance(driver_version, bytes):
+            driver_version = driver_version.decode("utf-8", "ignore")
+        for index in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+            name = pynvml.nvmlDeviceGetName(handle)
+            if isinstance(name, bytes):
+                name = name.decode("utf-8", "ignore")
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            gpus.append({
+                "vendor": "nvidia",
+                "name": name,
+                "driver_version": driver_version,
+                "total_memory_mb": memory.total >> 20,
+                "free_memory_mb": memory.free >> 20
+            })
+        return gpus
+    except pynvml.NVMLError:
+        return None
+    finally:
+        try:
+            pynvml.nvmlShutdown()
+        except pynvml.NVMLError:
+            pass
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_NVML_PROBE_SCRIPT = (
+    "import json\n"
+    "from core.ai.device_compatibility import _probe_nvml_gpus\n"
+    "print(json.dumps(_probe_nvml_gpus()))\n"
+)
+
+def _detect_nvidia_pynvml() -> Optional[List[Dict[str, Any]]]:
+    """通过 pynvml 检测NVIDIA GPU，失败返回None
+    
+    NVML在独立的子进程中初始化，探测结束后进程退出，驱动占用的显存随之释放
+    """
+    if importlib.util.find_spec("pynvml") is None:
+        return None
+    
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", _NVML_PROBE_SCRIPT],
+            capture_output=True, text=True, timeout=15,
+            cwd=_PROJECT_ROOT
+        )
+        return json.loads(result.stdout) if result.returncode == 0 else None
+    except (subprocess.TimeoutExpired, OSError, ValueError):
+        return None
+
+def _detect_nvidia_smi() -> List[Dict[str, Any]]:
+    """通过 nvidia-smi 检测NVIDIA GPU"""
+    gpus = []
+    try:
+        result = subprocess.run([
+            "nvidia-smi", "--query-gpu=name,memory.total,memory.free,driver_version",
+            "--format=csv,noheader,nounits"
+        ], capture_output=True, text=True, timeout=10)
+        
+        if result.returncode == 0:
+            for line in result.stdout.strip().split('\n'):
+                if line.strip():
+                    parts = line.split(', ')
+                    if len(parts) >= 2:
+                        gpus.append({
+                            "vendor": "nvidia",
+                            "name": parts[0].strip(),
+                            "driver_version": parts[3].strip() if len(parts) > 3 else "",
+                            "total_memory_mb": int(parts[1]),
+                            "free_memory_mb": int(parts[2]) if len(parts) > 2 else 0
+                        })
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError, ValueError):
+        pass
+    return gpus
+
+def _probe_nvidia_gpus() -> List[Dict[str, Any]]:
+    """探测NVIDIA GPU（NVML优先，不可用时回退到 nvidia-smi）
+    
+    剩余显存随时变化，不跨运行缓存，每次创建全局检查器时都重新探测
+    """
+    gpus = _detect_nvidia_pynvml()
+    return gpus if gpus is not None else _detect_nvidia_smi()
+
+
+@dataclass(**DATACLASS_SLOTS)
 class CompatibilityIssue:
     """兼容性问题"""
-    def __init__(self, severity: str, message: str, solution: str = ""):
-        self.severity = severity  # critical, warning, info
-        self.message = message
-        self.solution = solution
+    severity: str  # critical, warning, info
+    message: str
+    solution: str = ""
 
 class DeviceCompatibilityChecker:
     """设备兼容性检查器"""
     
-    def __init__(self):
+    def __init__(self, static_info: Optional[Dict[str, Any]] = None,
+                 nvidia_gpus: Optional[List[Dict[str, Any]]] = None):
+        # static_info: 上次运行缓存的静态探测结果（处理器、核心数、CPU型号），提供时跳过对应探测
+        # nvidia_gpus: 本次运行已探测到的NVIDIA GPU列表，提供时不再重复探测
+        self._static_info = static_info
+        self._nvidia_gpus = nvidia_gpus
         self.system_info = self._collect_system_info()
-        self.compatibility_issues = []
-        self.check_compatibility()
+        self._resolve_system_attrs()
+        self._compatibility_issues: Optional[List[CompatibilityIssue]] = None
+    
+    @property
+    def compatibility_issues(self) -> List[CompatibilityIssue]:
+        """兼容性问题列表（首次访问时执行检查）"""
+        if self._compatibility_issues is None:
+            self.check_compatibility()
+        return self._compatibility_issues
     
     def _collect_system_info(self) -> Dict[str, Any]:
         """收集系统信息"""
         info = {
-            "platform": platform.system().lower(),
-            "architecture": platform.machine().lower(),
-            "processor": platform.processor(),
+            "platform": _SYS_PLATFORMS.get(sys.platform, sys.platform),
+            "architecture": _cached_machine(),
+            "processor": self._static_info["processor"] if self._static_info else _cached_processor(),
             "python_version": sys.version,
+            "python_version_info": tuple(sys.version_info[:3]),
             "python_bits": 64 if sys.maxsize > 2**32 else 32
         }
         
@@ -56,23 +235,27 @@ class DeviceCompatibilityChecker:
             info["os_platform"] = OSPlatform.WINDOWS
         elif info["platform"] == "linux":
             info["os_platform"] = OSPlatform.LINUX
-        elif info["platform"] == "darwin":
+        elif info["platform"] == "macos":
             info["os_platform"] = OSPlatform.MACOS
         else:
             info["os_platform"] = OSPlatform.UNKNOWN
         
         # 检测架构
         arch = info["architecture"]
-        if "x86_64" in arch or "amd64" in arch:
-            info["cpu_arch"] = Architecture.X86_64
-        elif "aarch64" in arch or "arm64" in arch:
-            info["cpu_arch"] = Architecture.ARM64
-        elif "arm" in arch:
-            info["cpu_arch"] = Architecture.ARM32
-        elif "i386" in arch or "i686" in arch:
-            info["cpu_arch"] = Architecture.X86
-        else:
-            info["cpu_arch"] = Architecture.UNKNOWN
+        cpu_arch = _ARCH_MAP.get(arch)
+        if cpu_arch is None:
+            # 非常见取值（如 armv7l）再做子串匹配
+            if "x86_64" in arch or "amd64" in arch:
+                cpu_arch = Architecture.X86_64
+            elif "aarch64" in arch or "arm64" in arch:
+                cpu_arch = Architecture.ARM64
+            elif "arm" in arch:
+                cpu_arch = Architecture.ARM32
+            elif "i386" in arch or "i686" in arch:
+                cpu_arch = Architecture.X86
+            else:
+                cpu_arch = Architecture.UNKNOWN
+        info["cpu_arch"] = cpu_arch
         
         # 尝试获取更详细的信息
         self._enhance_system_info(info)
@@ -90,70 +273,60 @@ class DeviceCompatibilityChecker:
             info["available_memory_gb"] = round(memory.available / (1024**3), 1)
             info["memory_percent"] = memory.percent
             
-            # CPU信息
-            info["cpu_count_logical"] = psutil.cpu_count(logical=True)
-            info["cpu_count_physical"] = psutil.cpu_count(logical=False)
-            
-            # 磁盘信息
-            disk = psutil.disk_usage('/')
-            info["disk_free_gb"] = round(disk.free / (1024**3), 1)
+            # CPU信息（核心数不变，缓存）
+            if self._static_info:
+                info["cpu_count_logical"] = self._static_info["cpu_count_logical"]
+                info["cpu_count_physical"] = self._static_info["cpu_count_physical"]
+            else:
+                info["cpu_count_logical"], info["cpu_count_physical"] = _cached_cpu_counts()
             
         except ImportError:
             info["warning"] = "psutil not available, limited system info"
         except Exception as e:
             info["error"] = f"Failed to collect enhanced info: {e}"
         
+        # 磁盘信息（直接 statvfs，无需psutil）
+        try:
+            disk = shutil.disk_usage('/')
+            info["disk_free_gb"] = round(disk.free / (1024**3), 1)
+        except OSError as e:
+            info["error"] = f"Failed to collect disk info: {e}"
+        
         # GPU信息
         self._detect_gpu_info(info)
     
     def _detect_gpu_info(self, info: Dict[str, Any]):
         """检测GPU信息"""
-        info["gpu_info"] = []
-        
-        # NVIDIA GPU检测
-        try:
-            if info["os_platform"] == OSPlatform.WINDOWS:
-                result = subprocess.run([
-                    "nvidia-smi", "--query-gpu=name,memory.total,memory.free",
-                    "--format=csv,noheader,nounits"
-                ], capture_output=True, text=True, timeout=10)
-                
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n'):
-                        if line.strip():
-                            parts = line.split(', ')
-                            if len(parts) >= 2:
-                                info["gpu_info"].append({
-                                    "vendor": "nvidia",
-                                    "name": parts[0].strip(),
-                                    "total_memory_mb": int(parts[1]),
-                                    "free_memory_mb": int(parts[2]) if len(parts) > 2 else 0
-                                })
-            
-        except (subprocess.TimeoutExpired, FileNotFoundError, ValueError):
-            pass
+        # NVIDIA GPU检测：优先直接调用NVML，不可用时回退到 nvidia-smi
+        nvidia_gpus = self._nvidia_gpus if self._nvidia_gpus is not None else _probe_nvidia_gpus()
+        info["gpu_info"] = [dict(gpu) for gpu in nvidia_gpus]
         
-        # Apple Silicon 检测
+        # Apple Silicon 检测（CPU型号不变，可取自缓存）
+        info["cpu_brand"] = ""
         if info["cpu_arch"] == Architecture.ARM64 and info["os_platform"] == OSPlatform.MACOS:
-            try:
-                result = subprocess.run([
-                    "sysctl", "-n", "machdep.cpu.brand_string"
-                ], capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    cpu_info = result.stdout.strip()
-                    if "Apple" in cpu_info:
-                        info["gpu_info"].append({
-                            "vendor": "apple",
-                            "name": cpu_info,
-                            "type": "integrated"
-                        })
-            except:
-                pass
+            cpu_info = self._static_info["cpu_brand"] if self._static_info else _cached_cpu_brand()
+            info["cpu_brand"] = cpu_info
+            if "Apple" in cpu_info:
+                info["gpu_info"].append({
+                    "vendor": "apple",
+                    "name": cpu_info,
+                    "type": "integrated"
+                })
+    
+    def _resolve_system_attrs(self):
+        """将检查用到的系统信息解析为实例属性（system_info 仍为数据来源）"""
+        info = self.system_info
+        self.os_platform = info.get("os_platform")
+        self.cpu_arch = info.get("cpu_arch")
+        self.python_bits = info.get("python_bits")
+        self.python_version_info = tuple(info.get("python_version_info", sys.version_info[:3]))
+        self.total_memory_gb = info.get("total_memory_gb", 0)
+        self.disk_free_gb = info.get("disk_free_gb", 0)
     
     def check_compatibility(self) -> List[CompatibilityIssue]:
         """检查兼容性"""
-        self.compatibility_issues.clear()
+        self._compatibility_issues = []
+        self._resolve_system_attrs()
         
         self._check_os_compatibility()
         self._check_architecture_compatibility()
@@ -166,30 +339,27 @@ class DeviceCompatibilityChecker:
     
     def _check_os_compatibility(self):
         """检查操作系统兼容性"""
-        os_platform = self.system_info.get("os_platform")
+        os_platform = self.os_platform
         
-        if os_platform == OSPlatform.UNKNOWN:
-            self.compatibility_issues.append(CompatibilityIssue(
-                "critical",
-                f"不支持的操作系统: {self.system_info.get('platform')}",
-                "请使用 Windows、Linux 或 macOS"
-            ))
-        elif os_platform == OSPlatform.WINDOWS:
-            # Windows 通常兼容性良好
-            pass
-        elif os_platform == OSPlatform.LINUX:
-            # Linux 需要检查一些依赖
+        if os_platform == OSPlatform.LINUX or os_platform == OSPlatform.WINDOWS:
+            # Linux/Windows 通常兼容性良好
             pass
         elif os_platform == OSPlatform.MACOS:
             # macOS 需要检查架构
-            if self.system_info.get("cpu_arch") == Architecture.ARM64:
+            if self.cpu_arch == Architecture.ARM64:
                 # Apple Silicon 需要特殊处理
                 pass
+        elif os_platform == OSPlatform.UNKNOWN:
+            self.compatibility_issues.append(CompatibilityIssue(
+                "critical",
+                f"不支持的操作系统: {self.system_info.get('platform')}",
+                "请使用 Windows、Linux 或 macOS"
+            ))
     
     def _check_architecture_compatibility(self):
         """检查架构兼容性"""
-        cpu_arch = self.system_info.get("cpu_arch")
-        python_bits = self.system_info.get("python_bits")
+        cpu_arch = self.cpu_arch
+        python_bits = self.python_bits
         
         if cpu_arch == Architecture.UNKNOWN:
             self.compatibility_issues.append(CompatibilityIssue(
@@ -216,7 +386,7 @@ class DeviceCompatibilityChecker:
     
     def _check_memory_compatibility(self):
         """检查内存兼容性"""
-        total_memory = self.system_info.get("total_memory_gb", 0)
+        total_memory = self.total_memory_gb
         
         if total_memory == 0:
             self.compatibility_issues.append(CompatibilityIssue(
@@ -253,7 +423,7 @@ class DeviceCompatibilityChecker:
     
     def _check_disk_space(self):
         """检查磁盘空间"""
-        disk_free = self.system_info.get("disk_free_gb", 0)
+        disk_free = self.disk_free_gb
         
         if disk_free == 0:
             self.compatibility_issues.append(CompatibilityIssue(
@@ -273,30 +443,27 @@ class DeviceCompatibilityChecker:
     
     def _check_python_compatibility(self):
         """检查Python兼容性"""
-        python_version = self.system_info.get("python_version", "")
+        version_info = self.python_version_info
         
         # 检查Python版本
-        if "3.8" not in python_version and "3.9" not in python_version and "3.10" not in python_version and "3.11" not in python_version:
+        if version_info[:2] not in _SUPPORTED_PY:
             self.compatibility_issues.append(CompatibilityIssue(
                 "warning",
-                f"Python版本可能不兼容: {python_version}",
+                f"Python版本可能不兼容: {'.'.join(map(str, version_info))}",
                 "推荐使用Python 3.8-3.11"
             ))
     
     def _check_dependencies_compatibility(self):
         """检查依赖兼容性"""
         # 检查llama-cpp-python的特定要求
-        os_platform = self.system_info.get("os_platform")
-        cpu_arch = self.system_info.get("cpu_arch")
-        
-        if os_platform == OSPlatform.WINDOWS:
+        if self.os_platform == OSPlatform.WINDOWS:
             self.compatibility_issues.append(CompatibilityIssue(
                 "info",
                 "Windows平台需要Visual Studio Build Tools来编译llama-cpp-python",
                 "可以从 https://visualstudio.microsoft.com/visual-cpp-build-tools/ 下载"
             ))
         
-        if cpu_arch == Architecture.ARM64:
+        if self.cpu_arch == Architecture.ARM64:
             self.compatibility_issues.append(CompatibilityIssue(
                 "info",
                 "ARM64架构可能需要从源码编译llama-cpp-python",
@@ -329,27 +496,86 @@ class DeviceCompatibilityChecker:
     
     def get_compatibility_report(self) -> Dict[str, Any]:
         """获取兼容性报告"""
-        critical_issues = [issue for issue in self.compatibility_issues if issue.severity == "critical"]
-        warning_issues = [issue for issue in self.compatibility_issues if issue.severity == "warning"]
-        info_issues = [issue for issue in self.compatibility_issues if issue.severity == "info"]
-        
-        # 手动转换CompatibilityIssue为字典
-        def issue_to_dict(issue):
-            return {
-                "severity": issue.severity,
-                "message": issue.message,
-                "solution": issue.solution
-            }
+        # 单次遍历按严重程度分组
+        buckets = {"critical": [], "warning": [], "info": []}
+        for issue in self.compatibility_issues:
+            buckets.setdefault(issue.severity, []).append(asdict(issue))
+        critical_issues = buckets["critical"]
         
         return {
             "system_info": self.system_info,
             "compatibility_status": "compatible" if not critical_issues else "incompatible",
-            "critical_issues": [issue_to_dict(issue) for issue in critical_issues],
-            "warning_issues": [issue_to_dict(issue) for issue in warning_issues],
-            "info_issues": [issue_to_dict(issue) for issue in info_issues],
+            "critical_issues": critical_issues,
+            "warning_issues": buckets["warning"],
+            "info_issues": buckets["info"],
             "recommended_models": self.get_recommended_models(),
             "can_run_local_models": len(critical_issues) == 0
         }
 
-# 全局兼容性检查器
-device_compatibility_checker = DeviceCompatibilityChecker()
\ No newline at end of file
+    def get_compatibility_report_bytes(self) -> bytes:
+        """获取JSON编码的兼容性报告（安装了orjson时使用orjson）"""
+        report = self.get_compatibility_report()
+        if orjson is not None:
+            return orjson.dumps(report, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(report, ensure_ascii=False).encode("utf-8")
+
+# 静态探测结果缓存（同一机器、同一解释器下不会变化；剩余内存/显存等动态数值不缓存）
+_COMPAT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "life", "compat.json")
+_STATIC_INFO_KEYS = ("processor", "cpu_count_logical", "cpu_count_physical", "cpu_brand")
+
+def _compat_cache_key(nvidia_gpus: List[Dict[str, Any]]) -> Optional[str]:
+    """缓存键：平台、架构、Python版本、psutil版本，以及硬件标识（内存总量、逻辑核心数、
+    GPU型号/显存总量/驱动版本），更换硬件或驱动后缓存失效；psutil不可用时不使用缓存"""
+    try:
+        import psutil
+        total_memory = psutil.virtual_memory().total
+    except ImportError:
+        return None
+    gpus = ";".join(
+        f"{gpu.get('name')}/{gpu.get('total_memory_mb')}/{gpu.get('driver_version', '')}"
+        for gpu in nvidia_gpus
+    )
+    raw = (f"{sys.platform}|{_cached_machine()}|{tuple(sys.version_info)}|{psutil.__version__}"
+           f"|{total_memory}|{os.cpu_count()}|{gpus}")
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+def _load_static_info(key: str) -> Optional[Dict[str, Any]]:
+    """读取与缓存键匹配的静态探测结果"""
+    try:
+        with open(_COMPAT_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get("key") != key:
+            return None
+        static_info = cached["static_info"]
+        if all(k in static_info for k in _STATIC_INFO_KEYS):
+            return static_info
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+    return None
+
+def _save_static_info(key: str, system_info: Dict[str, Any]):
+    """写入静态探测结果"""
+    try:
+        os.makedirs(os.path.dirname(_COMPAT_CACHE_PATH), exist_ok=True)
+        payload = {
+            "key": key,
+            "static_info": {k: system_info.get(k) for k in _STATIC_INFO_KEYS}
+        }
+        temp_path = f"{_COMPAT_CACHE_PATH}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(temp_path, _COMPAT_CACHE_PATH)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"[Compatibility] 写入兼容性缓存失败: {e}")
+
+# 全局兼容性检查器（首次使用时创建）
+@functools.lru_cache(maxsize=1)
+def get_device_compatibility_checker() -> DeviceCompatibilityChecker:
+    """获取全局兼容性检查器（命中缓存时跳过处理器/核心数/CPU型号探测，GPU每次重新探测）"""
+    nvidia_gpus = _probe_nvidia_gpus()
+    key = _compat_cache_key(nvidia_gpus)
+    static_info = _load_static_info(key) if key else None
+    checker = DeviceCompatibilityChecker(static_info=static_info, nvidia_gpus=nvidia_gpus)
+    if key and static_info is None:
+        _save_static_info(key, checker.system_info)
+    return checker
\ No newline at end of file
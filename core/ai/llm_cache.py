@@ -0,0 +1,114 @@
+"""
+LLM补全结果持久化缓存
+基于SQLite（WAL模式）按提示词哈希缓存API生成结果，跨会话、跨进程复用
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".life", "llm_cache.db")
+DEFAULT_TTL_SECONDS = 7 * 86400  # 7天
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class LLMCompletionCache:
+    """LLM补全结果缓存"""
+
+    def __init__(self, db_path: Optional[str] = None,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = os.path.expanduser(db_path or os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str) -> str:
+        """根据提供商、模型和提示词生成缓存键"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (provider, model, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """首次使用时打开数据库连接"""
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，过期或不存在时返回None"""
+        try:
+            with self.lock:
+                row = self._connect().execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None or row[1] < time.time():
+                return None
+            return json.loads(row[0])
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"[LLMCache] 读取缓存失败: {e}")
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """写入缓存"""
+        try:
+            now = time.time()
+            with self.lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now + self.ttl_seconds)
+                )
+                self._prune(conn, now)
+                conn.commit()
+        except (sqlite3.Error, OSError, TypeError, ValueError) as e:
+            print(f"[LLMCache] 写入缓存失败: {e}")
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        """清理过期条目，并在超出容量时删除最早过期的条目"""
+        conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        """清空缓存"""
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"[LLMCache] 清空缓存失败: {e}")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
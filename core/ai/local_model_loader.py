@@ -4,21 +4,33 @@
 """
 
 import os
-import sys
 import json
 import threading
 import time
-from typing import Dict, Any, Optional, Callable, List
+from typing import Dict, Any, Optional, Callable, List, Tuple
+from collections import OrderedDict
 from dataclasses import dataclass
 from enum import Enum
 from datetime import datetime
 import hashlib
+import functools
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 导入依赖管理
-from .model_dependencies import dependency_manager
+from . import model_dependencies
+from ._compat import DATACLASS_SLOTS
 from .model_benchmark import ModelBenchmark, BenchmarkResult
 from .model_manager import model_download_manager
-from .device_compatibility import device_compatibility_checker, CompatibilityIssue
+from .device_compatibility import get_device_compatibility_checker, CompatibilityIssue
 
 class ModelSize(Enum):
     """模型大小"""
@@ -42,19 +54,23 @@ class DeviceTier(Enum):
     HIGH_END = "high"      # 高端设备：8-16GB RAM
     ULTRA = "ultra"        # 旗舰设备：>16GB RAM
 
-@dataclass
+
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class ModelConfig:
     """模型配置"""
     name: str
     size: ModelSize
     path: str
-    quantization: str  # Q4, Q5, Q8
+    quantization: str  # Q4_K_M, Q5_K_M, Q6_K
     min_ram_gb: float
     vram_gb: float
     tokens_per_second: int
     quality_score: int  # 1-100
+    quant_bits: float = 4.5  # 每权重平均比特数
+    params_b: float = 0.0  # 参数量（十亿）
+    n_layers: int = 32  # Transformer层数
 
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class DeviceProfile:
     """设备性能档案"""
     tier: DeviceTier
@@ -64,6 +80,116 @@ class DeviceProfile:
     has_gpu: bool
     vram_gb: float = 0
     recommended_model: ModelSize = ModelSize.TINY
+    has_mps: bool = False  # Apple Silicon（Metal）
+    gpu_count: int = 0  # NVIDIA GPU数量
+    gpu_vram_gb: Tuple[float, ...] = ()  # 各NVIDIA GPU显存（GB）
+
+# 各设备档次优先选用的量化等级
+_TIER_QUANTIZATION = {
+    DeviceTier.ULTRA: "Q6_K",
+    DeviceTier.HIGH_END: "Q5_K_M",
+    DeviceTier.MID_RANGE: "Q4_K_M",
+    DeviceTier.LOW_END: "Q4_K_M",
+}
+
+def _gpu_summary(gpu_info: List[Dict[str, Any]]):
+    """从GPU列表汇总 (has_gpu, 显存总量GB, 是否Apple Silicon, 各GPU显存GB)
+    
+    llama.cpp 默认把卸载的层分摊到所有可见GPU，显存按各卡之和计算；
+    NVML 列出全部GPU，设置了 CUDA_VISIBLE_DEVICES（按序号）时只统计可见的GPU
+    """
+    nvidia = [gpu for gpu in gpu_info if gpu.get("vendor") == "nvidia"]
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        try:
+            indices = [int(index) for index in visible.split(",") if index.strip()]
+            nvidia = [nvidia[index] for index in indices if 0 <= index < len(nvidia)]
+        except ValueError:
+            pass  # GPU UUID 形式，无法与探测结果对应，按全部GPU统计
+    gpu_vram_gb = tuple(gpu.get("total_memory_mb", 0) / 1024 for gpu in nvidia)
+    has_mps = any(gpu.get("vendor") == "apple" for gpu in gpu_info)
+    return bool(nvidia), sum(gpu_vram_gb), has_mps, gpu_vram_gb
+
+def estimate_offload_layers(config: ModelConfig, vram_gb: float) -> int:
+    """按显存估算可卸载到GPU的层数，显存足够容纳整个模型时返回-1（全部卸载）"""
+    if vram_gb <= 0 or config.params_b <= 0 or config.n_layers <= 0:
+        return 0
+    model_gb = config.params_b * config.quant_bits / 8
+    budget_gb = vram_gb * 0.85  # 预留显存给KV缓存和计算缓冲
+    if budget_gb >= model_gb:
+        return -1
+    return min(config.n_layers - 1, int(budget_gb / (model_gb / config.n_layers)))
+
+def estimate_host_ram_gb(config: ModelConfig, vram_gb: float) -> float:
+    """估算部分卸载到GPU后仍需的主机内存：未卸载的层（mmap映射的权重页）及其运行开销"""
+    layers = estimate_offload_layers(config, vram_gb)
+    if layers < 0:
+        return 0.0
+    if config.n_layers <= 0:
+        return config.min_ram_gb
+    return config.min_ram_gb * (config.n_layers - layers) / config.n_layers
+
+# 事件生成提示词：固定前缀在前，便于缓存其KV状态；角色信息等可变部分在后
+_EVENT_PROMPT_PREFIX = """请为角色生成人生事件，以JSON格式返回。
+请返回事件数组，每个事件包含：
+- title: 事件标题
+- description: 事件描述
+- eventType: 事件类型
+- choices: 选项数组
+- impacts: 影响对象
+
+返回格式：[{事件1}, {事件2}, ...]
+
+"""
+_EVENT_PROMPT_SUFFIX = """需要生成{num_events}个事件。
+角色信息：
+- 年龄：{age}岁
+- 人生阶段：{life_stage}
+- 当前状态：{dimensions}
+"""
+
+def _dumps(obj: Any) -> str:
+    """序列化为JSON字符串（保留中文，安装了orjson时使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+# 系统内存读数缓存（GB），避免频繁重试加载时反复读取 /proc/meminfo
+_MEM_CACHE = {"ts": 0.0, "avail_gb": 0.0, "total_gb": 0.0}
+
+def _get_mem(ttl: float = 0.5, refresh: bool = False) -> Dict[str, float]:
+    """获取系统内存，ttl秒内复用上次 psutil.virtual_memory() 的结果"""
+    now = time.monotonic()
+    if refresh or now - _MEM_CACHE["ts"] > ttl:
+        memory = psutil.virtual_memory()
+        _MEM_CACHE["total_gb"] = memory.total / (1024**3)
+        _MEM_CACHE["avail_gb"] = memory.available / (1024**3)
+        _MEM_CACHE["ts"] = now
+    return _MEM_CACHE
+
+_EVENTS_GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "events.gbnf")
+
+@functools.lru_cache(maxsize=1)
+def _events_grammar_rules() -> str:
+    """事件语法中除根规则外的规则（读取一次）"""
+    with open(_EVENTS_GRAMMAR_PATH, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _events_root_rule(num_events: int) -> str:
+    """事件数组的根规则：1到 num_events 个事件，防止失控生成耗尽token预算
+    
+    用嵌套可选项表示上限，兼容不支持 {m,n} 重复语法的旧版 llama.cpp
+    """
+    tail = ""
+    for _ in range(max(num_events, 1) - 1):
+        tail = f'(ws "," ws event {tail})?'
+    return f'root ::= "[" ws event {tail} ws "]"\n'
+
+def _estimate_ram_gb(params_b: float, quant_bits: float) -> float:
+    """按参数量(十亿)和量化比特数估算运行所需内存（含约15%的KV缓存与运行时开销）"""
+    return round(params_b * quant_bits / 8 * 1.15, 1)
 
 class LocalModelManager:
     """本地模型管理器"""
@@ -74,117 +200,173 @@ class LocalModelManager:
         self.current_config: Optional[ModelConfig] = None
         self.model_status = ModelStatus.NOT_LOADED
         self.device_profile: Optional[DeviceProfile] = None
-        self.model_cache: Dict[str, Any] = {}
+        # 已卸载但仍保持mmap映射的模型（LRU），以GGUF路径为键，共享同一文件的配置可复用
+        self._warm_cache: "OrderedDict[str, Tuple[Any, ModelConfig]]" = OrderedDict()
+        self.max_warm_models = 2
         self.load_callbacks: List[Callable] = []
         self.unload_callbacks: List[Callable] = []
         self.lock = threading.Lock()
-        self.last_used: Optional[datetime] = None
+        self._generate_lock = threading.RLock()  # 串行化同一模型实例上的生成与KV状态恢复
+        self.last_used: Optional[float] = None  # time.monotonic() 时间戳
         self.idle_timeout_seconds = 300  # 5分钟无使用自动卸载
+        self._idle_timer: Optional[threading.Timer] = None
+        self.n_batch: Optional[int] = None  # 预填充批大小，None 时按CPU核心数自动选择
+        self.n_threads: Optional[int] = None  # 推理线程数，None 时使用物理核心数
+        self.n_gpu_layers = 0  # 当前模型卸载到GPU的层数（-1表示全部）
+        self._prefix_state: Optional[Any] = None  # 事件提示词固定前缀的KV状态
+        self._events_grammars: Dict[int, Any] = {}  # 事件输出的语法约束（按事件数缓存）
         
         # 模型配置表
         self.model_configs = self._init_model_configs()
+        self._by_name: Dict[str, ModelConfig] = {
+            config.name: config for configs in self.model_configs.values() for config in configs
+        }
         
         # 初始化设备档案
         self._detect_device()
         
         # 检查依赖
-        missing_required, missing_optional = dependency_manager.check_dependencies()
+        missing_required, missing_optional = model_dependencies.dependency_manager.check_dependencies()
         if missing_required:
             print(f"[LocalModel] WARNING: 缺少必需依赖: {', '.join(missing_required)}")
             print("[LocalModel] 运行 'python -c \"from core.ai.model_dependencies import dependency_manager; dependency_manager.install_missing_required()\"' 来安装")
         
-        # 启动空闲检测
-        self._start_idle_monitor()
-        
         # 初始化基准测试器
         self.benchmark = ModelBenchmark(self)
         
         # 检查设备兼容性
-        compat_report = device_compatibility_checker.get_compatibility_report()
+        compat_report = get_device_compatibility_checker().get_compatibility_report()
         if not compat_report["can_run_local_models"]:
             print("[LocalModel] WARNING: 设备可能不完全兼容本地模型运行")
             for issue in compat_report.get("critical_issues", []):
                 print(f"   • {issue['message']}")
     
     def _init_model_configs(self) -> Dict[ModelSize, List[ModelConfig]]:
-        """初始化模型配置"""
+        """初始化模型配置（优先K-quant量化，同精度下质量优于旧版Q4_0）"""
         return {
             ModelSize.TINY: [
                 ModelConfig(
                     name="qwen-1.5b-chat-q4",
                     size=ModelSize.TINY,
-                    path="qwen-1.5b-chat-q4_0.gguf",
-                    quantization="Q4",
-                    min_ram_gb=1.5,
+                    path="qwen-1.5b-chat-q4_k_m.gguf",
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(1.8, 4.5),
                     vram_gb=0,
                     tokens_per_second=25,
-                    quality_score=60
+                    quality_score=60,
+                    quant_bits=4.5,
+                    params_b=1.8,
+                    n_layers=24
                 ),
                 ModelConfig(
                     name="phi-2-q4",
                     size=ModelSize.TINY,
-                    path="phi-2-q4.gguf",
-                    quantization="Q4",
-                    min_ram_gb=1.2,
+                    path="phi-2-q4_k_m.gguf",
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(2.7, 4.5),
                     vram_gb=0,
                     tokens_per_second=30,
-                    quality_score=55
+                    quality_score=55,
+                    quant_bits=4.5,
+                    params_b=2.7,
+                    n_layers=32
                 )
             ],
             ModelSize.SMALL: [
                 ModelConfig(
                     name="qwen-3b-chat-q4",
                     size=ModelSize.SMALL,
-                    path="qwen-3b-chat-q4_0.gguf",
-                    quantization="Q4",
-                    min_ram_gb=3.0,
+                    path="qwen-3b-chat-q4_k_m.gguf",  # Qwen1.5-4B，沿用旧模型名与文件名
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(4.0, 4.5),
                     vram_gb=0,
                     tokens_per_second=18,
-                    quality_score=75
+                    quality_score=75,
+                    quant_bits=4.5,
+                    params_b=4.0,
+                    n_layers=40
                 ),
                 ModelConfig(
                     name="phi-3-mini-q4",
                     size=ModelSize.SMALL,
-                    path="phi-3-mini-q4.gguf",
-                    quantization="Q4",
-                    min_ram_gb=2.5,
+                    path="phi-3-mini-q4_k_m.gguf",
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(3.8, 4.5),
                     vram_gb=0,
                     tokens_per_second=22,
-                    quality_score=70
+                    quality_score=70,
+                    quant_bits=4.5,
+                    params_b=3.8,
+                    n_layers=32
                 )
             ],
             ModelSize.MEDIUM: [
                 ModelConfig(
                     name="qwen-7b-chat-q4",
                     size=ModelSize.MEDIUM,
-                    path="qwen-7b-chat-q4_0.gguf",
-                    quantization="Q4",
-                    min_ram_gb=6.0,
+                    path="qwen-7b-chat-q4_k_m.gguf",
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(7.7, 4.5),
                     vram_gb=0,
                     tokens_per_second=12,
-                    quality_score=85
+                    quality_score=85,
+                    quant_bits=4.5,
+                    params_b=7.7,
+                    n_layers=32
+                ),
+                ModelConfig(
+                    name="qwen-7b-chat-q5",
+                    size=ModelSize.MEDIUM,
+                    path="qwen-7b-chat-q5_k_m.gguf",
+                    quantization="Q5_K_M",
+                    min_ram_gb=_estimate_ram_gb(7.7, 5.5),
+                    vram_gb=0,
+                    tokens_per_second=10,
+                    quality_score=87,
+                    quant_bits=5.5,
+                    params_b=7.7,
+                    n_layers=32
                 ),
                 ModelConfig(
                     name="mistral-7b-q4",
                     size=ModelSize.MEDIUM,
-                    path="mistral-7b-v0.1-q4.gguf",
-                    quantization="Q4",
-                    min_ram_gb=5.5,
+                    path="mistral-7b-v0.1-q4_k_m.gguf",
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(7.2, 4.5),
                     vram_gb=0,
                     tokens_per_second=14,
-                    quality_score=82
+                    quality_score=82,
+                    quant_bits=4.5,
+                    params_b=7.2,
+                    n_layers=32
                 )
             ],
             ModelSize.LARGE: [
                 ModelConfig(
                     name="qwen-13b-chat-q4",
                     size=ModelSize.LARGE,
-                    path="qwen-13b-chat-q4_0.gguf",
-                    quantization="Q4",
-                    min_ram_gb=10.0,
+                    path="qwen-13b-chat-q4_k_m.gguf",  # Qwen1.5-14B，沿用旧模型名与文件名
+                    quantization="Q4_K_M",
+                    min_ram_gb=_estimate_ram_gb(14.0, 4.5),
                     vram_gb=0,
                     tokens_per_second=8,
-                    quality_score=90
+                    quality_score=90,
+                    quant_bits=4.5,
+                    params_b=14.0,
+                    n_layers=40
+                ),
+                ModelConfig(
+                    name="qwen-13b-chat-q6",
+                    size=ModelSize.LARGE,
+                    path="qwen-13b-chat-q6_k.gguf",
+                    quantization="Q6_K",
+                    min_ram_gb=_estimate_ram_gb(14.0, 6.5),
+                    vram_gb=0,
+                    tokens_per_second=6,
+                    quality_score=92,
+                    quant_bits=6.5,
+                    params_b=14.0,
+                    n_layers=40
                 )
             ]
         }
@@ -192,25 +374,15 @@ class LocalModelManager:
     def _detect_device(self) -> DeviceProfile:
         """检测设备性能"""
         try:
-            import psutil
-            
-            total_ram = psutil.virtual_memory().total / (1024**3)
-            available_ram = psutil.virtual_memory().available / (1024**3)
+            # 设备检测时刷新内存缓存，随后的加载检查直接复用
+            memory = _get_mem(refresh=True)
+            total_ram = memory["total_gb"]
+            available_ram = memory["avail_gb"]
             cpu_cores = psutil.cpu_count(logical=False) or 1
             
-            # 检测GPU
-            has_gpu = False
-            vram_gb = 0
-            try:
-                import subprocess
-                result = subprocess.run(['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader'], 
-                                      capture_output=True, text=True)
-                if result.returncode == 0:
-                    has_gpu = True
-                    vram_str = result.stdout.strip().split()[0]
-                    vram_gb = float(vram_str) / 1024
-            except:
-                pass
+            # 检测GPU：复用兼容性检查器的探测结果（NVML优先，跨运行缓存），不再单独调用 nvidia-smi
+            gpu_info = get_device_compatibility_checker().system_info.get("gpu_info", [])
+            has_gpu, vram_gb, has_mps, gpu_vram_gb = _gpu_summary(gpu_info)
             
             # 确定设备档次
             if total_ram < 4:
@@ -233,6 +405,9 @@ class LocalModelManager:
                 cpu_cores=cpu_cores,
                 has_gpu=has_gpu,
                 vram_gb=vram_gb,
+                has_mps=has_mps,
+                gpu_count=len(gpu_vram_gb),
+                gpu_vram_gb=gpu_vram_gb,
                 recommended_model=recommended
             )
             
@@ -251,20 +426,40 @@ class LocalModelManager:
         
         return self.device_profile
     
-    def _start_idle_monitor(self):
-        """启动空闲监控"""
-        def monitor():
-            while True:
-                time.sleep(60)  # 每分钟检查一次
-                with self.lock:
-                    if self.model_status == ModelStatus.READY and self.last_used:
-                        idle_seconds = (datetime.now() - self.last_used).total_seconds()
-                        if idle_seconds > self.idle_timeout_seconds:
-                            print("[LocalModel] 模型空闲超时，自动卸载")
-                            self._unload_model_internal()
-        
-        thread = threading.Thread(target=monitor, daemon=True)
-        thread.start()
+    def _reschedule_idle_timer(self, delay: Optional[float] = None):
+        """重新安排空闲卸载定时器，在最后一次使用后 idle_timeout_seconds 触发（需要在lock内调用）"""
+        if self._idle_timer:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(
+            self.idle_timeout_seconds if delay is None else delay, self._idle_fire
+        )
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+    
+    def _idle_fire(self):
+        """空闲定时器回调：确认已超时后自动卸载（生成进行中时顺延，不阻塞定时器线程）"""
+        if not self._generate_lock.acquire(blocking=False):
+            with self.lock:
+                if self.model_status == ModelStatus.READY:
+                    self._reschedule_idle_timer()
+            return
+        try:
+            self._idle_unload()
+        finally:
+            self._generate_lock.release()
+    
+    def _idle_unload(self):
+        """确认已超时后卸载（需要在 _generate_lock 内调用）"""
+        with self.lock:
+            if self.model_status != ModelStatus.READY or self.last_used is None:
+                return
+            idle_seconds = time.monotonic() - self.last_used
+            if idle_seconds < self.idle_timeout_seconds:
+                # 期间有新的使用，按剩余时间重新安排
+                self._reschedule_idle_timer(self.idle_timeout_seconds - idle_seconds)
+                return
+            print("[LocalModel] 模型空闲超时，自动卸载")
+            self._unload_model_internal()
     
     def get_recommended_model(self) -> ModelConfig:
         """获取推荐模型配置"""
@@ -282,36 +477,62 @@ class LocalModelManager:
                     if configs:
                         break
         
-        return configs[0] if configs else None
+        if not configs:
+            return None
+        
+        # 高端设备优先更高精度的K-quant量化
+        preferred = _TIER_QUANTIZATION.get(self.device_profile.tier, "Q4_K_M")
+        for config in configs:
+            if config.quantization == preferred:
+                return config
+        return configs[0]
     
     def load_model(self, model_size: Optional[ModelSize] = None, 
                    model_name: Optional[str] = None) -> bool:
-        """加载模型"""
-        with self.lock:
-            if self.model_status == ModelStatus.READY:
-                return True
-            
+        """加载模型（已加载同一GGUF文件时直接复用，请求其他模型时先卸载当前模型）
+        
+        切换模型前需等待当前生成结束，锁顺序与 _generate 一致：先 _generate_lock 后 lock
+        """
+        with self._generate_lock, self.lock:
             if self.model_status == ModelStatus.LOADING:
                 print("[LocalModel] 模型正在加载中...")
                 return False
             
+            if self.model_status == ModelStatus.READY:
+                current = self.current_config
+                if current is None or not (model_name or model_size):
+                    return True
+                if model_size and not model_name and current.size == model_size:
+                    return True
+                requested = self._select_config(model_size, model_name)
+                if requested is None or requested.path == current.path:
+                    if requested is not None:
+                        self.current_config = requested
+                    return True
+                # 切换到其他模型文件：当前模型移入热缓存
+                self._unload_model_internal()
+            
             self.model_status = ModelStatus.LOADING
         
         try:
             # 选择模型配置
-            if model_name:
-                config = self._find_model_by_name(model_name)
-            elif model_size:
-                configs = self.model_configs.get(model_size, [])
-                config = configs[0] if configs else None
-            else:
-                config = self.get_recommended_model()
+            config = self._select_config(model_size, model_name)
             
             if not config:
                 print("[LocalModel] 未找到合适的模型配置")
                 self.model_status = ModelStatus.ERROR
                 return False
             
+            # 优先从热缓存恢复，无需重新读取GGUF文件
+            with self.lock:
+                warm_model, _ = self._warm_cache.pop(config.path, (None, None))
+            if warm_model is not None:
+                print(f"[LocalModel] 从热缓存恢复模型: {config.name}")
+                self.current_model = warm_model
+                self.n_gpu_layers = self._get_n_gpu_layers(config)
+                self._on_model_ready(config)
+                return True
+            
             # 检查内存是否足够
             if not self._check_memory(config):
                 print(f"[LocalModel] 内存不足，无法加载模型 {config.name}")
@@ -334,27 +555,28 @@ class LocalModelManager:
             try:
                 from llama_cpp import Llama
                 
+                self.n_gpu_layers = self._get_n_gpu_layers(config)
+                if self.n_gpu_layers:
+                    print(f"[LocalModel] GPU卸载层数: {'全部' if self.n_gpu_layers < 0 else self.n_gpu_layers}")
+                
                 self.current_model = Llama(
                     model_path=model_path,
                     n_ctx=2048,  # 上下文长度
-                    n_threads=self.device_profile.cpu_cores if self.device_profile else 4,
+                    n_threads=self.n_threads or (self.device_profile.cpu_cores if self.device_profile else 4),
+                    n_batch=self._get_n_batch(),  # 提示词一次批量预填充
+                    n_gpu_layers=self.n_gpu_layers,
+                    main_gpu=0,
+                    tensor_split=None,
+                    use_mmap=True,  # 内存映射模型文件
+                    use_mlock=False,  # 不锁定内存，内存紧张时允许系统回收
+                    logits_all=False,
                     verbose=False
                 )
                 
                 load_time = time.time() - start_time
                 print(f"[LocalModel] 模型加载完成，耗时: {load_time:.1f}秒")
                 
-                self.current_config = config
-                self.model_status = ModelStatus.READY
-                self.last_used = datetime.now()
-                
-                # 触发回调
-                for callback in self.load_callbacks:
-                    try:
-                        callback(config)
-                    except:
-                        pass
-                
+                self._on_model_ready(config)
                 return True
                 
             except ImportError:
@@ -368,19 +590,70 @@ class LocalModelManager:
             self.model_status = ModelStatus.ERROR
             return False
     
+    def _on_model_ready(self, config: ModelConfig):
+        """模型就绪后更新状态并触发回调"""
+        with self.lock:
+            self.current_config = config
+            self.model_status = ModelStatus.READY
+            self.last_used = time.monotonic()
+            self._prefix_state = None
+            self._reschedule_idle_timer()
+        
+        # 触发回调
+        for callback in self.load_callbacks:
+            try:
+                callback(config)
+            except:
+                pass
+    
+    def _get_n_batch(self) -> int:
+        """预填充批大小（核心越多，单批处理的提示词token越多）"""
+        if self.n_batch:
+            return self.n_batch
+        cpu_cores = self.device_profile.cpu_cores if self.device_profile else 4
+        if cpu_cores >= 8:
+            return 512
+        if cpu_cores >= 4:
+            return 256
+        return 128
+    
+    def _get_n_gpu_layers(self, config: ModelConfig) -> int:
+        """确定卸载到GPU的层数（CUDA/Vulkan按显存估算，Apple Silicon的Metal共享内存全部卸载）"""
+        try:
+            import llama_cpp
+            supports_gpu = getattr(llama_cpp, "llama_supports_gpu_offload", None)
+            if supports_gpu and not supports_gpu():
+                return 0  # CPU版本的 llama-cpp-python
+        except ImportError:
+            return 0
+        
+        if self.device_profile and self.device_profile.has_mps:
+            return -1
+        
+        if self.device_profile and self.device_profile.has_gpu:
+            return estimate_offload_layers(config, self.device_profile.vram_gb)
+        return 0
+    
+    def _select_config(self, model_size: Optional[ModelSize] = None,
+                       model_name: Optional[str] = None) -> Optional[ModelConfig]:
+        """按名称、尺寸或设备推荐选择模型配置"""
+        if model_name:
+            return self._find_model_by_name(model_name)
+        if model_size:
+            configs = self.model_configs.get(model_size, [])
+            return configs[0] if configs else None
+        return self.get_recommended_model()
+    
     def _find_model_by_name(self, name: str) -> Optional[ModelConfig]:
         """按名称查找模型配置"""
-        for configs in self.model_configs.values():
-            for config in configs:
-                if config.name == name:
-                    return config
-        return None
+        return self._by_name.get(name)
     
     def _check_memory(self, config: ModelConfig) -> bool:
         """检查内存是否足够"""
+        if psutil is None:
+            return True  # 无法检测时假设足够
         try:
-            import psutil
-            available_ram = psutil.virtual_memory().available / (1024**3)
+            available_ram = _get_mem()["avail_gb"]
             
             # 预留一些内存给系统
             required = config.min_ram_gb * 1.2
@@ -390,16 +663,19 @@ class LocalModelManager:
             return True  # 无法检测时假设足够
     
     def unload_model(self) -> bool:
-        """卸载模型"""
-        with self.lock:
+        """卸载模型（等待进行中的生成结束，避免重置正在解码的 Llama 实例）"""
+        with self._generate_lock, self.lock:
             return self._unload_model_internal()
     
     def _unload_model_internal(self) -> bool:
-        """内部卸载方法（需要在lock内调用）"""
+        """内部卸载方法（需要在 _generate_lock 和 lock 内调用）"""
         if self.model_status != ModelStatus.READY:
             return True
         
         self.model_status = ModelStatus.UNLOADING
+        if self._idle_timer:
+            self._idle_timer.cancel()
+            self._idle_timer = None
         
         try:
             # 触发回调
@@ -409,17 +685,21 @@ class LocalModelManager:
                 except:
                     pass
             
-            # 释放模型
+            # 清空KV缓存后移入热缓存，保留mmap映射以便快速恢复
             if self.current_model:
-                del self.current_model
+                reset = getattr(self.current_model, "reset", None)
+                if reset:
+                    reset()
+                if self.current_config:
+                    self._warm_cache[self.current_config.path] = (self.current_model, self.current_config)
+                    self._warm_cache.move_to_end(self.current_config.path)
                 self.current_model = None
             
             self.current_config = None
+            self.n_gpu_layers = 0
+            self._prefix_state = None
             self.model_status = ModelStatus.NOT_LOADED
-            
-            # 强制垃圾回收
-            import gc
-            gc.collect()
+            self._evict_warm_cache()
             
             print("[LocalModel] 模型已卸载")
             return True
@@ -429,9 +709,41 @@ class LocalModelManager:
             self.model_status = ModelStatus.ERROR
             return False
     
+    def _evict_warm_cache(self, max_models: Optional[int] = None):
+        """按数量和可用内存淘汰最久未用的热缓存模型（需要在lock内调用）"""
+        if max_models is None:
+            max_models = self.max_warm_models
+        available_gb = self.device_profile.available_ram_gb if self.device_profile else 0
+        evicted = False
+        while self._warm_cache:
+            warm_gb = sum(config.min_ram_gb for _, config in self._warm_cache.values())
+            if len(self._warm_cache) <= max_models and warm_gb <= available_gb:
+                break
+            self._warm_cache.popitem(last=False)
+            evicted = True
+        
+        if evicted:
+            # 强制垃圾回收，真正释放被淘汰的模型
+            import gc
+            gc.collect()
+    
+    def clear_warm_cache(self):
+        """清空热缓存，释放所有已卸载模型"""
+        with self.lock:
+            self._evict_warm_cache(max_models=0)
+    
     def generate(self, prompt: str, max_tokens: int = 512, 
-                 temperature: float = 0.7) -> Dict[str, Any]:
-        """生成文本"""
+                 temperature: float = 0.7, grammar: Optional[Any] = None) -> Dict[str, Any]:
+        """生成文本（可选 LlamaGrammar 约束输出格式）
+        
+        Llama 实例不可重入，同一模型上的生成在 _generate_lock 内依次执行
+        """
+        with self._generate_lock:
+            return self._generate(prompt, max_tokens, temperature, grammar)
+    
+    def _generate(self, prompt: str, max_tokens: int, temperature: float,
+                  grammar: Optional[Any]) -> Dict[str, Any]:
+        """生成文本（需要在 _generate_lock 内调用）"""
         if self.model_status != ModelStatus.READY:
             # 尝试自动加载
             if not self.load_model():
@@ -442,23 +754,49 @@ class LocalModelManager:
                 }
         
         try:
-            self.last_used = datetime.now()
+            with self.lock:
+                self.last_used = time.monotonic()
+                # 期间模型可能已被卸载，不再为其安排定时器
+                if self.model_status == ModelStatus.READY:
+                    self._reschedule_idle_timer()
             
-            output = self.current_model(
+            # 流式生成：提示词批量预填充，逐token解码复用KV缓存
+            # 同时记录首token时间(TTFT)和相邻token间隔(TPOT)，使用 perf_counter_ns 避免 time.time 的粒度误差
+            chunks = []
+            tokens_used = 0
+            start_ns = time.perf_counter_ns()
+            first_token_ns = last_token_ns = 0
+            token_gaps_ns = []
+            for chunk in self.current_model.create_completion(
                 prompt,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=0.9,
-                echo=False
-            )
+                echo=False,
+                stream=True,
+                grammar=grammar
+            ):
+                choices = chunk.get('choices')
+                if choices:
+                    now_ns = time.perf_counter_ns()
+                    if tokens_used == 0:
+                        first_token_ns = now_ns
+                    else:
+                        token_gaps_ns.append(now_ns - last_token_ns)
+                    last_token_ns = now_ns
+                    chunks.append(choices[0].get('text', ''))
+                    tokens_used += 1
             
-            text = output['choices'][0]['text'] if output.get('choices') else ""
+            text = ''.join(chunks)
             
             return {
                 "success": True,
                 "text": text,
                 "model": self.current_config.name if self.current_config else "unknown",
-                "tokens_used": len(text.split())
+                "tokens_used": tokens_used,
+                "ttft": (first_token_ns - start_ns) / 1e9 if tokens_used else 0.0,
+                "tpot": sum(token_gaps_ns) / len(token_gaps_ns) / 1e9 if token_gaps_ns else 0.0,
+                "itl": [gap / 1e9 for gap in token_gaps_ns]  # 逐token间隔，用于统计延迟分位数
             }
             
         except Exception as e:
@@ -468,50 +806,93 @@ class LocalModelManager:
                 "text": ""
             }
     
+    def _get_events_grammar(self, num_events: int) -> Optional[Any]:
+        """加载最多生成 num_events 个事件的GBNF语法（首次使用时解析并缓存）"""
+        grammar = self._events_grammars.get(num_events)
+        if grammar is None:
+            try:
+                from llama_cpp import LlamaGrammar
+                grammar = LlamaGrammar.from_string(_events_root_rule(num_events) + _events_grammar_rules())
+            except ImportError:
+                return None
+            except Exception as e:
+                print(f"[LocalModel] 事件语法加载失败: {e}")
+                return None
+            self._events_grammars[num_events] = grammar
+        return grammar
+    
+    def generate_batch(self, prompts: List[str], max_tokens: int = 512, 
+                       temperature: float = 0.7) -> List[Dict[str, Any]]:
+        """批量生成，返回与 prompts 一一对应的结果（附带每个请求的耗时 elapsed）
+        
+        llama-cpp-python 的 Llama 实例不可重入，同一模型上的请求在锁内依次执行
+        """
+        results = []
+        with self._generate_lock:
+            for prompt in prompts:
+                start = time.perf_counter()
+                result = self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+                result["elapsed"] = time.perf_counter() - start
+                results.append(result)
+        return results
+    
+    def _restore_prefix_state(self):
+        """恢复事件提示词前缀的KV状态，首次调用时预填充前缀并保存（需要在 _generate_lock 内调用）"""
+        try:
+            if self._prefix_state is None:
+                tokens = self.current_model.tokenize(_EVENT_PROMPT_PREFIX.encode("utf-8"))
+                self.current_model.reset()
+                self.current_model.eval(tokens)
+                self._prefix_state = self.current_model.save_state()
+            else:
+                # 补全时与已加载状态的公共前缀token不会重复计算
+                self.current_model.load_state(self._prefix_state)
+        except Exception as e:
+            print(f"[LocalModel] 前缀KV缓存不可用: {e}")
+            self._prefix_state = None
+    
     def generate_events(self, state: Any, num_events: int = 3) -> Dict[str, Any]:
         """生成事件（专门用于人生模拟）"""
         age = getattr(state, 'age', 25)
         life_stage = getattr(state, 'life_stage', '青年')
-        dimensions = getattr(state, 'dimensions', {})
+        dimensions = getattr(state, 'dimensions', None) or {}
         
-        prompt = f"""请为以下角色生成{num_events}个人生事件，以JSON格式返回：
-角色信息：
-- 年龄：{age}岁
-- 人生阶段：{life_stage}
-- 当前状态：{json.dumps(dimensions, ensure_ascii=False)}
-
-请返回事件数组，每个事件包含：
-- title: 事件标题
-- description: 事件描述
-- eventType: 事件类型
-- choices: 选项数组
-- impacts: 影响对象
-
-返回格式：[{{事件1}}, {{事件2}}, {{事件3}}]
-"""
+        prompt = _EVENT_PROMPT_PREFIX + _EVENT_PROMPT_SUFFIX.format(
+            num_events=num_events,
+            age=age,
+            life_stage=life_stage,
+            dimensions=_dumps(dimensions)
+        )
         
-        result = self.generate(prompt, max_tokens=1000)
+        # 语法约束解码：输出只能是最多 num_events 个事件对象组成的JSON数组
+        grammar = self._get_events_grammar(num_events)
+        
+        # 恢复前缀KV状态与生成须连续执行，期间不允许其他生成插入
+        with self._generate_lock:
+            # 复用固定前缀的KV状态，只需预填充角色信息部分
+            if self.model_status == ModelStatus.READY or self.load_model():
+                self._restore_prefix_state()
+            result = self.generate(prompt, max_tokens=1000, grammar=grammar)
         
         if result["success"]:
+            text = result["text"]
+            if grammar is None and '[' in text and ']' in text:
+                # 无语法约束时模型可能在数组前后附带说明文字，只取 [...] 部分
+                text = text[text.index('['):text.rindex(']') + 1]
             try:
-                # 尝试解析JSON
-                text = result["text"]
-                # 提取JSON部分
-                if '[' in text and ']' in text:
-                    start = text.index('[')
-                    end = text.rindex(']') + 1
-                    json_str = text[start:end]
-                    events = json.loads(json_str)
-                    return {
-                        "events": events,
-                        "reasoning": "本地模型生成",
-                        "confidence": self.current_config.quality_score / 100 if self.current_config else 0.6,
-                        "level": "L1_LOCAL_MODEL",
-                        "provider": "local",
-                        "cost": 0
-                    }
-            except:
-                pass
+                events = _loads(text)
+                return {
+                    "events": events,
+                    "reasoning": "本地模型生成",
+                    "confidence": self.current_config.quality_score / 100 if self.current_config else 0.6,
+                    "level": "L1_LOCAL_MODEL",
+                    "provider": "local",
+                    "cost": 0
+                }
+            except ValueError as e:
+                # 达到 max_tokens 被截断时JSON不完整
+                print(f"[LocalModel] 事件JSON解析失败: {e}")
+                result["error"] = f"解析失败: {e}"
         
         return {
             "events": [],
@@ -537,12 +918,17 @@ class LocalModelManager:
             "device_tier": self.device_profile.tier.value if self.device_profile else None,
             "available_ram_gb": self.device_profile.available_ram_gb if self.device_profile else 0,
             "recommended_model": self.device_profile.recommended_model.value if self.device_profile else None,
-            "last_used": self.last_used.isoformat() if self.last_used else None
+            "n_gpu_layers": self.n_gpu_layers,
+            "last_used": (
+                datetime.fromtimestamp(time.time() - (time.monotonic() - self.last_used)).isoformat()
+                if self.last_used is not None else None
+            )
         }
     
     def get_available_models(self) -> List[Dict[str, Any]]:
         """获取可用模型列表"""
         models = []
+        recommended_size = self.device_profile.recommended_model if self.device_profile else ModelSize.TINY
         for size, configs in self.model_configs.items():
             for config in configs:
                 model_path = os.path.join(self.models_dir, config.path)
@@ -558,7 +944,7 @@ class LocalModelManager:
                     "quality_score": config.quality_score,
                     "available": file_available,
                     "downloadable": download_info is not None,
-                    "recommended": size == (self.device_profile.recommended_model if self.device_profile else ModelSize.TINY),
+                    "recommended": size == recommended_size,
                     "description": download_info.get("description", "") if download_info else ""
                 })
         return models
@@ -622,15 +1008,7 @@ class LocalModelManager:
                        iterations: int = 3) -> Optional[BenchmarkResult]:
         """基准测试指定模型"""
         # 找到模型配置
-        target_config = None
-        if model_name:
-            for configs in self.model_configs.values():
-                for config in configs:
-                    if config.name == model_name:
-                        target_config = config
-                        break
-                if target_config:
-                    break
+        target_config = self._by_name.get(model_name) if model_name else None
         
         if not target_config:
             target_config = self.get_recommended_model()
@@ -653,26 +1031,42 @@ class LocalModelManager:
         """测试所有可用模型"""
         return self.benchmark.benchmark_all_models(iterations=iterations)
     
+    def benchmark_all_models_parallel(self, iterations: int = 2, 
+                                      workers: Optional[int] = None) -> List[BenchmarkResult]:
+        """在多个进程中并行测试所有可用模型"""
+        return self.benchmark.benchmark_all_models_parallel(iterations=iterations, workers=workers)
+    
     def is_model_downloaded(self, model_name: str) -> bool:
         """检查模型是否已下载"""
         return model_download_manager.is_model_downloaded(model_name)
     
     def get_compatibility_report(self) -> Dict[str, Any]:
         """获取设备兼容性报告"""
-        return device_compatibility_checker.get_compatibility_report()
+        return get_device_compatibility_checker().get_compatibility_report()
     
     def get_system_info(self) -> Dict[str, Any]:
         """获取系统信息"""
-        return device_compatibility_checker.system_info
+        return get_device_compatibility_checker().system_info
     
     def get_dependency_status(self) -> Dict[str, Any]:
         """获取依赖状态"""
-        missing_required, missing_optional = dependency_manager.check_dependencies()
+        missing_required, missing_optional = model_dependencies.dependency_manager.check_dependencies()
         return {
             "missing_required": missing_required,
             "missing_optional": missing_optional,
-            "installation_guide": dependency_manager.get_installation_guide()
+            "installation_guide": model_dependencies.dependency_manager.get_installation_guide()
         }
 
-# 全局本地模型管理器实例
-local_model_manager = LocalModelManager()
+# 全局本地模型管理器实例：首次访问 local_model_manager 时才创建（PEP 562），导入本模块不触发设备检测
+_local_model_manager: Optional[LocalModelManager] = None
+_local_model_manager_lock = threading.Lock()
+
+def __getattr__(name: str):
+    global _local_model_manager
+    if name == "local_model_manager":
+        if _local_model_manager is None:
+            with _local_model_manager_lock:
+                if _local_model_manager is None:
+                    _local_model_manager = LocalModelManager()
+        return _local_model_manager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
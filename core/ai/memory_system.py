@@ -3,10 +3,46 @@
 """
 
 import math
+import time
 from datetime import datetime, timedelta
+from types import MappingProxyType
 from typing import Dict, List, Any
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 各记忆类型的基础稳定性（天）
+STABILITY_DAYS = MappingProxyType({
+    "short_term": 7.0,    # 短期记忆：7天
+    "long_term": 30.0,    # 长期记忆：30天
+    "epic": 365.0         # 重要记忆：1年
+})
+DEFAULT_STABILITY_DAYS = 14.0
+
+# 批量计算用的类型编码与稳定性查找表，未知类型使用最后一项
+MEMORY_TYPE_CODES = {memory_type: code for code, memory_type in enumerate(STABILITY_DAYS)}
+BASE_STABILITY_DAYS = tuple(STABILITY_DAYS.values()) + (DEFAULT_STABILITY_DAYS,)
+
+def _to_timestamp(value) -> float:
+    """ISO字符串、datetime或时间戳统一转为Unix秒，None表示当前时间"""
+    if value is None:
+        return time.time()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
 class Memory:
+    __slots__ = ("id", "profile_id", "event_id", "summary", "emotional_weight",
+                 "recall_count", "last_recalled", "retention", "memory_type",
+                 "importance", "created_at")
+    
+    _STABILITY = STABILITY_DAYS
+    
     def __init__(self, id, profile_id, event_id, summary, emotional_weight, 
                  recall_count=0, last_recalled=None, retention=1.0, 
                  memory_type="short_term", importance=0.5, created_at=None):
@@ -16,63 +52,40 @@ class Memory:
         self.summary = summary
         self.emotional_weight = emotional_weight
         self.recall_count = recall_count
-        self.last_recalled = last_recalled or datetime.now().isoformat()
+        self.last_recalled = _to_timestamp(last_recalled)  # Unix秒，导出时转为ISO字符串
         self.retention = retention
         self.memory_type = memory_type  # short_term, long_term, epic
         self.importance = importance  # 0-1
-        self.created_at = created_at or datetime.now().isoformat()
+        self.created_at = _to_timestamp(created_at)  # Unix秒，导出时转为ISO字符串
     
     def calculate_retention(self, current_time=None) -> float:
         """
         艾宾浩斯遗忘曲线计算
         R = e^(-t/S) 其中S为稳定性系数
         """
-        if current_time is None:
-            current_time = datetime.now()
+        now_ts = time.time() if current_time is None else _to_timestamp(current_time)
         
-        # 解析记忆创建时间
-        created = datetime.fromisoformat(self.created_at)
-        
-        # 计算经过的天数
-        days_elapsed = (current_time - created).days
-        
-        # 稳定性系数（基于记忆类型和重要性）
-        stability = self._get_stability()
-        
-        # 艾宾浩斯公式: R = e^(-t/S)
+        # 计算经过的整天数
+        days_elapsed = math.floor((now_ts - self.created_at) / 86400.0)
         if days_elapsed == 0:
             return 1.0
         
-        retention = math.exp(-days_elapsed / stability)
+        # 情感权重与重要性加成（两者均≥1，e^(-t/S)≤1，只需一次上限截断）
+        boost = (1.0 + self.emotional_weight * 0.2) * (1.0 + self.importance * 0.3)
         
-        # 考虑情感权重（情感强烈的记忆更不容易遗忘）
-        emotional_boost = 1 + (self.emotional_weight * 0.2)
-        retention = min(1.0, retention * emotional_boost)
-        
-        # 考虑重要性
-        importance_boost = 1 + (self.importance * 0.3)
-        retention = min(1.0, retention * importance_boost)
-        
-        return max(0.0, retention)
+        # 艾宾浩斯公式: R = e^(-t/S)
+        return min(1.0, math.exp(-days_elapsed / self._get_stability()) * boost)
     
     def _get_stability(self) -> float:
-        """获取记忆稳定性系数"""
-        base_stability = {
-            "short_term": 7,    # 短期记忆：7天
-            "long_term": 30,    # 长期记忆：30天
-            "epic": 365         # 重要记忆：1年
-        }.get(self.memory_type, 14)
-        
-        # 根据重要性调整
-        importance_factor = 1 + self.importance
-        return base_stability * importance_factor
+        """获取记忆稳定性系数（根据重要性调整）"""
+        return self._STABILITY.get(self.memory_type, DEFAULT_STABILITY_DAYS) * (1.0 + self.importance)
     
     def recall(self) -> Dict[str, Any]:
         """
         回忆记忆（增强记忆）
         """
         self.recall_count += 1
-        self.last_recalled = datetime.now().isoformat()
+        self.last_recalled = time.time()
         
         # 每次回忆都会增强记忆（间隔效应）
         # 最佳复习间隔：1天后、3天后、7天后、14天后、30天后
@@ -98,14 +111,49 @@ class Memory:
             "summary": self.summary,
             "emotional_weight": self.emotional_weight,
             "recall_count": self.recall_count,
-            "last_recalled": self.last_recalled,
+            "last_recalled": datetime.fromtimestamp(self.last_recalled).isoformat(),
             "retention": self.retention,
             "memory_type": self.memory_type,
             "importance": self.importance,
-            "created_at": self.created_at
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat()
         }
 
 
+# [0,1] 区间的分数以 uint8 存储（步长1/255），遗忘阈值0.2远大于量化误差
+_SCORE_SCALE = 255.0
+
+def _quantize_scores(values, count: int):
+    """将 [0,1] 分数量化为 uint8"""
+    scores = np.fromiter(values, dtype=np.float32, count=count)
+    np.clip(scores, 0.0, 1.0, out=scores)
+    return np.rint(scores * _SCORE_SCALE).astype(np.uint8)
+
+
+class MemoryStore:
+    """记忆的列式存储（SoA），供批量留存率计算使用
+    
+    分数字段为 uint8 量化值，创建时间为 int64 秒级时间戳，使遗忘扫描读取的字节数最少
+    """
+    
+    def __init__(self, memories: List[Memory]):
+        count = len(memories)
+        self.ids = [memory.id for memory in memories]
+        self.created_ts = np.fromiter(
+            (int(memory.created_at) for memory in memories),
+            dtype=np.int64, count=count
+        )
+        self.emotional = _quantize_scores((memory.emotional_weight for memory in memories), count)
+        self.importance = _quantize_scores((memory.importance for memory in memories), count)
+        self.mem_type_code = np.fromiter(
+            (MEMORY_TYPE_CODES.get(memory.memory_type, len(MEMORY_TYPE_CODES)) for memory in memories),
+            dtype=np.uint8, count=count
+        )
+        self.retention = _quantize_scores((memory.retention for memory in memories), count)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
 class MemorySystem:
     """记忆管理系统"""
     
@@ -148,6 +196,22 @@ class MemorySystem:
         importance = (type_weight + emotional_weight) / 2
         return min(1.0, max(0.0, importance))
     
+    @staticmethod
+    def bulk_retention(created_ts, emotional, importance, mem_type_code, now_ts: float):
+        """
+        批量计算留存率（与 Memory.calculate_retention 结果一致，误差在量化步长内）
+        各参数为 MemoryStore 中的等长数组，created_ts/now_ts 为秒级时间戳
+        """
+        days = np.floor((now_ts - created_ts) / 86400.0).astype(np.float32)
+        emotional = emotional.astype(np.float32) * (1.0 / _SCORE_SCALE)
+        importance = importance.astype(np.float32) * (1.0 / _SCORE_SCALE)
+        stability = np.asarray(BASE_STABILITY_DAYS, dtype=np.float32)[mem_type_code] * (1.0 + importance)
+        retention = np.exp(-days / stability)
+        retention *= (1.0 + emotional * 0.2) * (1.0 + importance * 0.3)
+        np.clip(retention, 0.0, 1.0, out=retention)
+        retention[days == 0] = 1.0
+        return retention
+    
     @staticmethod
     def process_memory_forgetting(memories: List[Memory]) -> Dict[str, Any]:
         """处理记忆遗忘"""
@@ -158,16 +222,29 @@ class MemorySystem:
             "decayed": 0
         }
         
-        forgotten_memories = []
+        if not memories:
+            return stats
+        
+        if np is not None:
+            store = MemoryStore(memories)
+            new_retention = MemorySystem.bulk_retention(
+                store.created_ts, store.emotional, store.importance,
+                store.mem_type_code, datetime.now().timestamp()
+            )
+            forgotten = new_retention < 0.2  # 留存率低于20%则遗忘
+            # 与存储的留存率在同一量化精度下比较
+            strengthened = ~forgotten & (np.rint(new_retention * _SCORE_SCALE) > store.retention)
+            stats["forgotten"] = int(forgotten.sum())
+            stats["strengthened"] = int(strengthened.sum())
+            stats["decayed"] = len(store) - stats["forgotten"] - stats["strengthened"]
+            return stats
         
         for memory in memories:
-            old_retention = memory.retention
             new_retention = memory.calculate_retention()
             
-            if memory.should_forget():
+            if new_retention < 0.2:
                 stats["forgotten"] += 1
-                forgotten_memories.append(memory.id)
-            elif new_retention > old_retention:
+            elif new_retention > memory.retention:
                 # 被回忆过，增强了
                 stats["strengthened"] += 1
             else:
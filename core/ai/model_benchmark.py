@@ -2,13 +2,24 @@
 模型性能基准测试和预热模块
 """
 
+import os
 import time
-import statistics
 import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 
-@dataclass
+from ._compat import DATACLASS_SLOTS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@dataclass(**DATACLASS_SLOTS)
 class BenchmarkResult:
     """基准测试结果"""
     model_name: str
@@ -22,6 +33,113 @@ class BenchmarkResult:
     test_output_length: int
     success: bool
     error_msg: Optional[str] = None
+    throughput_tokens_per_second: float = 0  # 输出token总数 / 整批耗时
+    gpu_peak_memory_mb: float = 0  # 本进程显存占用峰值（需要 pynvml）
+    p50_tpot: float = 0  # 逐token间隔分位数（秒）
+    p95_tpot: float = 0
+    p99_tpot: float = 0
+
+# 预热和默认测试提示词
+_WARMUP_PROMPTS = ("你好", "1+1等于几", "今天天气怎么样")
+_DEFAULT_BENCH_PROMPTS = (
+    "请简单介绍一下人工智能的发展历程",
+    "写一首关于春天的短诗",
+    "解释一下量子计算的基本原理",
+)
+
+def _benchmark_in_process(models_dir: str, model_name: str, n_threads: int, 
+                          iterations: int) -> "BenchmarkResult":
+    """在独立进程中加载单个模型并测试（每个进程持有自己的Llama实例）"""
+    from .local_model_loader import LocalModelManager
+    
+    manager = LocalModelManager(models_dir=models_dir)
+    manager.n_threads = n_threads
+    return manager.benchmark.benchmark_model(manager._find_model_by_name(model_name), iterations=iterations)
+
+def _percentiles(values: List[float], quantiles) -> List[float]:
+    """最近秩法计算分位数"""
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return [ordered[min(last, int(q * len(ordered)))] for q in quantiles]
+
+class _PeakMemorySampler:
+    """后台线程定期采样本进程内存（USS）和显存占用，记录整个测试期间的峰值"""
+    
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_uss = 0
+        self.peak_gpu = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process = None
+        self._nvml = None
+        self._gpu_handles = []
+    
+    def __enter__(self):
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            pass
+        try:
+            import pynvml
+            pynvml.nvmlInit()
+            self._nvml = pynvml
+            # NVML 不受 CUDA_VISIBLE_DEVICES 影响，按全部GPU统计本进程的占用（进程可能被固定到任意一块GPU或跨卡加载）
+            self._gpu_handles = [
+                pynvml.nvmlDeviceGetHandleByIndex(index) for index in range(pynvml.nvmlDeviceGetCount())
+            ]
+        except Exception:
+            # 未安装pynvml或没有NVIDIA GPU
+            self._gpu_handles = []
+        
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        if self._nvml is not None:
+            try:
+                self._nvml.nvmlShutdown()
+            except Exception:
+                pass
+        return False
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+    
+    def _sample(self):
+        if self._process is not None:
+            try:
+                # USS 只统计本进程独占的页，不重复计算共享库和共享内存映射
+                uss = self._process.memory_full_info().uss
+            except Exception:
+                uss = self._process.memory_info().rss
+            self.peak_uss = max(self.peak_uss, uss)
+        if self._gpu_handles:
+            pid = os.getpid()
+            used = 0
+            for handle in self._gpu_handles:
+                try:
+                    used += sum(
+                        proc.usedGpuMemory or 0
+                        for proc in self._nvml.nvmlDeviceGetComputeRunningProcesses(handle)
+                        if proc.pid == pid
+                    )
+                except Exception:
+                    pass
+            self.peak_gpu = max(self.peak_gpu, used)
+
+def _pin_gpu(gpu_ids):
+    """进程池初始化：每个工作进程独占一块GPU（须在加载CUDA之前设置）"""
+    # CUDA 默认按算力排序，与 NVML/nvidia-smi 的PCI总线顺序不一致；按总线顺序编号才能对应显存估算
+    os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
+    os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_ids.get())
 
 class ModelBenchmark:
     """模型性能基准测试"""
@@ -29,11 +147,17 @@ class ModelBenchmark:
     def __init__(self, model_manager):
         self.model_manager = model_manager
         self.results = []
+        # 已预热的模型文件；模型卸载后需要重新预热
+        self._warmed = set()
+        if model_manager is not None:
+            model_manager.register_unload_callback(self._on_model_unloaded)
     
-    def warm_up_model(self, model_config=None, warm_up_iterations: int = 3) -> bool:
-        """预热模型"""
-        print("[Benchmark] 开始模型预热...")
-        
+    def _on_model_unloaded(self, config):
+        self._warmed.discard(config.path if config else "__default__")
+    
+    def warm_up_model(self, model_config=None, warm_up_iterations: int = 3,
+                      force: bool = False) -> bool:
+        """预热模型（同一模型文件加载期间只预热一次，force=True 时强制重新预热）"""
         try:
             # 确保模型已加载
             if not self.model_manager.load_model(
@@ -43,15 +167,15 @@ class ModelBenchmark:
                 print("[Benchmark] 模型加载失败，无法预热")
                 return False
             
-            # 执行几次空生成来预热
-            warm_up_prompts = [
-                "你好",
-                "1+1等于几",
-                "今天天气怎么样"
-            ]
+            key = model_config.path if model_config else "__default__"
+            if key in self._warmed and not force:
+                return True
             
+            print("[Benchmark] 开始模型预热...")
+            
+            # 执行几次空生成来预热
             for i in range(warm_up_iterations):
-                prompt = warm_up_prompts[i % len(warm_up_prompts)]
+                prompt = _WARMUP_PROMPTS[i % len(_WARMUP_PROMPTS)]
                 result = self.model_manager.generate(
                     prompt=prompt,
                     max_tokens=50,
@@ -66,6 +190,7 @@ class ModelBenchmark:
                 time.sleep(0.5)  # 短暂休息
             
             print("[Benchmark] 模型预热完成")
+            self._warmed.add(key)
             return True
             
         except Exception as e:
@@ -93,79 +218,76 @@ class ModelBenchmark:
         )
         
         try:
-            # 记录加载时间
-            load_start = time.time()
-            if not self.model_manager.load_model(
-                model_size=model_config.size if model_config else None,
-                model_name=model_config.name if model_config else None
-            ):
-                result.error_msg = "模型加载失败"
-                return result
-            
-            result.load_time = time.time() - load_start
+            # 从加载开始持续采样内存，覆盖KV缓存等生成期间的分配
+            sampler = _PeakMemorySampler()
+            with sampler:
+                # 记录加载时间
+                load_start = time.time()
+                if not self.model_manager.load_model(
+                    model_size=model_config.size if model_config else None,
+                    model_name=model_config.name if model_config else None
+                ):
+                    result.error_msg = "模型加载失败"
+                    return result
             
-            # 获取内存使用情况
-            try:
-                import psutil
-                process = psutil.Process()
-                result.memory_usage_mb = process.memory_info().rss / 1024 / 1024
-            except:
-                pass
+                result.load_time = time.time() - load_start
             
-            # 预热模型
-            self.warm_up_model(model_config, warm_up_iterations=1)
+                # 预热模型
+                self.warm_up_model(model_config, warm_up_iterations=1)
             
-            # 测试提示词
-            if not test_prompts:
-                test_prompts = [
-                    "请简单介绍一下人工智能的发展历程",
-                    "写一首关于春天的短诗",
-                    "解释一下量子计算的基本原理"
-                ]
+                # 测试提示词
+                if not test_prompts:
+                    test_prompts = _DEFAULT_BENCH_PROMPTS
             
-            load_times = []
-            token_times = []
-            token_counts = []
+                prompts = list(test_prompts[:iterations])
+                print(f"[Benchmark] 批量测试 {len(prompts)} 个提示词")
             
-            for i, prompt in enumerate(test_prompts[:iterations]):
-                print(f"[Benchmark] 测试 {i+1}/{min(len(test_prompts), iterations)}: {prompt[:30]}...")
-                
-                # 测试加载时间（第二次应该更快）
-                gen_start = time.time()
-                
-                gen_result = self.model_manager.generate(
-                    prompt=prompt,
+                # 一次提交全部提示词，整批耗时作为吞吐量的分母
+                batch_start = time.perf_counter()
+                gen_results = self.model_manager.generate_batch(
+                    prompts,
                     max_tokens=100,
                     temperature=0.7
                 )
+                batch_time = time.perf_counter() - batch_start
+            
+                first_token_times = []
+                token_times = []
+                token_gaps = []
+                token_counts = []
+            
+                for i, (prompt, gen_result) in enumerate(zip(prompts, gen_results)):
+                    if not gen_result["success"]:
+                        result.error_msg = gen_result.get("error", "生成失败")
+                        return result
                 
-                if not gen_result["success"]:
-                    result.error_msg = gen_result.get("error", "生成失败")
-                    return result
-                
-                total_time = time.time() - gen_start
-                load_times.append(total_time)
-                
-                # 估算token数量和速度
-                output_text = gen_result["text"]
-                token_count = len(output_text.split())  # 简单估算
-                token_counts.append(token_count)
+                    # 流式生成时分别测得的首token时间(TTFT)和每token解码时间(TPOT)
+                    first_token_times.append(gen_result["ttft"])
+                    if gen_result["tpot"] > 0:
+                        token_times.append(gen_result["tpot"])
+                    token_gaps.extend(gen_result.get("itl", ()))
                 
-                if token_count > 0:
-                    token_time = total_time / token_count
-                    token_times.append(token_time)
+                    # 流式生成每个分块对应一个token，直接使用模型实际输出的token数
+                    output_text = gen_result["text"]
+                    token_counts.append(gen_result["tokens_used"])
                 
-                # 记录第一个测试的详细信息
-                if i == 0:
-                    result.test_prompt = prompt
-                    result.test_output_length = len(output_text)
+                    # 记录第一个测试的详细信息
+                    if i == 0:
+                        result.test_prompt = prompt
+                        result.test_output_length = len(output_text)
             
-            # 计算结果
-            if load_times:
-                result.first_token_time = load_times[0]  # 第一次生成的完整时间
-                result.avg_token_time = statistics.mean(token_times) if token_times else 0
-                result.tokens_per_second = 1 / result.avg_token_time if result.avg_token_time > 0 else 0
+                # 计算结果：单请求解码速度 = 1 / TPOT，吞吐量 = 输出token总数 / 整批耗时
+                if first_token_times:
+                    result.first_token_time = sum(first_token_times) / len(first_token_times)
+                    result.avg_token_time = sum(token_times) / len(token_times) if token_times else 0
+                    result.tokens_per_second = 1 / result.avg_token_time if result.avg_token_time > 0 else 0
+                    result.throughput_tokens_per_second = sum(token_counts) / batch_time if batch_time > 0 else 0
+                # token间隔呈长尾分布，均值之外再给出分位数
+                if token_gaps:
+                    result.p50_tpot, result.p95_tpot, result.p99_tpot = _percentiles(token_gaps, (0.5, 0.95, 0.99))
             
+            result.memory_usage_mb = sampler.peak_uss / 2**20
+            result.gpu_peak_memory_mb = sampler.peak_gpu / 2**20
             result.success = True
             print(f"[Benchmark] 测试完成 - 加载时间: {result.load_time:.2f}s, 速度: {result.tokens_per_second:.1f} tokens/s")
             
@@ -183,27 +305,107 @@ class ModelBenchmark:
         all_results = []
         available_models = self.model_manager.get_available_models()
         
+        # 按GGUF文件分组，共享同一文件的配置连续测试，只需加载一次
+        by_path: Dict[str, list] = {}
         for model_info in available_models:
             if not model_info["available"]:
                 print(f"[Benchmark] 跳过不可用模型: {model_info['name']}")
                 continue
             
             # 查找对应的ModelConfig
-            model_config = None
-            for configs in self.model_manager.model_configs.values():
-                for config in configs:
-                    if config.name == model_info["name"]:
-                        model_config = config
-                        break
-                if model_config:
-                    break
+            model_config = self.model_manager._find_model_by_name(model_info["name"])
             
             if model_config:
+                by_path.setdefault(model_config.path, []).append(model_config)
+        
+        for configs in by_path.values():
+            for model_config in configs:
                 result = self.benchmark_model(model_config, iterations=iterations)
                 all_results.append(result)
         
         return all_results
     
+    def benchmark_all_models_parallel(self, iterations: int = 2, 
+                                      workers: Optional[int] = None) -> List[BenchmarkResult]:
+        """在多个进程中并行测试所有可用模型，多GPU时每个进程绑定一块GPU，核心或内存不足时退回串行测试"""
+        manager = self.model_manager
+        configs = [
+            manager._find_model_by_name(model_info["name"])
+            for model_info in manager.get_available_models()
+            if model_info["available"]
+        ]
+        if not configs:
+            return []
+        
+        profile = manager.device_profile
+        cpu_cores = profile.cpu_cores if profile else 4
+        gpu_count = profile.gpu_count if profile else 0
+        
+        if gpu_count > 1:
+            from .local_model_loader import estimate_host_ram_gb
+            
+            # 多GPU：每块GPU一个进程；显存放不下的层仍在主机内存中，按最小的那块GPU估算
+            workers = min(workers or gpu_count, gpu_count, len(configs))
+            vram_gb = min(profile.gpu_vram_gb[:workers], default=0)
+            host_ram_gb = [estimate_host_ram_gb(config, vram_gb) for config in configs]
+        else:
+            workers = min(workers or max(1, cpu_cores // 8), len(configs))
+            host_ram_gb = [config.min_ram_gb for config in configs]
+            if gpu_count == 1 and workers > 1 and any(manager._get_n_gpu_layers(config) for config in configs):
+                # 单GPU：每个进程都按整块显存估算卸载层数，同时加载会争抢同一块显存
+                print("[Benchmark] 仅有一块GPU且启用了GPU卸载，改为串行测试")
+                workers = 1
+        # 同时运行的最大几个模型必须能装进内存
+        concurrent_ram_gb = sum(sorted(host_ram_gb, reverse=True)[:workers])
+        total_ram_gb = profile.total_ram_gb if profile else 0
+        if concurrent_ram_gb > total_ram_gb:
+            workers = 1
+        if workers <= 1:
+            return self.benchmark_all_models(iterations=iterations)
+        
+        n_threads = max(1, cpu_cores // workers)
+        print(f"[Benchmark] 并行测试 {len(configs)} 个模型: {workers} 个进程，每进程 {n_threads} 线程"
+              + ("，每进程绑定一块GPU" if gpu_count > 1 else ""))
+        
+        # spawn 启动，避免子进程继承父进程中已加载的模型和定时器线程
+        mp_context = multiprocessing.get_context("spawn")
+        pool_kwargs = {}
+        if gpu_count > 1:
+            gpu_ids = mp_context.Queue()
+            for gpu_id in range(workers):
+                gpu_ids.put(gpu_id)
+            pool_kwargs = {"initializer": _pin_gpu, "initargs": (gpu_ids,)}
+        
+        all_results = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, **pool_kwargs) as executor:
+            futures = {
+                executor.submit(_benchmark_in_process, manager.models_dir, config.name, n_threads, iterations): config
+                for config in configs
+            }
+            for future in as_completed(futures):
+                config = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[Benchmark] 模型 {config.name} 测试进程失败: {e}")
+                    result = BenchmarkResult(
+                        model_name=config.name,
+                        model_size=config.size.value,
+                        load_time=0,
+                        first_token_time=0,
+                        avg_token_time=0,
+                        tokens_per_second=0,
+                        memory_usage_mb=0,
+                        test_prompt="",
+                        test_output_length=0,
+                        success=False,
+                        error_msg=str(e)
+                    )
+                all_results.append(result)
+        
+        self.results.extend(all_results)
+        return all_results
+    
     def get_best_model_for_speed(self) -> Optional[BenchmarkResult]:
         """获取速度最快的模型"""
         successful_results = [r for r in self.results if r.success]
@@ -229,11 +431,15 @@ class ModelBenchmark:
         return max(successful_results, key=score)
     
     def save_results(self, filepath: str = "model_benchmark_results.json"):
-        """保存基准测试结果"""
+        """保存基准测试结果（安装了orjson时直接序列化dataclass）"""
         try:
-            results_data = [asdict(r) for r in self.results]
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(results_data, f, ensure_ascii=False, indent=2)
+            if orjson is not None:
+                with open(filepath, 'wb') as f:
+                    f.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2))
+            else:
+                results_data = [asdict(r) for r in self.results]
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(results_data, f, ensure_ascii=False, indent=2)
             print(f"[Benchmark] 结果已保存到 {filepath}")
         except Exception as e:
             print(f"[Benchmark] 保存结果失败: {e}")
@@ -260,7 +466,12 @@ class ModelBenchmark:
                 print(f"  • {result.model_name} ({result.model_size})")
                 print(f"    加载时间: {result.load_time:.2f}s")
                 print(f"    生成速度: {result.tokens_per_second:.1f} tokens/s")
-                print(f"    内存使用: {result.memory_usage_mb:.1f}MB")
+                print(f"    Mean TTFT (ms): {result.first_token_time * 1000:.1f}")
+                print(f"    Median TPOT (ms): {result.p50_tpot * 1000:.1f}  "
+                      f"P95 TPOT (ms): {result.p95_tpot * 1000:.1f}  P99 TPOT (ms): {result.p99_tpot * 1000:.1f}")
+                print(f"    内存峰值: {result.memory_usage_mb:.1f}MB")
+                if result.gpu_peak_memory_mb:
+                    print(f"    显存峰值: {result.gpu_peak_memory_mb:.1f}MB")
                 print()
             
             best_speed = self.get_best_model_for_speed()
@@ -4,7 +4,8 @@
 
 import sys
 import subprocess
-import importlib
+import threading
+import importlib.util
 from typing import List, Tuple, Optional
 
 class DependencyManager:
@@ -17,7 +18,10 @@ class DependencyManager:
     
     OPTIONAL_PACKAGES = {
         'torch': 'torch>=2.0.0',
-        'transformers': 'transformers>=4.30.0'
+        'transformers': 'transformers>=4.30.0',
+        'pynvml': 'nvidia-ml-py>=12.535.0',
+        'orjson': 'orjson>=3.8.0',
+        'hf_transfer': 'hf_transfer>=0.1.4'
     }
     
     def __init__(self):
@@ -43,11 +47,10 @@ class DependencyManager:
         return self.missing_required, self.missing_optional
     
     def _is_module_installed(self, module_name: str) -> bool:
-        """检查模块是否已安装"""
+        """检查模块是否已安装（只查找模块规格，不执行模块代码）"""
         try:
-            importlib.import_module(module_name)
-            return True
-        except ImportError:
+            return importlib.util.find_spec(module_name) is not None
+        except (ImportError, ValueError):
             return False
     
     def install_package(self, package_spec: str) -> bool:
@@ -114,5 +117,16 @@ class DependencyManager:
         
         return '\n'.join(guide)
 
-# 全局依赖管理器
-dependency_manager = DependencyManager()
\ No newline at end of file
+# 全局依赖管理器：首次访问 dependency_manager 时才创建（PEP 562），导入本模块不触发依赖检查
+_dependency_manager: Optional[DependencyManager] = None
+_dependency_manager_lock = threading.Lock()
+
+def __getattr__(name: str):
+    global _dependency_manager
+    if name == "dependency_manager":
+        if _dependency_manager is None:
+            with _dependency_manager_lock:
+                if _dependency_manager is None:
+                    _dependency_manager = DependencyManager()
+        return _dependency_manager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
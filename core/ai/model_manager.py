@@ -3,18 +3,39 @@
 """
 
 import os
-import sys
 import json
+import time
 import hashlib
 import requests
 import shutil
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as URLLib3HTTPError
+from urllib3.util.retry import Retry
 from pathlib import Path
-from typing import Dict, List, Optional, Callable, Any
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from urllib.parse import urlparse
+from urllib.request import url2pathname
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
-@dataclass
+from ._compat import DATACLASS_SLOTS
+
+# 可选：HuggingFace 的 Rust 下载器，整个传输循环在原生代码中完成
+try:
+    import hf_transfer
+except ImportError:
+    hf_transfer = None
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB，减少Python层循环次数，也让SHA-256按完整块批量处理
+DOWNLOAD_CONNECTIONS = 8  # 分段并行下载的连接数
+PARALLEL_DOWNLOAD_MIN_SIZE = 64 << 20  # 小于64 MiB的文件单连接下载即可
+DOWNLOAD_COPY_SIZE = 4 << 20  # 本地镜像复制的单次拷贝大小
+PROGRESS_NOTIFY_BYTES = 1 << 20  # 进度回调的最小通知间隔
+RANGE_RETRIES = 3  # 单个分段传输中断后的重试次数（从已写入的位置续传）
+
+
+@dataclass(**DATACLASS_SLOTS)
 class DownloadProgress:
     """下载进度信息"""
     filename: str
@@ -24,52 +45,81 @@ class DownloadProgress:
     speed: float  # bytes per second
     status: str  # downloading, completed, error
 
+def _is_huggingface_url(url: str) -> bool:
+    """是否为 HuggingFace 的下载链接"""
+    host = urlparse(url).hostname or ""
+    return host == "huggingface.co" or host.endswith(".huggingface.co")
+
 class ModelDownloadManager:
     """模型下载管理器"""
     
     # 预定义的模型下载信息
     MODEL_REPOSITORIES = {
         "qwen-1.5b-chat-q4": {
-            "url": "https://huggingface.co/Qwen/Qwen-1.5-1.8B-Chat-GGUF/resolve/main/qwen1.5-1.8b-chat-q4_0.gguf",
-            "filename": "qwen-1.5b-chat-q4_0.gguf",
+            "url": "https://huggingface.co/Qwen/Qwen1.5-1.8B-Chat-GGUF/resolve/main/qwen1_5-1_8b-chat-q4_k_m.gguf",
+            "filename": "qwen-1.5b-chat-q4_k_m.gguf",
             "size_mb": 1200,
             "sha256": None,  # 可选的校验和
-            "description": "Qwen 1.5B Chat Model (Q4 quantized)"
+            "description": "Qwen 1.5B Chat Model (Q4_K_M quantized)"
         },
         "qwen-3b-chat-q4": {
-            "url": "https://huggingface.co/Qwen/Qwen-1.5-3B-Chat-GGUF/resolve/main/qwen1.5-3b-chat-q4_0.gguf",
-            "filename": "qwen-3b-chat-q4_0.gguf",
-            "size_mb": 2000,
+            "url": "https://huggingface.co/Qwen/Qwen1.5-4B-Chat-GGUF/resolve/main/qwen1_5-4b-chat-q4_k_m.gguf",
+            "filename": "qwen-3b-chat-q4_k_m.gguf",
+            "size_mb": 2500,
             "sha256": None,
-            "description": "Qwen 3B Chat Model (Q4 quantized)"
+            "description": "Qwen1.5 4B Chat Model (Q4_K_M quantized)"
         },
         "qwen-7b-chat-q4": {
-            "url": "https://huggingface.co/Qwen/Qwen-1.5-7B-Chat-GGUF/resolve/main/qwen1.5-7b-chat-q4_0.gguf",
-            "filename": "qwen-7b-chat-q4_0.gguf",
-            "size_mb": 4200,
+            "url": "https://huggingface.co/Qwen/Qwen1.5-7B-Chat-GGUF/resolve/main/qwen1_5-7b-chat-q4_k_m.gguf",
+            "filename": "qwen-7b-chat-q4_k_m.gguf",
+            "size_mb": 4800,
+            "sha256": None,
+            "description": "Qwen 7B Chat Model (Q4_K_M quantized)"
+        },
+        "qwen-7b-chat-q5": {
+            "url": "https://huggingface.co/Qwen/Qwen1.5-7B-Chat-GGUF/resolve/main/qwen1_5-7b-chat-q5_k_m.gguf",
+            "filename": "qwen-7b-chat-q5_k_m.gguf",
+            "size_mb": 5600,
             "sha256": None,
-            "description": "Qwen 7B Chat Model (Q4 quantized)"
+            "description": "Qwen 7B Chat Model (Q5_K_M quantized)"
+        },
+        "qwen-13b-chat-q4": {
+            "url": "https://huggingface.co/Qwen/Qwen1.5-14B-Chat-GGUF/resolve/main/qwen1_5-14b-chat-q4_k_m.gguf",
+            "filename": "qwen-13b-chat-q4_k_m.gguf",
+            "size_mb": 9200,
+            "sha256": None,
+            "description": "Qwen1.5 14B Chat Model (Q4_K_M quantized)"
+        },
+        "qwen-13b-chat-q6": {
+            "url": "https://huggingface.co/Qwen/Qwen1.5-14B-Chat-GGUF/resolve/main/qwen1_5-14b-chat-q6_k.gguf",
+            "filename": "qwen-13b-chat-q6_k.gguf",
+            "size_mb": 12400,
+            "sha256": None,
+            "description": "Qwen1.5 14B Chat Model (Q6_K quantized)"
         },
         "phi-2-q4": {
             "url": "https://huggingface.co/TheBloke/phi-2-GGUF/resolve/main/phi-2.Q4_K_M.gguf",
-            "filename": "phi-2-q4.gguf",
+            "filename": "phi-2-q4_k_m.gguf",
+            "legacy_filenames": ("phi-2-q4.gguf",),  # 旧版本保存的文件名（下载地址相同）
             "size_mb": 1800,
             "sha256": None,
-            "description": "Phi-2 Model (Q4 quantized)"
+            "description": "Phi-2 Model (Q4_K_M quantized)"
         },
         "phi-3-mini-q4": {
             "url": "https://huggingface.co/microsoft/Phi-3-mini-4k-instruct-gguf/resolve/main/Phi-3-mini-4k-instruct-q4.gguf",
-            "filename": "phi-3-mini-q4.gguf",
+            "filename": "phi-3-mini-q4_k_m.gguf",
+            "legacy_filenames": ("phi-3-mini-q4.gguf",),
             "size_mb": 2400,
             "sha256": None,
-            "description": "Phi-3 Mini Model (Q4 quantized)"
+            "description": "Phi-3 Mini Model (Q4_K_M quantized)"
         },
         "mistral-7b-q4": {
             "url": "https://huggingface.co/TheBloke/Mistral-7B-v0.1-GGUF/resolve/main/mistral-7b-v0.1.Q4_K_M.gguf",
-            "filename": "mistral-7b-v0.1-q4.gguf",
-            "size_mb": 4300,
+            "filename": "mistral-7b-v0.1-q4_k_m.gguf",
+            "legacy_filenames": ("mistral-7b-v0.1-q4.gguf",),
+            "size_mb": 4400,
             "sha256": None,
-            "description": "Mistral 7B Model (Q4 quantized)"
+            "description": "Mistral 7B Model (Q4_K_M quantized)"
         }
     }
     
@@ -83,6 +133,36 @@ class ModelDownloadManager:
             'completed': [],
             'error': []
         }
+        # 复用连接的会话：多个模型/多个分段下载共享TLS连接，失败的网关错误自动重试
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=DOWNLOAD_CONNECTIONS * 2,
+            pool_maxsize=DOWNLOAD_CONNECTIONS * 2,
+            max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # 已下载模型列表缓存，以模型目录的mtime为键，目录内文件增删时自动失效
+        self._downloaded_cache: Optional[Tuple[int, List[Dict]]] = None
+        # 预先拼好各模型文件路径，避免每次查询都重新构造 Path
+        self._model_paths: Dict[str, Path] = {
+            name: self.models_dir / info["filename"] for name, info in self.MODEL_REPOSITORIES.items()
+        }
+        self._migrate_legacy_files()
+    
+    def _migrate_legacy_files(self):
+        """将旧版本文件名下已下载的模型重命名为当前文件名，避免重复下载"""
+        for name, info in self.MODEL_REPOSITORIES.items():
+            model_path = self._model_paths[name]
+            for legacy_filename in info.get("legacy_filenames", ()):
+                legacy_path = self.models_dir / legacy_filename
+                if model_path.exists() or not legacy_path.exists():
+                    continue
+                try:
+                    os.replace(legacy_path, model_path)
+                    print(f"[ModelManager] 已迁移旧模型文件: {legacy_filename} -> {model_path.name}")
+                except OSError as e:
+                    print(f"[ModelManager] 迁移旧模型文件失败: {legacy_filename}: {e}")
     
     def get_model_info(self, model_name: str) -> Optional[Dict]:
         """获取模型信息"""
@@ -90,32 +170,39 @@ class ModelDownloadManager:
     
     def is_model_downloaded(self, model_name: str) -> bool:
         """检查模型是否已下载"""
-        model_info = self.get_model_info(model_name)
-        if not model_info:
-            return False
-        
-        model_path = self.models_dir / model_info["filename"]
-        return model_path.exists()
+        model_path = self._model_paths.get(model_name)
+        return model_path is not None and os.path.exists(model_path)
     
     def get_downloaded_models(self) -> List[Dict]:
         """获取已下载的模型列表"""
+        try:
+            dir_mtime = self.models_dir.stat().st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if dir_mtime is not None and self._downloaded_cache and self._downloaded_cache[0] == dir_mtime:
+            return list(self._downloaded_cache[1])
+        
         downloaded = []
         
-        for model_name, repo_info in self.MODEL_REPOSITORIES.items():
-            if self.is_model_downloaded(model_name):
-                model_path = self.models_dir / repo_info["filename"]
-                stat = model_path.stat()
-                
-                downloaded.append({
-                    "name": model_name,
-                    "filename": repo_info["filename"],
-                    "size_mb": repo_info["size_mb"],
-                    "actual_size_mb": round(stat.st_size / 1024 / 1024, 1),
-                    "description": repo_info["description"],
-                    "download_date": stat.st_mtime
-                })
+        for model_name, model_path in self._model_paths.items():
+            try:
+                stat = os.stat(model_path)
+            except OSError:
+                continue
+            repo_info = self.MODEL_REPOSITORIES[model_name]
+            
+            downloaded.append({
+                "name": model_name,
+                "filename": repo_info["filename"],
+                "size_mb": repo_info["size_mb"],
+                "actual_size_mb": round(stat.st_size / 1024 / 1024, 1),
+                "description": repo_info["description"],
+                "download_date": stat.st_mtime
+            })
         
-        return downloaded
+        if dir_mtime is not None:
+            self._downloaded_cache = (dir_mtime, downloaded)
+        return list(downloaded)
     
     def download_model(self, 
                       model_name: str,
@@ -146,7 +233,7 @@ class ModelDownloadManager:
         filename = model_info["filename"]
         expected_size = model_info.get("size_mb", 0) * 1024 * 1024
         
-        model_path = self.models_dir / filename
+        model_path = self._model_paths.get(model_name) or self.models_dir / filename
         temp_path = self.models_dir / f"{filename}.tmp"
         
         print(f"[ModelManager] 开始下载: {model_name} ({filename})")
@@ -154,12 +241,21 @@ class ModelDownloadManager:
         print(f"[ModelManager] 源: {url}")
         
         try:
-            # 发起请求
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # 获取实际文件大小
-            total_size = int(response.headers.get('content-length', expected_size))
+            # 本地镜像(file://)直接由内核拷贝，不经过用户态
+            local_source = self._local_source_path(url)
+            if local_source is not None:
+                total_size = os.path.getsize(local_source)
+                parallel = False
+            else:
+                # 服务器支持Range且文件足够大时，多连接分段并行下载
+                total_size = self._probe_range_support(url)
+                parallel = total_size >= PARALLEL_DOWNLOAD_MIN_SIZE
+            response = None
+            if local_source is None and not parallel:
+                response = self._session.get(url, stream=True, timeout=30)
+                response.raise_for_status()
+                # 获取实际文件大小
+                total_size = int(response.headers.get('content-length', expected_size))
             
             # 初始化进度
             progress = DownloadProgress(
@@ -171,36 +267,43 @@ class ModelDownloadManager:
                 status="downloading"
             )
             self.download_progress[model_name] = progress
+            report = self._progress_reporter(progress, progress_callback)
             
-            # 下载文件
-            start_time = time.time()
-            downloaded = 0
-            chunk_size = 8192
+            if local_source is not None:
+                print(f"[ModelManager] 从本地镜像复制: {local_source}")
+                self._copy_local_file(local_source, temp_path, total_size)
+                report(total_size)
+                # 零拷贝路径只在需要校验时才读取文件内容
+                hasher = self._hash_file(temp_path) if model_info.get("sha256") else None
+            elif parallel:
+                if hf_transfer is not None and _is_huggingface_url(url):
+                    print("[ModelManager] 使用 hf_transfer 下载")
+                    self._download_with_hf_transfer(url, temp_path, report)
+                else:
+                    print(f"[ModelManager] 分段并行下载: {DOWNLOAD_CONNECTIONS} 个连接")
+                    self._download_ranges(url, temp_path, total_size, report)
+                if progress.downloaded != total_size:
+                    raise Exception(f"分段下载不完整: {progress.downloaded} vs {total_size}")
+                # 分段乱序写入无法流式计算，需要校验时才顺序读一遍本地文件
+                hasher = self._hash_file(temp_path) if model_info.get("sha256") else None
+            else:
+                # 单连接下载，边写入边计算SHA-256，避免下载完成后再完整读一遍
+                hasher = hashlib.sha256()
+                with open(temp_path, 'wb') as f:
+                    self._prepare_sequential_write(f, total_size)
+                    self._copy_response(response, f, hasher, report)
+                    # 预分配按声明大小进行，截断到实际写入的长度
+                    f.truncate()
+                    self._sync_file(f)
             
-            with open(temp_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # 更新进度
-                        elapsed = time.time() - start_time
-                        speed = downloaded / elapsed if elapsed > 0 else 0
-                        
-                        progress.downloaded = downloaded
-                        progress.percentage = (downloaded / total_size) * 100
-                        progress.speed = speed
-                        
-                        # 调用进度回调
-                        if progress_callback:
-                            progress_callback(progress)
-                        
-                        # 触发全局回调
-                        for cb in self.callbacks['progress']:
-                            try:
-                                cb(progress)
-                            except:
-                                pass
+            # 校验和不匹配时不替换正式文件
+            digest = hasher.hexdigest() if hasher is not None else None
+            expected_sha256 = model_info.get("sha256")
+            if expected_sha256:
+                if digest != expected_sha256.lower():
+                    raise Exception(f"SHA-256校验失败: {digest} vs {expected_sha256}")
+            elif digest:
+                print(f"[ModelManager] SHA-256: {digest}")
             
             # 下载完成，重命名文件
             temp_path.rename(model_path)
@@ -212,6 +315,8 @@ class ModelDownloadManager:
                 model_path.unlink()  # 删除不完整的文件
                 raise Exception("下载文件不完整")
             
+            self._downloaded_cache = None
+            
             # 更新进度状态
             progress.status = "completed"
             progress.percentage = 100
@@ -247,6 +352,195 @@ class ModelDownloadManager:
             
             return False
     
+    def _probe_range_support(self, url: str) -> int:
+        """HEAD探测文件大小，服务器不支持Range请求时返回0"""
+        try:
+            response = self._session.head(url, allow_redirects=True, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException:
+            return 0
+        if response.headers.get('accept-ranges', '').lower() != 'bytes':
+            return 0
+        return int(response.headers.get('content-length', 0))
+    
+    def _download_ranges(self, url: str, temp_path: Path, total_size: int,
+                         report: Callable[[int], None]):
+        """按字节范围分段，多个连接并行写入预分配文件的各自偏移"""
+        part_size = -(-total_size // DOWNLOAD_CONNECTIONS)
+        ranges = [(start, min(start + part_size, total_size) - 1)
+                  for start in range(0, total_size, part_size)]
+        
+        with open(temp_path, 'wb') as f:
+            self._prepare_sequential_write(f, total_size)
+        
+        def fetch_range(first: int, last: int):
+            offset = first  # 本分段已写入到的位置，重试时从这里续传
+            
+            def on_chunk(chunk_len: int):
+                nonlocal offset
+                offset += chunk_len
+                report(chunk_len)
+            
+            for attempt in range(RANGE_RETRIES + 1):
+                try:
+                    response = self._session.get(
+                        url, headers={"Range": f"bytes={offset}-{last}"}, stream=True, timeout=30
+                    )
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise Exception(f"服务器未返回分段内容: HTTP {response.status_code}")
+                    
+                    with open(temp_path, 'r+b') as f:
+                        f.seek(offset)
+                        self._copy_response(response, f, None, on_chunk)
+                    if offset > last:
+                        return
+                    error = f"连接提前关闭，剩余 {last + 1 - offset} 字节"
+                except (requests.RequestException, URLLib3HTTPError, ConnectionError, TimeoutError) as e:
+                    error = str(e)
+                
+                if attempt == RANGE_RETRIES:
+                    raise Exception(f"分段 {first}-{last} 下载失败: {error}")
+                print(f"[ModelManager] 分段 {first}-{last} 中断，从 {offset} 续传 ({attempt + 1}/{RANGE_RETRIES}): {error}")
+                time.sleep(0.5 * 2 ** attempt)
+        
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(fetch_range, first, last) for first, last in ranges]
+            for future in futures:
+                future.result()
+        
+        with open(temp_path, 'r+b') as f:
+            self._sync_file(f)
+    
+    @staticmethod
+    def _local_source_path(url: str) -> Optional[str]:
+        """file:// 链接返回本地路径，其余返回None"""
+        parsed = urlparse(url)
+        if parsed.scheme != "file":
+            return None
+        return url2pathname(parsed.path)
+    
+    @staticmethod
+    def _prepare_sequential_write(f, size: int):
+        """预分配磁盘空间并提示内核顺序写入（非POSIX平台跳过）"""
+        if size <= 0:
+            return
+        fd = f.fileno()
+        if hasattr(os, "posix_fallocate"):
+            try:
+                # 一次性分配连续区段，避免边写边扩展带来的碎片和元数据更新
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                # 部分文件系统不支持预分配
+                pass
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _sync_file(f):
+        """落盘后再重命名，避免断电后留下内容不完整的模型文件"""
+        f.flush()
+        os.fsync(f.fileno())
+    
+    @classmethod
+    def _copy_local_file(cls, source: str, dest: Path, size: int):
+        """本地文件复制，优先使用 copy_file_range 在内核内搬运数据"""
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            cls._prepare_sequential_write(dst, size)
+            copied = False
+            if hasattr(os, "copy_file_range"):
+                try:
+                    while os.copy_file_range(src.fileno(), dst.fileno(), DOWNLOAD_COPY_SIZE) > 0:
+                        pass
+                    copied = True
+                except OSError:
+                    # 跨文件系统或内核不支持时回退
+                    src.seek(0)
+                    dst.seek(0)
+            if not copied:
+                shutil.copyfileobj(src, dst, DOWNLOAD_COPY_SIZE)
+            dst.truncate()
+            cls._sync_file(dst)
+    
+    @staticmethod
+    def _copy_response(response, f, hasher, on_chunk: Callable[[int], None]):
+        """用可复用缓冲区从原始连接 readinto，省去 iter_content 的逐块分配和重组"""
+        raw = response.raw
+        raw.decode_content = True
+        buffer = bytearray(DOWNLOAD_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = raw.readinto(buffer)
+            if not n:
+                break
+            chunk = view[:n]
+            f.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            on_chunk(n)
+    
+    @staticmethod
+    def _download_with_hf_transfer(url: str, temp_path: Path, report: Callable[[int], None]):
+        """交给 hf_transfer 多连接下载，进度按其回调的增量字节累加（report 自带锁，可在原生线程中调用）"""
+        hf_transfer.download(
+            url=url,
+            filename=str(temp_path),
+            max_files=DOWNLOAD_CONNECTIONS,
+            chunk_size=10 << 20,
+            parallel_failures=3,
+            max_retries=5,
+            headers=None,
+            callback=report
+        )
+    
+    @staticmethod
+    def _hash_file(path: Path):
+        """分块计算文件SHA-256"""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher
+    
+    def _progress_reporter(self, progress: DownloadProgress,
+                           progress_callback: Optional[Callable]) -> Callable[[int], None]:
+        """创建进度累加函数：每块只累加字节数，每 PROGRESS_NOTIFY_BYTES 才更新速度并通知回调
+        
+        分段下载的工作线程和 hf_transfer 的原生线程会并发调用，累加与通知在同一把锁内进行
+        """
+        progress_cbs = self.callbacks['progress']
+        start_time = time.time()
+        last_notified = 0
+        progress_lock = threading.Lock()
+        
+        def report(chunk_len: int):
+            nonlocal last_notified
+            with progress_lock:
+                progress.downloaded += chunk_len
+                if progress.downloaded - last_notified < PROGRESS_NOTIFY_BYTES and progress.downloaded < progress.total_size:
+                    return
+                last_notified = progress.downloaded
+                
+                elapsed = time.time() - start_time
+                progress.speed = progress.downloaded / elapsed if elapsed > 0 else 0
+                progress.percentage = (progress.downloaded / progress.total_size) * 100 if progress.total_size else 0
+                
+                # 调用进度回调
+                if progress_callback:
+                    progress_callback(progress)
+                
+                # 触发全局回调
+                for cb in progress_cbs:
+                    try:
+                        cb(progress)
+                    except:
+                        pass
+        
+        return report
+    
     def download_in_background(self, 
                               model_name: str,
                               progress_callback: Optional[Callable] = None,
@@ -286,18 +580,17 @@ class ModelDownloadManager:
     
     def delete_model(self, model_name: str) -> bool:
         """删除已下载的模型"""
-        model_info = self.get_model_info(model_name)
-        if not model_info:
+        model_path = self._model_paths.get(model_name)
+        if model_path is None:
             return False
         
-        model_path = self.models_dir / model_info["filename"]
-        
-        if not model_path.exists():
+        if not os.path.exists(model_path):
             print(f"[ModelManager] 模型文件不存在: {model_name}")
             return False
         
         try:
             model_path.unlink()
+            self._downloaded_cache = None
             print(f"[ModelManager] 已删除模型: {model_name}")
             return True
         except Exception as e:
@@ -316,9 +609,16 @@ class ModelDownloadManager:
     def get_repository_status(self) -> Dict[str, Any]:
         """获取仓库状态"""
         total_models = len(self.MODEL_REPOSITORIES)
-        downloaded_models = len(self.get_downloaded_models())
-        total_size_mb = sum(info.get("size_mb", 0) for info in self.MODEL_REPOSITORIES.values())
-        downloaded_size_mb = sum(m["actual_size_mb"] for m in self.get_downloaded_models())
+        downloaded = self.get_downloaded_models()
+        downloaded_models = len(downloaded)
+        downloaded_size_mb = sum(m["actual_size_mb"] for m in downloaded)
+        
+        total_size_mb = 0
+        repository_urls = set()
+        for info in self.MODEL_REPOSITORIES.values():
+            total_size_mb += info.get("size_mb", 0)
+            if info.get("url"):
+                repository_urls.add(info["url"])
         
         return {
             "total_models": total_models,
@@ -326,7 +626,7 @@ class ModelDownloadManager:
             "available_models": total_models - downloaded_models,
             "total_size_mb": total_size_mb,
             "downloaded_size_mb": downloaded_size_mb,
-            "repository_urls": list(set(info["url"] for info in self.MODEL_REPOSITORIES.values() if info.get("url")))
+            "repository_urls": list(repository_urls)
         }
 
 # 全局模型管理器实例
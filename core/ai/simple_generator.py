@@ -3,149 +3,253 @@
 """
 
 import random
+import functools
+import itertools
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from types import MappingProxyType
+from typing import Any, Mapping, Tuple
 
 # 临时类型定义
 class AIReasoningResult:
+    __slots__ = ("candidateEvents", "reasoning")
+    
     def __init__(self, candidate_events, reasoning):
         self.candidateEvents = candidate_events
         self.reasoning = reasoning
 
+# 可信度与幸福感变化的取值范围（闭区间，与 randint 一致）
+_PLAUSIBILITY_RANGE = range(70, 96)
+_HAPPINESS_CHANGE_RANGE = range(1, 6)
+
+def _freeze(value):
+    """把模板递归冻结为只读结构：dict -> MappingProxyType，list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _build_alias_table(weights) -> Tuple[Tuple[float, ...], Tuple[int, ...]]:
+    """Vose别名法：预处理权重，之后每次加权抽样为O(1)"""
+    n = len(weights)
+    total = float(sum(weights))
+    if n == 0 or total <= 0:
+        return (1.0,) * n, tuple(range(n))
+    
+    scaled = [weight * n / total for weight in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, value in enumerate(scaled) if value < 1.0]
+    large = [i for i, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    # 剩余项因浮点误差而接近1，概率取1
+    return tuple(prob), tuple(alias)
+
+def _alias_choices(items, table, k: int) -> list:
+    """按别名表加权抽取k个元素"""
+    prob, alias = table
+    n = len(items)
+    picks = []
+    for _ in range(k):
+        i = random.randrange(n)
+        picks.append(items[i if random.random() < prob[i] else alias[i]])
+    return picks
+
+class GameEvent:
+    """演示事件（模块级定义，避免每个事件动态创建类）"""
+    __slots__ = ('id', 'profile_id', 'event_date', 'event_type', 'title', 'description',
+                 'narrative', 'choices', 'impacts', 'is_completed', 'selected_choice',
+                 'plausibility', 'emotional_weight', 'created_at', 'updated_at')
+    
+    def __init__(self, id, profile_id, event_date, event_type, title, description,
+                 narrative, choices, impacts, is_completed, selected_choice,
+                 plausibility, emotional_weight, created_at, updated_at):
+        self.id = id
+        self.profile_id = profile_id
+        self.event_date = event_date
+        self.event_type = event_type
+        self.title = title
+        self.description = description
+        self.narrative = narrative
+        self.choices = choices
+        self.impacts = impacts
+        self.is_completed = is_completed
+        self.selected_choice = selected_choice
+        self.plausibility = plausibility
+        self.emotional_weight = emotional_weight
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+@functools.lru_cache(maxsize=1)
+def _event_templates() -> Mapping[str, Tuple[Mapping[str, Any], ...]]:
+    """事件模板（冻结为只读结构，进程内只构建一次，各生成器与事件共享引用）"""
+    return _freeze({
+        'L0': [
+            {
+                'title': '日常学习',
+                'description': '在学校进行日常学习活动',
+                'emotional_weight': 0.2,
+                'choices': [
+                    {'text': '认真学习', 'immediateImpacts': [{'dimension': 'cognitive', 'subDimension': 'knowledge', 'change': 2}]},
+                    {'text': '玩耍放松', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': 3}]}
+                ]
+            },
+            {
+                'title': '家庭活动', 
+                'description': '与家人共度时光',
+                'emotional_weight': 0.4,
+                'choices': [
+                    {'text': '积极互动', 'immediateImpacts': [{'dimension': 'relational', 'subDimension': 'family', 'change': 5}]},
+                    {'text': '独自活动', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': -1}]}
+                ]
+            },
+            {
+                'title': '运动锻炼',
+                'description': '参加体育活动锻炼身体',
+                'emotional_weight': 0.3,
+                'choices': [
+                    {'text': '坚持锻炼', 'immediateImpacts': [{'dimension': 'physiological', 'subDimension': 'fitness', 'change': 3}]},
+                    {'text': '休息一下', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': 2}]}
+                ]
+            }
+        ],
+        'L1': [
+            {
+                'title': '大学入学',
+                'description': '成功考入理想的大学',
+                'emotional_weight': 0.7,
+                'choices': [
+                    {'text': '选择理工科', 'immediateImpacts': [{'dimension': 'cognitive', 'subDimension': 'academic', 'change': 8}]},
+                    {'text': '选择文科', 'immediateImpacts': [{'dimension': 'cognitive', 'subDimension': 'creative', 'change': 6}]}
+                ]
+            },
+            {
+                'title': '第一份工作',
+                'description': '获得人生第一份正式工作',
+                'emotional_weight': 0.6,
+                'choices': [
+                    {'text': '接受挑战', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'careerLevel', 'change': 10}]},
+                    {'text': '继续寻找', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'economic', 'change': -5}]}
+                ]
+            },
+            {
+                'title': '恋爱关系',
+                'description': '遇到心动的人开始恋爱',
+                'emotional_weight': 0.8,
+                'choices': [
+                    {'text': '主动追求', 'immediateImpacts': [{'dimension': 'relational', 'subDimension': 'romantic', 'change': 10}]},
+                    {'text': '保持朋友', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'stress', 'change': -2}]}
+                ]
+            }
+        ],
+        'L2': [
+            {
+                'title': '职业晋升',
+                'description': '获得重要的职业晋升机会',
+                'emotional_weight': 0.8,
+                'choices': [
+                    {'text': '接受晋升', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'careerLevel', 'change': 15}]},
+                    {'text': '保持现状', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'stress', 'change': -5}]}
+                ]
+            },
+            {
+                'title': '创业机会',
+                'description': '发现一个有潜力的创业机会',
+                'emotional_weight': 0.9,
+                'choices': [
+                    {'text': '勇敢尝试', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'economic', 'change': 20}]},
+                    {'text': '谨慎观望', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'stress', 'change': -3}]}
+                ]
+            },
+            {
+                'title': '家庭建设',
+                'description': '考虑组建家庭的重要决定',
+                'emotional_weight': 0.9,
+                'choices': [
+                    {'text': '建立家庭', 'immediateImpacts': [{'dimension': 'relational', 'subDimension': 'family', 'change': 15}]},
+                    {'text': '专注事业', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'careerLevel', 'change': 10}]}
+                ]
+            }
+        ]
+    })
+
 class SimpleAIGenerator:
     """简化版AI事件生成器"""
     
     def __init__(self):
         self.event_templates = self._load_event_templates()
         self.model_levels = ['L0', 'L1', 'L2']
-    
-    def _load_event_templates(self) -> Dict[str, List[Dict]]:
-        """加载事件模板"""
-        return {
-            'L0': [
-                {
-                    'title': '日常学习',
-                    'description': '在学校进行日常学习活动',
-                    'emotional_weight': 0.2,
-                    'choices': [
-                        {'text': '认真学习', 'immediateImpacts': [{'dimension': 'cognitive', 'subDimension': 'knowledge', 'change': 2}]},
-                        {'text': '玩耍放松', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': 3}]}
-                    ]
-                },
-                {
-                    'title': '家庭活动', 
-                    'description': '与家人共度时光',
-                    'emotional_weight': 0.4,
-                    'choices': [
-                        {'text': '积极互动', 'immediateImpacts': [{'dimension': 'relational', 'subDimension': 'family', 'change': 5}]},
-                        {'text': '独自活动', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': -1}]}
-                    ]
-                },
-                {
-                    'title': '运动锻炼',
-                    'description': '参加体育活动锻炼身体',
-                    'emotional_weight': 0.3,
-                    'choices': [
-                        {'text': '坚持锻炼', 'immediateImpacts': [{'dimension': 'physiological', 'subDimension': 'fitness', 'change': 3}]},
-                        {'text': '休息一下', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': 2}]}
-                    ]
-                }
-            ],
-            'L1': [
-                {
-                    'title': '大学入学',
-                    'description': '成功考入理想的大学',
-                    'emotional_weight': 0.7,
-                    'choices': [
-                        {'text': '选择理工科', 'immediateImpacts': [{'dimension': 'cognitive', 'subDimension': 'academic', 'change': 8}]},
-                        {'text': '选择文科', 'immediateImpacts': [{'dimension': 'cognitive', 'subDimension': 'creative', 'change': 6}]}
-                    ]
-                },
-                {
-                    'title': '第一份工作',
-                    'description': '获得人生第一份正式工作',
-                    'emotional_weight': 0.6,
-                    'choices': [
-                        {'text': '接受挑战', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'careerLevel', 'change': 10}]},
-                        {'text': '继续寻找', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'economic', 'change': -5}]}
-                    ]
-                },
-                {
-                    'title': '恋爱关系',
-                    'description': '遇到心动的人开始恋爱',
-                    'emotional_weight': 0.8,
-                    'choices': [
-                        {'text': '主动追求', 'immediateImpacts': [{'dimension': 'relational', 'subDimension': 'romantic', 'change': 10}]},
-                        {'text': '保持朋友', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'stress', 'change': -2}]}
-                    ]
-                }
-            ],
-            'L2': [
-                {
-                    'title': '职业晋升',
-                    'description': '获得重要的职业晋升机会',
-                    'emotional_weight': 0.8,
-                    'choices': [
-                        {'text': '接受晋升', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'careerLevel', 'change': 15}]},
-                        {'text': '保持现状', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'stress', 'change': -5}]}
-                    ]
-                },
-                {
-                    'title': '创业机会',
-                    'description': '发现一个有潜力的创业机会',
-                    'emotional_weight': 0.9,
-                    'choices': [
-                        {'text': '勇敢尝试', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'economic', 'change': 20}]},
-                        {'text': '谨慎观望', 'immediateImpacts': [{'dimension': 'psychological', 'subDimension': 'stress', 'change': -3}]}
-                    ]
-                },
-                {
-                    'title': '家庭建设',
-                    'description': '考虑组建家庭的重要决定',
-                    'emotional_weight': 0.9,
-                    'choices': [
-                        {'text': '建立家庭', 'immediateImpacts': [{'dimension': 'relational', 'subDimension': 'family', 'change': 15}]},
-                        {'text': '专注事业', 'immediateImpacts': [{'dimension': 'social', 'subDimension': 'careerLevel', 'change': 10}]}
-                    ]
-                }
-            ]
+        # 进程内自增的事件序号，保证ID不重复
+        self._id_counter = itertools.count(1)
+        # 按情感权重加权抽样的别名表，加载时构建一次
+        self._alias_tables = {
+            level: _build_alias_table([template['emotional_weight'] for template in templates])
+            for level, templates in self.event_templates.items()
         }
     
-    async def generate_events(self, current_state, days: int, model_level: str = 'L1') -> AIReasoningResult:
-        """生成事件"""
+    def _load_event_templates(self) -> Mapping[str, Tuple[Mapping[str, Any], ...]]:
+        """加载事件模板（共享的只读单例）"""
+        return _event_templates()
+    
+    async def generate_events(self, current_state, days: int, model_level: str = 'L1',
+                              weighted: bool = False) -> AIReasoningResult:
+        """生成事件（兼容异步调用方）"""
+        return self.generate_events_sync(current_state, days, model_level, weighted)
+    
+    def generate_events_sync(self, current_state, days: int, model_level: str = 'L1',
+                             weighted: bool = False) -> AIReasoningResult:
+        """生成事件（纯CPU计算，无需协程）；weighted=True 时按情感权重偏向抽取模板"""
         
         # 根据模型级别选择模板
-        templates = self.event_templates.get(model_level, self.event_templates['L1'])
+        level = model_level if model_level in self.event_templates else 'L1'
+        templates = self.event_templates[level]
         
         # 根据天数确定生成事件数量
         event_count = min(days // 7 + 1, 3)  # 每周最多生成3个事件
         
-        # 随机选择事件
+        # 同一批事件共用生成时间
+        now = datetime.now()
+        now_ts = int(now.timestamp())
+        now_iso = now.isoformat()
+        
+        # 批量抽取模板与随机数
         selected_events = []
-        for _ in range(event_count):
-            if templates:
-                template = random.choice(templates)
-                
-                # 创建事件对象
-                event = type('GameEvent', (), {
-                    'id': f"event_{int(datetime.now().timestamp())}_{random.randint(1000, 9999)}",
-                    'profile_id': 'demo_profile_001',
-                    'event_date': current_state.current_date,
-                    'event_type': 'life_event',
-                    'title': template['title'],
-                    'description': template['description'],
-                    'narrative': '',
-                    'choices': template['choices'],
-                    'impacts': [{'dimension': 'psychological', 'subDimension': 'happiness', 'change': random.randint(1, 5)}],
-                    'is_completed': False,
-                    'selected_choice': None,
-                    'plausibility': random.randint(70, 95),
-                    'emotional_weight': template['emotional_weight'],
-                    'created_at': datetime.now().isoformat(),
-                    'updated_at': datetime.now().isoformat()
-                })()
-                
-                selected_events.append(event)
+        if templates:
+            if weighted:
+                picks = _alias_choices(templates, self._alias_tables[level], event_count)
+            else:
+                picks = random.choices(templates, k=event_count)
+            plausibilities = random.choices(_PLAUSIBILITY_RANGE, k=event_count)
+            changes = random.choices(_HAPPINESS_CHANGE_RANGE, k=event_count)
+        else:
+            picks = plausibilities = changes = []
+        
+        for template, plausibility, change in zip(picks, plausibilities, changes):
+            # 创建事件对象
+            event = GameEvent(
+                id=f"event_{now_ts}_{next(self._id_counter)}",
+                profile_id='demo_profile_001',
+                event_date=current_state.current_date,
+                event_type='life_event',
+                title=template['title'],
+                description=template['description'],
+                narrative='',
+                choices=template['choices'],
+                impacts=[{'dimension': 'psychological', 'subDimension': 'happiness', 'change': change}],
+                is_completed=False,
+                selected_choice=None,
+                plausibility=plausibility,
+                emotional_weight=template['emotional_weight'],
+                created_at=now_iso,
+                updated_at=now_iso
+            )
+            
+            selected_events.append(event)
         
         # 生成推理说明
         reasoning = f"基于角色当前状态（年龄: {current_state.age}岁，人生阶段: {current_state.life_stage}）生成了 {len(selected_events)} 个事件。使用模型级别: {model_level}"
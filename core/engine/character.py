@@ -3,110 +3,303 @@
 """
 
 import json
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import bisect
+import pickle
+from datetime import timedelta
+from typing import Dict, Any, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from shared.types import LifeProfile, CharacterState
 
+# 基础属性模板（嵌套结构与前端类型一致）
+_BASE_ATTRIBUTES = {
+    'physiological': {
+        'health': 85,
+        'energy': 75,
+        'appearance': 55,
+        'fitness': 65
+    },
+    'psychological': {
+        'openness': 55,
+        'conscientiousness': 55,
+        'extraversion': 55,
+        'agreeableness': 55,
+        'neuroticism': 45,
+        'happiness': 65,
+        'stress': 25,
+        'resilience': 55
+    },
+    'social': {
+        'socialCapital': 35,
+        'career': {
+            'level': 0,
+            'satisfaction': 0,
+            'income': 0
+        },
+        'economic': {
+            'wealth': 0,
+            'debt': 0,
+            'credit': 0
+        }
+    },
+    'cognitive': {
+        'knowledge': {
+            'academic': 0,
+            'practical': 0,
+            'creative': 0
+        },
+        'skills': {
+            'communication': 0,
+            'problemSolving': 0,
+            'leadership': 0
+        },
+        'memory': {
+            'shortTerm': 70,
+            'longTerm': 60,
+            'emotional': 60
+        }
+    },
+    'relational': {
+        'intimacy': {
+            'family': 75,
+            'friends': 15,
+            'romantic': 0
+        },
+        'network': {
+            'size': 5,
+            'quality': 25,
+            'diversity': 10
+        }
+    }
+}
+
+def _flatten(tree: Dict[str, Any], prefix: str = "") -> List[Tuple[str, Any]]:
+    """把嵌套属性展开为 (点分路径, 值) 列表"""
+    items = []
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.extend(_flatten(value, path + "."))
+        else:
+            items.append((path, value))
+    return items
+
+# 属性以扁平数组存储（SoA）：路径 -> 下标，初始化只需复制一次数组
+_FIELD_PATHS: Tuple[Tuple[str, ...], ...] = tuple(
+    tuple(path.split(".")) for path, _ in _flatten(_BASE_ATTRIBUTES)
+)
+_FIELD_INDEX: Dict[str, int] = {".".join(path): i for i, path in enumerate(_FIELD_PATHS)}
+_BASE_VALUES: Tuple[float, ...] = tuple(float(value) for _, value in _flatten(_BASE_ATTRIBUTES))
+
+_BASE_ARRAY = np.array(_BASE_VALUES, dtype=np.float64) if np is not None else None
+
+def _new_values():
+    """复制基础属性数组"""
+    if np is not None:
+        return _BASE_ARRAY.copy()
+    return list(_BASE_VALUES)
+
+def _sparse_delta(adjustments: Dict[str, Any]):
+    """把调整表转换为稀疏增量 (下标, 增量)，忽略模板中不存在的属性"""
+    pairs = [
+        (_FIELD_INDEX[path], float(delta))
+        for path, delta in _flatten(adjustments)
+        if path in _FIELD_INDEX and delta
+    ]
+    indices = tuple(index for index, _ in pairs)
+    deltas = tuple(delta for _, delta in pairs)
+    if np is not None:
+        return np.array(indices, dtype=np.intp), np.array(deltas, dtype=np.float64)
+    return indices, deltas
+
+def _add_delta(values, delta):
+    """把稀疏增量加到属性数组上"""
+    indices, deltas = delta
+    if np is not None and isinstance(values, np.ndarray):
+        values[indices] += deltas
+    else:
+        for index, value in zip(indices, deltas):
+            values[index] += value
+
+# 预序列化的基础模板，pickle.loads 克隆比逐层重建或 deepcopy 快
+_BASE_BLOB = pickle.dumps(_BASE_ATTRIBUTES, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _unflatten(values) -> Dict[str, Any]:
+    """克隆基础模板，只写回与基础值不同的属性（整数值保持为int）"""
+    tree = pickle.loads(_BASE_BLOB)
+    if np is not None and isinstance(values, np.ndarray):
+        changed = np.flatnonzero(values != _BASE_ARRAY).tolist()
+        values = values.tolist()
+    else:
+        changed = [i for i, (value, base) in enumerate(zip(values, _BASE_VALUES)) if value != base]
+    for index in changed:
+        path = _FIELD_PATHS[index]
+        node = tree
+        for key in path[:-1]:
+            node = node[key]
+        value = values[index]
+        node[path[-1]] = int(value) if value.is_integer() else value
+    return tree
+
+# 家庭背景属性调整
+_FAMILY_ADJUSTMENTS = {
+    'poor': {
+        'social': {'socialCapital': -20, 'economic': {'wealth': -30, 'debt': 20}},
+        'psychological': {'stress': 10, 'resilience': 5}
+    },
+    'middle': {
+        'social': {'socialCapital': 0, 'economic': {'wealth': 0, 'debt': 0}}
+    },
+    'wealthy': {
+        'social': {'socialCapital': 20, 'economic': {'wealth': 30, 'debt': -10}},
+        'psychological': {'happiness': 5, 'stress': -5}
+    }
+}
+
+# 教育背景属性调整
+_EDUCATION_ADJUSTMENTS = {
+    'none': {
+        'cognitive': {'knowledge': {'academic': -20, 'practical': 0}},
+        'social': {'career': {'level': -10}}
+    },
+    'primary': {
+        'cognitive': {'knowledge': {'academic': -10, 'practical': 5}}
+    },
+    'secondary': {
+        'cognitive': {'knowledge': {'academic': 0, 'practical': 10}}
+    },
+    'college': {
+        'cognitive': {'knowledge': {'academic': 15, 'practical': 10}},
+        'social': {'career': {'level': 5}}
+    },
+    'graduate': {
+        'cognitive': {'knowledge': {'academic': 25, 'practical': 15}},
+        'social': {'career': {'level': 10}}
+    }
+}
+
+# 健康状况属性调整
+_HEALTH_ADJUSTMENTS = {
+    'poor': {
+        'physiological': {'health': -30, 'energy': -20, 'fitness': -25}
+    },
+    'average': {
+        'physiological': {'health': 0, 'energy': 0}
+    },
+    'good': {
+        'physiological': {'health': 10, 'energy': 10, 'fitness': 5}
+    },
+    'excellent': {
+        'physiological': {'health': 20, 'energy': 15, 'fitness': 10}
+    }
+}
+
+# 难度属性调整
+_DIFFICULTY_ADJUSTMENTS = {
+    'easy': {
+        'physiological': {'health': 10, 'energy': 10},
+        'social': {'economic': {'wealth': 20}}
+    },
+    'normal': {
+        # 默认属性，无调整
+    },
+    'hard': {
+        'physiological': {'health': -10, 'energy': -10},
+        'social': {'economic': {'wealth': -20, 'debt': 10}}
+    },
+    'nightmare': {
+        'physiological': {'health': -30, 'energy': -20},
+        'psychological': {'stress': 20, 'happiness': -15},
+        'social': {'economic': {'wealth': -50, 'debt': 30}}
+    }
+}
+
+def _flatten_paths(adjustments: Dict[str, Any]) -> Tuple[Tuple[Tuple[str, ...], Any], ...]:
+    """把嵌套调整表预展开为 (路径元组, 增量) 列表"""
+    return tuple((tuple(path.split(".")), delta) for path, delta in _flatten(adjustments))
+
+# 预展开的调整表：应用时只需沿路径定位并累加
+_FLAT_FAMILY_ADJUSTMENTS = {key: _flatten_paths(value) for key, value in _FAMILY_ADJUSTMENTS.items()}
+_FLAT_EDUCATION_ADJUSTMENTS = {key: _flatten_paths(value) for key, value in _EDUCATION_ADJUSTMENTS.items()}
+_FLAT_HEALTH_ADJUSTMENTS = {key: _flatten_paths(value) for key, value in _HEALTH_ADJUSTMENTS.items()}
+_FLAT_DIFFICULTY_ADJUSTMENTS = {key: _flatten_paths(value) for key, value in _DIFFICULTY_ADJUSTMENTS.items()}
+
+# 人生阶段分界年龄（age < 分界值 即属于前一阶段）
+_STAGE_AGES = (1, 3, 13, 20, 35, 50, 65)
+_STAGE_NAMES = ('infant', 'toddler', 'childhood', 'teen', 'youngAdult', 'adult', 'middleAge', 'senior')
+
+# 成长模拟：各属性随成长系数线性增长的上限
+_GROWTH_INDICES = (
+    _FIELD_INDEX['cognitive.knowledge.practical'],
+    _FIELD_INDEX['social.socialCapital'],
+    _FIELD_INDEX['physiological.fitness'],
+)
+_GROWTH_COEFS = (20.0, 10.0, 10.0)
+_IDX_ACADEMIC = _FIELD_INDEX['cognitive.knowledge.academic']
+_IDX_CAREER_LEVEL = _FIELD_INDEX['social.career.level']
+
+if np is not None:
+    _GROWTH_INDEX_ARRAY = np.array(_GROWTH_INDICES, dtype=np.intp)
+    _GROWTH_COEF_ARRAY = np.array(_GROWTH_COEFS, dtype=np.float64)
+
+# 特质组合缓存上限
+_SPECIALIZED_CACHE_SIZE = 256
+
 class CharacterInitializer:
     """角色状态初始化器"""
     
     def __init__(self):
         self.base_attributes = self._load_base_attributes()
+        # 各家庭背景的初始属性数组，构造时应用一次增量，初始化时只需复制
+        self._family_values = {}
+        for background, adjustments in _FAMILY_ADJUSTMENTS.items():
+            values = _new_values()
+            _add_delta(values, _sparse_delta(adjustments))
+            self._family_values[background] = values
+        # 按特质组合缓存的初始属性数组
+        self._specialized_values = {}
     
     def _load_base_attributes(self) -> Dict[str, Any]:
         """加载基础属性配置"""
-        return {
-            'physiological': {
-                'health': 85,
-                'energy': 75,
-                'appearance': 55,
-                'fitness': 65
-            },
-            'psychological': {
-                'openness': 55,
-                'conscientiousness': 55,
-                'extraversion': 55,
-                'agreeableness': 55,
-                'neuroticism': 45,
-                'happiness': 65,
-                'stress': 25,
-                'resilience': 55
-            },
-            'social': {
-                'socialCapital': 35,
-                'career': {
-                    'level': 0,
-                    'satisfaction': 0,
-                    'income': 0
-                },
-                'economic': {
-                    'wealth': 0,
-                    'debt': 0,
-                    'credit': 0
-                }
-            },
-            'cognitive': {
-                'knowledge': {
-                    'academic': 0,
-                    'practical': 0,
-                    'creative': 0
-                },
-                'skills': {
-                    'communication': 0,
-                    'problemSolving': 0,
-                    'leadership': 0
-                },
-                'memory': {
-                    'shortTerm': 70,
-                    'longTerm': 60,
-                    'emotional': 60
-                }
-            },
-            'relational': {
-                'intimacy': {
-                    'family': 75,
-                    'friends': 15,
-                    'romantic': 0
-                },
-                'network': {
-                    'size': 5,
-                    'quality': 25,
-                    'diversity': 10
-                }
-            }
-        }
+        return pickle.loads(_BASE_BLOB)
     
     async def initialize_character_state(self, profile: LifeProfile) -> CharacterState:
-        """初始化角色状态"""
+        """初始化角色状态（兼容异步调用方）"""
+        return self.initialize_character_state_sync(profile)
+    
+    def initialize_character_state_sync(self, profile: LifeProfile) -> CharacterState:
+        """初始化角色状态（纯CPU计算，无需协程）"""
         
-        # 计算初始日期（出生日期 + 起始年龄）
-        birth_date = datetime.fromisoformat(profile.birthDate)
+        # 一次性读取档案字段
+        profile_id = profile.id
         starting_age_val = getattr(profile, 'startingAge', 0.0)
+        family_bg = getattr(profile, 'familyBackground', 'middle')
+        
+        # 计算初始日期（出生日期 + 起始年龄），按日期（不含时间）运算
+        birth_date = profile.birth_date_obj.date()
+        days_survived = int(starting_age_val * 365.25)
         
-        # 计算当前游戏日期
-        current_date_obj = birth_date + timedelta(days=int(starting_age_val * 365.25))
-        current_date_str = current_date_obj.isoformat().split('T')[0]
+        # 计算当前游戏日期（date.isoformat 即 YYYY-MM-DD）
+        current_date_obj = birth_date + timedelta(days=days_survived)
+        current_date_str = current_date_obj.isoformat()
         
         # 计算整数年龄
         age = current_date_obj.year - birth_date.year
         if (current_date_obj.month, current_date_obj.day) < (birth_date.month, birth_date.day):
             age -= 1
         
-        # 创建基础状态
-        base_dimensions = self.base_attributes.copy()
-        
-        # 根据初始特质调整属性
-        self._adjust_by_family_background(base_dimensions, getattr(profile, 'familyBackground', 'middle'))
-        
-        # 如果起始年龄大于0，进行额外的人生历练调整（模拟成长过程）
-        if starting_age_val > 0:
-            self._apply_growth_simulation(base_dimensions, starting_age_val)
+        # 创建基础状态：取同一特质组合的已调整属性数组，还原为嵌套字典
+        values = self._initial_values(family_bg, starting_age_val)
+        base_dimensions = _unflatten(values)
         
         # 创建初始状态
         character_state = CharacterState(
-            id=f"state_{profile.id}",
-            profileId=profile.id,
+            id=f"state_{profile_id}",
+            profileId=profile_id,
             currentDate=current_date_str,
             age=age,
             dimensions=base_dimensions,
@@ -116,88 +309,69 @@ class CharacterInitializer:
             lifeStage=self._determine_life_stage(age),
             totalEvents=0,
             totalDecisions=0,
-            daysSurvived=(current_date_obj - birth_date).days
+            daysSurvived=days_survived
         )
         
         return character_state
 
-    def _apply_growth_simulation(self, dimensions: Dict[str, Any], age: float):
-        """模拟成长过程中的属性变化"""
+    def _initial_values(self, background: str, starting_age: float):
+        """按 (家庭背景, 起始年龄) 缓存调整后的属性数组，同一组合只计算一次"""
+        key = (background, starting_age)
+        values = self._specialized_values.get(key)
+        if values is not None:
+            return values
+        
+        # 根据初始特质调整属性（家庭背景增量已预先应用）
+        family_values = self._family_values.get(background)
+        values = family_values.copy() if family_values is not None else _new_values()
+        
+        # 如果起始年龄大于0，进行额外的人生历练调整（模拟成长过程）
+        if starting_age > 0:
+            self._apply_growth_simulation(values, starting_age)
+        
+        # 缓存的数组在多次初始化间共享，设为只读
+        if np is not None and isinstance(values, np.ndarray):
+            values.flags.writeable = False
+        else:
+            values = tuple(values)
+        
+        if len(self._specialized_values) >= _SPECIALIZED_CACHE_SIZE:
+            self._specialized_values.pop(next(iter(self._specialized_values)))
+        self._specialized_values[key] = values
+        return values
+    
+    def _apply_growth_simulation(self, values, age: float):
+        """模拟成长过程中的属性变化（作用于扁平属性数组）"""
         # 简单模拟：随着年龄增长，认知和社会属性会提升
         growth_factor = min(age / 20.0, 1.0) # 20岁达到一个基础峰值
         
-        dimensions['cognitive']['knowledge']['practical'] += 20 * growth_factor
-        dimensions['social']['socialCapital'] += 10 * growth_factor
-        dimensions['physiological']['fitness'] += 10 * growth_factor
+        if np is not None and isinstance(values, np.ndarray):
+            values[_GROWTH_INDEX_ARRAY] += _GROWTH_COEF_ARRAY * growth_factor
+        else:
+            for index, coef in zip(_GROWTH_INDICES, _GROWTH_COEFS):
+                values[index] += coef * growth_factor
         
         if age >= 18:
-            dimensions['social']['career']['level'] = 10
-            dimensions['cognitive']['knowledge']['academic'] += 30
+            values[_IDX_CAREER_LEVEL] = 10
+            values[_IDX_ACADEMIC] += 30
     
     def _adjust_by_family_background(self, dimensions: Dict[str, Any], background: str):
         """根据家庭背景调整属性"""
-        adjustments = {
-            'poor': {
-                'social': {'socialCapital': -20, 'economic': {'wealth': -30, 'debt': 20}},
-                'psychological': {'stress': 10, 'resilience': 5}
-            },
-            'middle': {
-                'social': {'socialCapital': 0, 'economic': {'wealth': 0, 'debt': 0}}
-            },
-            'wealthy': {
-                'social': {'socialCapital': 20, 'economic': {'wealth': 30, 'debt': -10}},
-                'psychological': {'happiness': 5, 'stress': -5}
-            }
-        }
-        
-        if background in adjustments:
-            self._apply_adjustments(dimensions, adjustments[background])
+        flat = _FLAT_FAMILY_ADJUSTMENTS.get(background)
+        if flat:
+            self._apply_flat_adjustments(dimensions, flat)
     
     def _adjust_by_education(self, dimensions: Dict[str, Any], education: str):
         """根据教育背景调整属性"""
-        adjustments = {
-            'none': {
-                'cognitive': {'knowledge': {'academic': -20, 'practical': 0}},
-                'social': {'career': {'level': -10}}
-            },
-            'primary': {
-                'cognitive': {'knowledge': {'academic': -10, 'practical': 5}}
-            },
-            'secondary': {
-                'cognitive': {'knowledge': {'academic': 0, 'practical': 10}}
-            },
-            'college': {
-                'cognitive': {'knowledge': {'academic': 15, 'practical': 10}},
-                'social': {'career': {'level': 5}}
-            },
-            'graduate': {
-                'cognitive': {'knowledge': {'academic': 25, 'practical': 15}},
-                'social': {'career': {'level': 10}}
-            }
-        }
-        
-        if education in adjustments:
-            self._apply_adjustments(dimensions, adjustments[education])
+        flat = _FLAT_EDUCATION_ADJUSTMENTS.get(education)
+        if flat:
+            self._apply_flat_adjustments(dimensions, flat)
     
     def _adjust_by_health(self, dimensions: Dict[str, Any], health: str):
         """根据健康状况调整属性"""
-        adjustments = {
-            'poor': {
-                'physiological': {'health': -30, 'energy': -20, 'fitness': -25}
-            },
-            'average': {
-                'physiological': {'health': 0, 'energy': 0}
-            },
-            'good': {
-                'physiological': {'health': 10, 'energy': 10, 'fitness': 5}
-            },
-            'excellent': {
-                'physiological': {'health': 20, 'energy': 15, 'fitness': 10}
-            }
-        }
-        
-        if health in adjustments:
-            self._apply_adjustments(dimensions, adjustments[health])
+        flat = _FLAT_HEALTH_ADJUSTMENTS.get(health)
+        if flat:
+            self._apply_flat_adjustments(dimensions, flat)
     
     def _adjust_by_personality_traits(self, dimensions: Dict[str, Any], traits: Dict[str, Any]):
         """根据人格特质调整属性"""
@@ -224,27 +398,9 @@ class CharacterInitializer:
     
     def _adjust_by_difficulty(self, dimensions: Dict[str, Any], difficulty: str):
         """根据难度调整属性"""
-        adjustments = {
-            'easy': {
-                'physiological': {'health': 10, 'energy': 10},
-                'social': {'economic': {'wealth': 20}}
-            },
-            'normal': {
-                # 默认属性，无调整
-            },
-            'hard': {
-                'physiological': {'health': -10, 'energy': -10},
-                'social': {'economic': {'wealth': -20, 'debt': 10}}
-            },
-            'nightmare': {
-                'physiological': {'health': -30, 'energy': -20},
-                'psychological': {'stress': 20, 'happiness': -15},
-                'social': {'economic': {'wealth': -50, 'debt': 30}}
-            }
-        }
-        
-        if difficulty in adjustments:
-            self._apply_adjustments(dimensions, adjustments[difficulty])
+        flat = _FLAT_DIFFICULTY_ADJUSTMENTS.get(difficulty)
+        if flat:
+            self._apply_flat_adjustments(dimensions, flat)
     
     def _adjust_by_era(self, dimensions: Dict[str, Any], era: str):
         """根据时代背景调整属性"""
@@ -258,43 +414,24 @@ class CharacterInitializer:
     
     def _apply_adjustments(self, dimensions: Dict[str, Any], adjustments: Dict[str, Any]):
         """应用属性调整"""
-        for dimension, sub_adjustments in adjustments.items():
-            if dimension in dimensions:
-                if isinstance(sub_adjustments, dict):
-                    for sub_dimension, value in sub_adjustments.items():
-                        if isinstance(value, dict):
-                            # 嵌套属性
-                            for nested_key, nested_value in value.items():
-                                if sub_dimension in dimensions[dimension]:
-                                    if nested_key in dimensions[dimension][sub_dimension]:
-                                        # 确保目标值是数值类型
-                                        if isinstance(dimensions[dimension][sub_dimension][nested_key], (int, float)):
-                                            dimensions[dimension][sub_dimension][nested_key] += nested_value
-                        else:
-                            # 直接属性
-                            if sub_dimension in dimensions[dimension]:
-                                # 确保目标值是数值类型
-                                if isinstance(dimensions[dimension][sub_dimension], (int, float)):
-                                    dimensions[dimension][sub_dimension] += value
+        self._apply_flat_adjustments(dimensions, _flatten_paths(adjustments))
+    
+    def _apply_flat_adjustments(self, dimensions: Dict[str, Any], flat_adjustments):
+        """沿预展开路径累加调整，跳过不存在或非数值的属性"""
+        for path, delta in flat_adjustments:
+            node = dimensions
+            for key in path[:-1]:
+                node = node.get(key)
+                if not isinstance(node, dict):
+                    break
+            else:
+                value = node.get(path[-1])
+                if isinstance(value, (int, float)):
+                    node[path[-1]] = value + delta
     
     def _determine_life_stage(self, age: float) -> str:
         """确定人生阶段"""
-        if age < 1:
-            return 'infant'
-        elif age < 3:
-            return 'toddler'
-        elif age < 13:
-            return 'childhood'
-        elif age < 20:
-            return 'teen'
-        elif age < 35:
-            return 'youngAdult'
-        elif age < 50:
-            return 'adult'
-        elif age < 65:
-            return 'middleAge'
-        else:
-            return 'senior'
+        return _STAGE_NAMES[bisect.bisect_right(_STAGE_AGES, age)]
 
 # 全局角色初始化器实例
 character_initializer = CharacterInitializer()
\ No newline at end of file
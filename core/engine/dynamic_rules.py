@@ -5,12 +5,44 @@
 
 import json
 import os
+import pickle
 import hashlib
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, Tuple, Deque
 from dataclasses import dataclass, field
 from enum import Enum
 import threading
+import itertools
+from collections import deque
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# 读取规则文件的缓冲区大小
+RULES_READ_BUFFER = 1 << 20
+
+# 内存中保留的变更记录上限
+MAX_CHANGE_HISTORY = 10000
+# 保存到文件的最近变更条数
+SAVED_CHANGE_HISTORY = 100
+
+def _hash64(content: bytes) -> int:
+    """64位非加密哈希（仅用于变更检测）：优先xxh3，否则BLAKE2b"""
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(content)
+    return int.from_bytes(hashlib.blake2b(content, digest_size=8).digest(), 'big')
 
 class RuleStatus(Enum):
     """规则状态"""
@@ -55,11 +87,25 @@ class DynamicRuleManager:
         self.rules_path = rules_path
         self.rules: Dict[str, List[Dict]] = {}
         self.rule_status: Dict[str, RuleStatus] = {}
-        self.change_history: List[RuleChange] = []
+        # 规则ID索引（与 self.rules 中的规则为同一对象）
+        self._rule_index: Dict[str, Dict] = {}
+        # 有界变更记录，超出上限时丢弃最早的记录
+        self.change_history: Deque[RuleChange] = deque(maxlen=MAX_CHANGE_HISTORY)
+        self._change_total = 0
+        self._snapshot_change_total = 0
         self.versions: List[RuleVersion] = []
-        self.lock = threading.Lock()
+        # 可重入锁：更新回调在持锁期间执行，回调内可再次读取规则
+        self.lock = threading.RLock()
         self.update_callbacks: List[Callable] = []
         
+        # 活跃规则缓存：(状态版本, 结果)，任何规则或状态变更时递增版本
+        self._status_version = 0
+        self._active_cache: Optional[Tuple[int, Dict[str, List[Dict]]]] = None
+        # 各分类规则的哈希缓存，变更时只失效受影响的分类
+        self._category_checksums: Dict[str, int] = {}
+        # 最近一次版本快照对应的状态版本，未变更时不重复快照
+        self._snapshot_status_version = -1
+        
         # 加载规则
         self._load_rules()
         
@@ -73,13 +119,10 @@ class DynamicRuleManager:
             total_rules = 0
             self.rules = {}
             
-            # 加载全面规则库
+            # 加载全面规则库（按分类流式读取）
             if os.path.exists(comprehensive_file):
-                with open(comprehensive_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                categories = data.get('categories', {})
-                for cat_name, cat_data in categories.items():
+                extras = {}
+                for cat_name, cat_data in self._read_comprehensive_rules(comprehensive_file, extras):
                     if cat_name not in self.rules:
                         self.rules[cat_name] = []
                     
@@ -99,19 +142,22 @@ class DynamicRuleManager:
                             total_rules += 1
                 
                 # 元规则
-                if 'meta_rules' in data:
-                    self.rules['meta'] = data['meta_rules'].get('rules', [])
+                if 'meta_rules' in extras:
+                    self.rules['meta'] = extras['meta_rules'].get('rules', [])
                     for rule in self.rules['meta']:
                         self.rule_status[rule['id']] = RuleStatus.ACTIVE
                         total_rules += 1
                 
                 # 特殊条件规则
-                if 'special_conditions' in data:
-                    self.rules['special'] = data['special_conditions'].get('rules', [])
+                if 'special_conditions' in extras:
+                    self.rules['special'] = extras['special_conditions'].get('rules', [])
                     for rule in self.rules['special']:
                         self.rule_status[rule['id']] = RuleStatus.ACTIVE
                         total_rules += 1
             
+            self._rebuild_rule_index()
+            self._invalidate_active_rules()
+            self._mark_rules_changed()
             print(f"[DynamicRuleManager] 加载了 {total_rules} 条规则")
             
             # 创建初始版本
@@ -120,6 +166,49 @@ class DynamicRuleManager:
         except Exception as e:
             print(f"[DynamicRuleManager] 规则加载失败: {e}")
             self.rules = {}
+            self._rule_index = {}
+            self._invalidate_active_rules()
+            self._mark_rules_changed()
+    
+    def _read_comprehensive_rules(self, filepath: str, extras: Dict[str, Any]):
+        """读取全面规则库，逐个产出 (分类名, 分类内容)，meta_rules/special_conditions 写入 extras
+        
+        安装了 ijson 时单次遍历文件、逐个分类构建，不必一次性构建整棵JSON树；否则回退到 json.load。
+        extras 在迭代结束后才完整。
+        """
+        extra_keys = ('meta_rules', 'special_conditions')
+        
+        if ijson is None:
+            data = self._read_json(filepath)
+            extras.update((key, data[key]) for key in extra_keys if key in data)
+            yield from data.get('categories', {}).items()
+            return
+        
+        with open(filepath, 'rb', buffering=RULES_READ_BUFFER) as f:
+            target = None  # 正在构建的值：('categories', 分类名) 或 (附加段名, None)
+            builder = None
+            depth = 0
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if target is not None:
+                    if builder is None:
+                        builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                    if event in ('start_map', 'start_array'):
+                        depth += 1
+                    elif event in ('end_map', 'end_array'):
+                        depth -= 1
+                    if depth == 0:
+                        section, name = target
+                        if section == 'categories':
+                            yield name, builder.value
+                        else:
+                            extras[section] = builder.value
+                        target = builder = None
+                elif event == 'map_key':
+                    if prefix == 'categories':
+                        target = ('categories', value)
+                    elif prefix == '' and value in extra_keys:
+                        target = (value, None)
     
     def add_rule(self, rule: Dict, category: str, reason: str = "") -> bool:
         """添加新规则"""
@@ -141,6 +230,9 @@ class DynamicRuleManager:
                 
                 self.rules[category].append(rule)
                 self.rule_status[rule_id] = RuleStatus.ACTIVE
+                self._rule_index[rule_id] = rule
+                self._invalidate_active_rules()
+                self._mark_rules_changed(category)
                 
                 # 记录变更
                 change = RuleChange(
@@ -150,7 +242,7 @@ class DynamicRuleManager:
                     new_value=rule,
                     reason=reason
                 )
-                self.change_history.append(change)
+                self._record_change(change)
                 
                 # 通知更新
                 self._notify_update(change)
@@ -178,6 +270,11 @@ class DynamicRuleManager:
                 
                 old_rule['updated_at'] = datetime.now().isoformat()
                 old_rule['version'] = self._increment_version(old_rule.get('version', '1.0'))
+                if old_rule.get('id') != rule_id:
+                    self._rule_index.pop(rule_id, None)
+                    self._rule_index[old_rule.get('id')] = old_rule
+                self._invalidate_active_rules()
+                self._mark_rules_changed(old_value.get('category'))
                 
                 # 记录变更
                 change = RuleChange(
@@ -188,7 +285,7 @@ class DynamicRuleManager:
                     new_value=old_rule,
                     reason=reason
                 )
-                self.change_history.append(change)
+                self._record_change(change)
                 
                 # 通知更新
                 self._notify_update(change)
@@ -215,6 +312,9 @@ class DynamicRuleManager:
                     ]
                 
                 del self.rule_status[rule_id]
+                self._rule_index.pop(rule_id, None)
+                self._invalidate_active_rules()
+                self._mark_rules_changed(category)
                 
                 # 记录变更
                 change = RuleChange(
@@ -224,7 +324,7 @@ class DynamicRuleManager:
                     old_value=old_rule,
                     reason=reason
                 )
-                self.change_history.append(change)
+                self._record_change(change)
                 
                 # 通知更新
                 self._notify_update(change)
@@ -242,6 +342,7 @@ class DynamicRuleManager:
                 return False
             
             self.rule_status[rule_id] = RuleStatus.ACTIVE
+            self._invalidate_active_rules()
             
             change = RuleChange(
                 change_id=self._generate_change_id(),
@@ -249,7 +350,7 @@ class DynamicRuleManager:
                 update_type=UpdateType.ENABLE,
                 reason=reason
             )
-            self.change_history.append(change)
+            self._record_change(change)
             self._notify_update(change)
             
             return True
@@ -261,6 +362,7 @@ class DynamicRuleManager:
                 return False
             
             self.rule_status[rule_id] = RuleStatus.DISABLED
+            self._invalidate_active_rules()
             
             change = RuleChange(
                 change_id=self._generate_change_id(),
@@ -268,22 +370,36 @@ class DynamicRuleManager:
                 update_type=UpdateType.DISABLE,
                 reason=reason
             )
-            self.change_history.append(change)
+            self._record_change(change)
             self._notify_update(change)
             
             return True
     
     def get_active_rules(self) -> Dict[str, List[Dict]]:
-        """获取所有活跃规则"""
-        active_rules = {}
+        """获取所有活跃规则（按状态版本缓存，调用方只读）"""
+        cache = self._active_cache
+        if cache is not None and cache[0] == self._status_version:
+            return cache[1]
         
-        for category, rules in self.rules.items():
-            active_rules[category] = [
-                rule for rule in rules
-                if self.rule_status.get(rule.get('id')) == RuleStatus.ACTIVE
-            ]
-        
-        return active_rules
+        with self.lock:
+            cache = self._active_cache
+            if cache is not None and cache[0] == self._status_version:
+                return cache[1]
+            
+            active_rules = {}
+            for category, rules in self.rules.items():
+                active_rules[category] = [
+                    rule for rule in rules
+                    if self.rule_status.get(rule.get('id')) == RuleStatus.ACTIVE
+                ]
+            
+            self._active_cache = (self._status_version, active_rules)
+            return active_rules
+    
+    def _invalidate_active_rules(self):
+        """规则或状态变更后使活跃规则缓存失效"""
+        self._status_version += 1
+        self._active_cache = None
     
     def get_rule(self, rule_id: str) -> Optional[Dict]:
         """获取特定规则"""
@@ -294,11 +410,25 @@ class DynamicRuleManager:
     
     def _find_rule(self, rule_id: str) -> Optional[Dict]:
         """查找规则"""
+        return self._rule_index.get(rule_id)
+    
+    def _rebuild_rule_index(self):
+        """按分类顺序重建规则ID索引（同ID保留首个，与顺序查找一致）"""
+        index: Dict[str, Dict] = {}
         for rules in self.rules.values():
             for rule in rules:
-                if rule.get('id') == rule_id:
-                    return rule
-        return None
+                index.setdefault(rule.get('id'), rule)
+        self._rule_index = index
+    
+    def _record_change(self, change: RuleChange):
+        """记录变更（累计总数，用于计算溢出条数与版本增量）"""
+        self.change_history.append(change)
+        self._change_total += 1
+    
+    def _changes_since(self, change_total: int) -> List[RuleChange]:
+        """返回累计序号 change_total 之后仍保留在内存中的变更"""
+        count = min(self._change_total - change_total, len(self.change_history))
+        return list(itertools.islice(self.change_history, len(self.change_history) - count, None))
     
     def _generate_change_id(self) -> str:
         """生成变更ID"""
@@ -316,28 +446,64 @@ class DynamicRuleManager:
             return '1.1'
     
     def _create_version(self, reason: str = "") -> RuleVersion:
-        """创建规则版本快照"""
+        """创建规则版本快照（规则自上次快照后未变更时复用最新版本）"""
+        if self.versions and self._snapshot_status_version == self._status_version:
+            return self.versions[-1]
+        
         checksum = self._calculate_checksum()
         
         version = RuleVersion(
             version_id=f"v{len(self.versions) + 1}",
             rules_snapshot=self._deep_copy_rules(),
             timestamp=datetime.now().isoformat(),
-            changes=list(self.change_history),
+            changes=self._changes_since(self._snapshot_change_total),
             checksum=checksum
         )
         
         self.versions.append(version)
+        self._snapshot_status_version = self._status_version
+        self._snapshot_change_total = self._change_total
         return version
     
     def _calculate_checksum(self) -> str:
-        """计算规则库校验和"""
-        content = json.dumps(self.rules, sort_keys=True)
-        return hashlib.md5(content.encode()).hexdigest()[:8]
+        """计算规则库校验和：各分类哈希异或合并，只重算变更过的分类"""
+        checksum = 0
+        for category, rules in self.rules.items():
+            digest = self._category_checksums.get(category)
+            if digest is None:
+                # 分类名参与哈希，规则在分类间移动也会改变校验和
+                digest = _hash64(category.encode() + b'\0' + self._canonical_bytes(rules))
+                self._category_checksums[category] = digest
+            checksum ^= digest
+        return f"{checksum:016x}"
+    
+    @staticmethod
+    def _canonical_bytes(value: Any) -> bytes:
+        """按键排序序列化，作为哈希输入"""
+        if orjson is not None:
+            return orjson.dumps(value, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(value, sort_keys=True).encode()
+    
+    def _mark_rules_changed(self, category: Optional[str] = None):
+        """使分类哈希缓存失效（未指定分类时全部失效）"""
+        if category is None:
+            self._category_checksums.clear()
+        else:
+            self._category_checksums.pop(category, None)
     
-    def _deep_copy_rules(self) -> Dict[str, List[Dict]]:
-        """深拷贝规则"""
-        return json.loads(json.dumps(self.rules))
+    @staticmethod
+    def _read_json(filepath: str) -> Any:
+        """读取JSON文件（安装了orjson时直接解析字节）"""
+        if orjson is not None:
+            with open(filepath, 'rb', buffering=RULES_READ_BUFFER) as f:
+                return orjson.loads(f.read())
+        with open(filepath, 'r', encoding='utf-8', buffering=RULES_READ_BUFFER) as f:
+            return json.load(f)
+    
+    def _deep_copy_rules(self, rules: Optional[Dict[str, List[Dict]]] = None) -> Dict[str, List[Dict]]:
+        """深拷贝规则（pickle往返比JSON序列化或 copy.deepcopy 快，且保留原始类型）"""
+        return pickle.loads(pickle.dumps(self.rules if rules is None else rules,
+                                         protocol=pickle.HIGHEST_PROTOCOL))
     
     def register_update_callback(self, callback: Callable):
         """注册更新回调"""
@@ -356,22 +522,28 @@ class DynamicRuleManager:
         filepath = filepath or os.path.join(self.rules_path, "user_rules.json")
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'rules': self.rules,
-                    'status': {k: v.value for k, v in self.rule_status.items()},
-                    'history': [
-                        {
-                            'change_id': c.change_id,
-                            'rule_id': c.rule_id,
-                            'update_type': c.update_type.value,
-                            'timestamp': c.timestamp,
-                            'reason': c.reason
-                        }
-                        for c in self.change_history[-100:]  # 只保存最近100条
-                    ],
-                    'saved_at': datetime.now().isoformat()
-                }, f, ensure_ascii=False, indent=2)
+            payload = {
+                'rules': self.rules,
+                'status': {k: v.value for k, v in self.rule_status.items()},
+                'history': [
+                    {
+                        'change_id': c.change_id,
+                        'rule_id': c.rule_id,
+                        'update_type': c.update_type.value,
+                        'timestamp': c.timestamp,
+                        'reason': c.reason
+                    }
+                    for c in self._changes_since(self._change_total - SAVED_CHANGE_HISTORY)
+                ],
+                'saved_at': datetime.now().isoformat()
+            }
+            
+            if orjson is not None:
+                with open(filepath, 'wb') as f:
+                    f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            else:
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, indent=2)
             
             print(f"[DynamicRuleManager] 规则已保存到 {filepath}")
             return True
@@ -388,8 +560,7 @@ class DynamicRuleManager:
             if not os.path.exists(filepath):
                 return False
             
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = self._read_json(filepath)
             
             # 合并用户规则
             for category, rules in data.get('rules', {}).items():
@@ -401,10 +572,13 @@ class DynamicRuleManager:
                     # 不覆盖系统规则
                     if not self._find_rule(rule_id):
                         self.rules[category].append(rule)
+                        self._rule_index[rule_id] = rule
+                        self._mark_rules_changed(category)
                         self.rule_status[rule_id] = RuleStatus(
                             data.get('status', {}).get(rule_id, 'active')
                         )
             
+            self._invalidate_active_rules()
             print(f"[DynamicRuleManager] 已加载用户规则")
             return True
             
@@ -421,6 +595,7 @@ class DynamicRuleManager:
             'categories': list(self.rules.keys()),
             'version_count': len(self.versions),
             'change_count': len(self.change_history),
+            'dropped_change_count': self._change_total - len(self.change_history),
             'last_updated': self.change_history[-1].timestamp if self.change_history else None
         }
         return stats
@@ -430,12 +605,16 @@ class DynamicRuleManager:
         for version in self.versions:
             if version.version_id == version_id:
                 with self.lock:
-                    self.rules = self._deep_copy_rules() if version.rules_snapshot else self.rules
+                    # 从快照复制，回滚后的修改不影响历史版本
+                    self.rules = self._deep_copy_rules(version.rules_snapshot) if version.rules_snapshot else self.rules
                     self.rule_status = {
                         rule.get('id'): RuleStatus.ACTIVE
                         for rules in self.rules.values()
                         for rule in rules
                     }
+                    self._rebuild_rule_index()
+                    self._invalidate_active_rules()
+                    self._mark_rules_changed()
                     
                     # 记录回滚
                     change = RuleChange(
@@ -444,7 +623,7 @@ class DynamicRuleManager:
                         update_type=UpdateType.MODIFY,
                         reason=f"回滚到版本 {version_id}"
                     )
-                    self.change_history.append(change)
+                    self._record_change(change)
                     
                     print(f"[DynamicRuleManager] 已回滚到 {version_id}")
                     return True
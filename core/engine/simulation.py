@@ -44,11 +44,11 @@ class SimulationEngine:
         """推进时间模拟"""
         # 获取档案以获取生日
         profile = self.db_manager.get_profile(profile_id)
-        birth_date = datetime.fromisoformat(profile.birthDate) if profile else None
+        birth_date = profile.birth_date_obj if profile else None
         
         # 1. 使用AI生成未来事件
         model_level = self._determine_model_level(current_state)
-        ai_result = await self.ai_generator.generate_events(current_state, days, model_level)
+        ai_result = self.ai_generator.generate_events_sync(current_state, days, model_level)
         
         # 2. 使用规则校验优化事件
         validated_events = []
@@ -232,7 +232,7 @@ class DatabaseManager:
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             profile_id, event.eventDate, event.eventType, event.title,
-            event.description, event.narrative, json.dumps(event.choices),
+            event.description, event.narrative, json.dumps(event.choices, default=dict),
             json.dumps(event.impacts), event.isCompleted, event.selectedChoice,
             event.plausibility, event.emotionalWeight, event.createdAt
         ))
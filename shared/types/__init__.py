@@ -263,6 +263,10 @@ class FiveDimensionSystem:
 
 class LifeProfile:
     """角色档案 - 与前端 TypeScript 类型保持一致"""
+    __slots__ = ("id", "name", "gender", "birthDate", "birthLocation", "familyBackground",
+                 "initialPersonality", "createdAt", "startingAge", "era", "difficulty",
+                 "_birth_date_key", "_birth_date_obj")
+    
     def __init__(self, id: str, name: str, gender: str, birthDate: str, 
                  birthLocation: str, familyBackground: str = "middle",
                  initialPersonality: Optional[Dict[str, float]] = None, 
@@ -279,6 +283,16 @@ class LifeProfile:
         self.startingAge = startingAge
         self.era = era
         self.difficulty = difficulty
+        self._birth_date_key: Optional[str] = None
+        self._birth_date_obj: Optional[datetime] = None
+    
+    @property
+    def birth_date_obj(self) -> datetime:
+        """出生日期的datetime对象（按birthDate字符串缓存，只解析一次）"""
+        if self._birth_date_key != self.birthDate or self._birth_date_obj is None:
+            self._birth_date_obj = datetime.fromisoformat(self.birthDate)
+            self._birth_date_key = self.birthDate
+        return self._birth_date_obj
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -315,6 +329,10 @@ class LifeProfile:
 
 class CharacterState:
     """角色状态 - 与前端 TypeScript 类型保持一致"""
+    __slots__ = ("id", "profileId", "currentDate", "age", "dimensions", "location",
+                 "occupation", "education", "lifeStage", "totalEvents", "totalDecisions",
+                 "daysSurvived")
+    
     def __init__(self, id: str, profileId: str, currentDate: str, age: int,
                  dimensions: Dict[str, Any], location: str, occupation: str,
                  education: str, lifeStage: str, totalEvents: int,
@@ -348,6 +366,15 @@ class CharacterState:
             "daysSurvived": self.daysSurvived
         }
     
+    def __getstate__(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        """恢复快照（兼容启用 __slots__ 前以实例字典保存的快照）"""
+        for name in self.__slots__:
+            if name in state:
+                setattr(self, name, state[name])
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'CharacterState':
         """从字典创建实例"""
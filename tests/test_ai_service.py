@@ -0,0 +1,222 @@
+"""
+AI服务层单元测试
+"""
+
+import unittest
+import asyncio
+import tempfile
+import os
+import sys
+from unittest.mock import patch
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ai import device_compatibility as device_compatibility_module
+
+# 导入 ai_service 时即创建全局 AIService 并触发设备兼容性检查，需在导入前把兼容性缓存指向临时目录
+_compat_cache_dir = tempfile.mkdtemp()
+_compat_cache_patch = patch.object(
+    device_compatibility_module, "_COMPAT_CACHE_PATH", os.path.join(_compat_cache_dir, "compat.json")
+)
+_compat_cache_patch.start()
+device_compatibility_module.get_device_compatibility_checker.cache_clear()
+
+from core.ai.ai_service import AIService, AILevel, APIProvider, _StateView, _view
+from core.ai.llm_cache import LLMCompletionCache
+from core.ai.simple_generator import SimpleAIGenerator, GameEvent, _build_alias_table
+
+
+def tearDownModule():
+    """恢复兼容性缓存路径"""
+    import shutil
+    _compat_cache_patch.stop()
+    device_compatibility_module.get_device_compatibility_checker.cache_clear()
+    shutil.rmtree(_compat_cache_dir, ignore_errors=True)
+
+
+class _State:
+    age = 8
+    life_stage = "童年"
+    current_date = "1998-01-01"
+    dimensions = {"physiological": {"health": 80}}
+
+
+class TestAIService(unittest.TestCase):
+    """测试AI服务"""
+
+    def setUp(self):
+        """测试前准备"""
+        with patch.dict(os.environ, {}, clear=True):
+            self.service = AIService()
+
+    def test_state_view(self):
+        """测试角色状态视图提取"""
+        view = _view(_State())
+        self.assertEqual(view, _StateView(8, "童年", {"physiological": {"health": 80}}))
+        self.assertIs(_view(view), view)
+
+        default_view = _view(object())
+        self.assertEqual(default_view.age, 25)
+        self.assertEqual(default_view.life_stage, "青年")
+        self.assertIsNone(default_view.dimensions)
+
+    def test_generate_local_events(self):
+        """测试L0本地生成"""
+        result = asyncio.run(self.service.generate_events(_State(), num_events=2, force_level=AILevel.L0_LOCAL))
+
+        self.assertEqual(result["level"], "L0_LOCAL")
+        self.assertEqual(len(result["events"]), 2)
+        self.assertEqual(result["events"][0]["title"], "上小学")
+
+    def test_force_level_l0(self):
+        """测试强制L0级别不会被当前级别覆盖"""
+        self.service.set_level(AILevel.L2_FREE_API)
+        result = asyncio.run(self.service.generate_events(_State(), force_level=AILevel.L0_LOCAL))
+        self.assertEqual(result["level"], "L0_LOCAL")
+
+    def test_level_serialization(self):
+        """测试级别与提供商序列化"""
+        self.assertEqual(AILevel.L2_FREE_API.value_str, "L2")
+        self.assertIs(AILevel.from_value_str("L1"), AILevel.L1_LOCAL_MODEL)
+        self.assertRaises(ValueError, AILevel.from_value_str, "L9")
+        self.assertEqual(APIProvider.SILICON_FLOW.value_str, "silicon_flow")
+
+        status = self.service.get_status()
+        self.assertEqual(status["current_level"], "L0")
+        self.assertEqual(status["fallback_chain"][0], "local")
+
+    def test_api_without_keys_falls_back_to_local(self):
+        """测试无API密钥时降级到本地"""
+        result = asyncio.run(self.service.generate_events(_State(), force_level=AILevel.L2_FREE_API))
+        self.assertEqual(result["provider"], "local")
+
+    def test_set_api_key(self):
+        """测试设置API密钥刷新可用状态"""
+        self.assertFalse(self.service.get_status()["available_apis"]["zhipu"])
+
+        self.service.set_api_key("zhipu", "test-key")
+        self.assertTrue(self.service.get_status()["available_apis"]["zhipu"])
+
+        self.service.set_api_key("zhipu", "")
+        self.assertFalse(self.service.get_status()["available_apis"]["zhipu"])
+
+
+class TestSimpleAIGenerator(unittest.TestCase):
+    """测试简化版事件生成器"""
+
+    def test_generate_events(self):
+        """测试按天数生成模块级GameEvent事件"""
+        generator = SimpleAIGenerator()
+        result = asyncio.run(generator.generate_events(_State(), days=14, model_level="L0"))
+
+        self.assertEqual(len(result.candidateEvents), 3)
+        titles = {template["title"] for template in generator.event_templates["L0"]}
+        for event in result.candidateEvents:
+            self.assertIsInstance(event, GameEvent)
+            self.assertFalse(hasattr(event, "__dict__"))
+            self.assertIn(event.title, titles)
+            self.assertEqual(event.event_date, "1998-01-01")
+            self.assertTrue(70 <= event.plausibility <= 95)
+
+            self.assertIn(event.impacts[0]["change"], range(1, 6))
+
+        first = result.candidateEvents[0]
+        more = generator.generate_events_sync(_State(), days=14, model_level="L0").candidateEvents
+        ids = [event.id for event in result.candidateEvents + more]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(first.id.endswith("_1"))
+        self.assertEqual(first.created_at, first.updated_at)
+        self.assertEqual({event.created_at for event in result.candidateEvents}, {first.created_at})
+
+    def test_frozen_templates(self):
+        """测试模板冻结后事件共享只读选项，且仍可序列化"""
+        import json
+        generator = SimpleAIGenerator()
+        result = generator.generate_events_sync(_State(), days=0, model_level="L2")
+        event = result.candidateEvents[0]
+
+        template = next(t for t in generator.event_templates["L2"] if t["title"] == event.title)
+        self.assertIs(event.choices, template["choices"])
+        with self.assertRaises(TypeError):
+            event.choices[0]["text"] = "修改"
+        self.assertEqual(json.loads(json.dumps(event.choices, default=dict))[0]["text"],
+                         template["choices"][0]["text"])
+
+    def test_templates_shared(self):
+        """测试多个生成器共享同一份只读模板"""
+        self.assertIs(SimpleAIGenerator().event_templates, SimpleAIGenerator().event_templates)
+
+    def test_alias_table(self):
+        """测试别名表的抽样分布与权重成正比"""
+        weights = [0.2, 0.4, 0.3, 0.1]
+        prob, alias = _build_alias_table(weights)
+        n = len(weights)
+        distribution = [prob[i] / n for i in range(n)]
+        for i in range(n):
+            distribution[alias[i]] += (1.0 - prob[i]) / n
+        for expected, actual in zip(weights, distribution):
+            self.assertAlmostEqual(actual, expected / sum(weights))
+
+    def test_weighted_generate_events(self):
+        """测试按情感权重抽取模板"""
+        generator = SimpleAIGenerator()
+        result = generator.generate_events_sync(_State(), days=14, model_level="L9", weighted=True)
+        titles = {template["title"] for template in generator.event_templates["L1"]}
+        self.assertEqual(len(result.candidateEvents), 3)
+        self.assertTrue(all(event.title in titles for event in result.candidateEvents))
+
+    def test_generate_events_without_templates(self):
+        """测试模板为空时不生成事件"""
+        generator = SimpleAIGenerator()
+        generator.event_templates = {"L1": []}
+        result = generator.generate_events_sync(_State(), days=7)
+        self.assertEqual(result.candidateEvents, [])
+
+
+class TestLLMCompletionCache(unittest.TestCase):
+    """测试LLM补全缓存"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = LLMCompletionCache(db_path=os.path.join(self.temp_dir, "llm_cache.db"))
+
+    def tearDown(self):
+        """测试后清理"""
+        import shutil
+        self.cache.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_set_and_get(self):
+        """测试缓存读写"""
+        key = LLMCompletionCache.make_key("zhipu", "glm-4-flash", "prompt")
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.set(key, {"events": [{"title": "测试"}], "provider": "zhipu"})
+        self.assertEqual(self.cache.get(key)["events"][0]["title"], "测试")
+
+    def test_key_depends_on_model(self):
+        """测试缓存键区分模型"""
+        self.assertNotEqual(
+            LLMCompletionCache.make_key("zhipu", "glm-4-flash", "prompt"),
+            LLMCompletionCache.make_key("zhipu", "glm-4", "prompt")
+        )
+
+    def test_expired_entry(self):
+        """测试过期条目不返回"""
+        self.cache.ttl_seconds = -1
+        self.cache.set("key", {"events": []})
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_max_entries(self):
+        """测试超出容量时淘汰条目"""
+        self.cache.max_entries = 2
+        for i in range(4):
+            self.cache.set(f"key_{i}", {"index": i})
+        self.assertIsNone(self.cache.get("key_0"))
+        self.assertEqual(self.cache.get("key_3"), {"index": 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
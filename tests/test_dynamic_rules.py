@@ -0,0 +1,199 @@
+"""
+动态规则管理器单元测试
+"""
+
+import unittest
+import tempfile
+import json
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.engine import dynamic_rules as dynamic_rules_module
+from core.engine.dynamic_rules import DynamicRuleManager, RuleStatus
+
+
+def _write_rules(directory):
+    data = {
+        "version": "1.0",
+        "meta_rules": {"rules": [{"id": "META-1"}]},
+        "categories": {
+            "physiological": {
+                "subcategories": {
+                    "age": {"rules": [
+                        {"id": "PHY-1", "condition": "age >= 18", "effect": {"health": 0.02}},
+                        {"id": "PHY-2", "condition": "age >= 60", "effect": {"health": -0.05}},
+                    ]}
+                }
+            },
+            "social": {
+                "rules": [
+                    {"id": "SOC-1", "condition": "age >= 22", "effect": {"career": 1}},
+                ]
+            }
+        }
+    }
+    with open(os.path.join(directory, "comprehensive_rules.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+class TestDynamicRuleManager(unittest.TestCase):
+    """测试动态规则管理器"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        _write_rules(self.temp_dir)
+        self.manager = DynamicRuleManager(rules_path=self.temp_dir)
+
+    def tearDown(self):
+        """测试后清理"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_load_rules(self):
+        """测试加载分类与子分类规则"""
+        self.assertEqual([r["id"] for r in self.manager.rules["physiological"]], ["PHY-1", "PHY-2"])
+        self.assertEqual(self.manager.rules["physiological"][0]["subcategory"], "age")
+        self.assertEqual(self.manager.rule_status["SOC-1"], RuleStatus.ACTIVE)
+
+    @unittest.skipUnless(dynamic_rules_module.ijson, "ijson not installed")
+    def test_load_rules_streaming(self):
+        """测试 ijson 单次遍历读取与一次性读取结果一致"""
+        ijson = dynamic_rules_module.ijson
+        with patch.object(dynamic_rules_module, "ijson", None):
+            loaded = DynamicRuleManager(rules_path=self.temp_dir)
+        with patch.object(ijson, "parse", wraps=ijson.parse) as mock_parse:
+            streamed = DynamicRuleManager(rules_path=self.temp_dir)
+        mock_parse.assert_called_once()
+        self.assertEqual(streamed.rules, loaded.rules)
+        self.assertEqual(list(streamed.rules), ["physiological", "social", "meta"])
+        self.assertEqual(streamed.rule_status, loaded.rule_status)
+        self.assertEqual([r["id"] for r in streamed.rules["meta"]], ["META-1"])
+        self.assertIsInstance(streamed.get_rule("PHY-1")["effect"]["health"], float)
+
+    def test_active_rules_cached(self):
+        """测试活跃规则在状态不变时复用，变更后重建"""
+        first = self.manager.get_active_rules()
+        self.assertIs(self.manager.get_active_rules(), first)
+
+        self.assertTrue(self.manager.disable_rule("PHY-2"))
+        active = self.manager.get_active_rules()
+        self.assertIsNot(active, first)
+        self.assertEqual([r["id"] for r in active["physiological"]], ["PHY-1"])
+
+        self.assertTrue(self.manager.add_rule({"id": "SOC-2"}, "social"))
+        self.assertEqual([r["id"] for r in self.manager.get_active_rules()["social"]], ["SOC-1", "SOC-2"])
+
+        self.assertTrue(self.manager.delete_rule("SOC-1"))
+        self.assertEqual([r["id"] for r in self.manager.get_active_rules()["social"]], ["SOC-2"])
+
+    def test_rule_index(self):
+        """测试按ID索引查找规则并随增删改同步"""
+        self.assertIs(self.manager.get_rule("PHY-2"), self.manager.rules["physiological"][1])
+        self.assertIsNone(self.manager.get_rule("missing"))
+
+        self.manager.add_rule({"id": "NEW-1"}, "custom")
+        self.assertIs(self.manager.get_rule("NEW-1"), self.manager.rules["custom"][0])
+
+        self.assertTrue(self.manager.modify_rule("NEW-1", {"id": "NEW-2", "effect": {}}))
+        self.assertIsNone(self.manager._find_rule("NEW-1"))
+        self.assertEqual(self.manager._find_rule("NEW-2")["effect"], {})
+
+        self.assertTrue(self.manager.delete_rule("PHY-1"))
+        self.assertIsNone(self.manager._find_rule("PHY-1"))
+        self.assertFalse(self.manager.delete_rule("PHY-1"))
+
+    def test_rollback_restores_snapshot(self):
+        """测试回滚恢复快照内容，且快照不受后续修改影响"""
+        self.assertEqual(len(self.manager.versions), 1)
+        self.assertIs(self.manager._create_version(), self.manager.versions[0])
+
+        self.manager.add_rule({"id": "NEW-1"}, "custom")
+        self.manager.modify_rule("PHY-1", {"effect": {"health": 1}})
+        self.assertTrue(self.manager.rollback_to_version("v1"))
+
+        self.assertNotIn("custom", self.manager.rules)
+        self.assertIsNone(self.manager.get_rule("NEW-1"))
+        self.assertEqual(self.manager.get_rule("PHY-1")["effect"], {"health": 0.02})
+
+        self.manager.modify_rule("PHY-1", {"effect": {"health": 2}})
+        self.assertEqual(self.manager.versions[0].rules_snapshot["physiological"][0]["effect"], {"health": 0.02})
+
+    def test_save_and_load_user_rules(self):
+        """测试保存并重新加载用户规则（有无orjson结果一致）"""
+        self.manager.add_rule({"id": "USER-1", "name": "用户规则"}, "custom")
+        self.manager.disable_rule("USER-1")
+
+        for fake_orjson in (dynamic_rules_module.orjson, None):
+            with patch.object(dynamic_rules_module, "orjson", fake_orjson):
+                path = os.path.join(self.temp_dir, "user_rules.json")
+                self.assertTrue(self.manager.save_rules(path))
+                with open(path, encoding="utf-8") as f:
+                    self.assertIn("用户规则", f.read())
+
+                other = DynamicRuleManager(rules_path=self.temp_dir)
+                self.assertTrue(other.load_user_rules(path))
+                self.assertEqual(other._find_rule("USER-1")["name"], "用户规则")
+                self.assertEqual(other.rule_status["USER-1"], RuleStatus.DISABLED)
+                self.assertEqual(len(other._calculate_checksum()), 16)
+
+    def test_checksum(self):
+        """测试校验和随规则内容变化、按分类增量计算，并在安装xxhash时使用xxh3"""
+        checksum = self.manager._calculate_checksum()
+        self.assertEqual(checksum, self.manager.versions[0].checksum)
+        self.assertEqual(self.manager._calculate_checksum(), checksum)
+
+        self.manager.modify_rule("PHY-1", {"effect": {"health": 1}})
+        self.assertNotEqual(self.manager._calculate_checksum(), checksum)
+
+        # 只重算变更过的分类
+        self.manager.add_rule({"id": "SOC-2"}, "social")
+        self.assertEqual(set(self.manager._category_checksums), {"physiological", "meta"})
+        self.manager._calculate_checksum()
+        self.assertEqual(set(self.manager._category_checksums), {"physiological", "social", "meta"})
+
+        # 三个分类的哈希异或合并
+        fake_xxhash = SimpleNamespace(xxh3_64_intdigest=lambda content: 255)
+        with patch.object(dynamic_rules_module, "xxhash", fake_xxhash):
+            self.manager._mark_rules_changed()
+            self.assertEqual(self.manager._calculate_checksum(), "00000000000000ff")
+
+    def test_bounded_change_history(self):
+        """测试变更记录有界，版本只保存自上个版本以来的变更"""
+        with patch.object(dynamic_rules_module, "MAX_CHANGE_HISTORY", 3):
+            manager = DynamicRuleManager(rules_path=self.temp_dir)
+        for _ in range(2):
+            manager.disable_rule("PHY-1")
+            manager.enable_rule("PHY-1")
+
+        stats = manager.get_statistics()
+        self.assertEqual(stats["change_count"], 3)
+        self.assertEqual(stats["dropped_change_count"], 1)
+
+        manager.add_rule({"id": "NEW-1"}, "custom")
+        manager._create_version("测试")
+        self.assertEqual(manager.versions[0].changes, [])
+        self.assertEqual([c.rule_id for c in manager.versions[1].changes], ["PHY-1", "PHY-1", "NEW-1"])
+
+        manager.disable_rule("NEW-1")
+        manager.add_rule({"id": "NEW-2"}, "custom")
+        self.assertEqual([c.rule_id for c in manager._changes_since(manager._snapshot_change_total)],
+                         ["NEW-1", "NEW-2"])
+
+    def test_callback_reads_active_rules(self):
+        """测试更新回调内可读取活跃规则"""
+        seen = []
+        self.manager.register_update_callback(
+            lambda change: seen.append(len(self.manager.get_active_rules()["physiological"]))
+        )
+        self.manager.disable_rule("PHY-1")
+        self.assertEqual(seen, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,25 +2,48 @@
 本地模型加载策略单元测试
 """
 
+import io
 import unittest
 import tempfile
 import os
 import sys
 from unittest.mock import Mock, patch, MagicMock
 import json
+from dataclasses import replace, FrozenInstanceError
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.ai.local_model_loader import (
     LocalModelManager, ModelSize, ModelStatus, DeviceTier, 
-    ModelConfig, DeviceProfile
+    ModelConfig, DeviceProfile, estimate_offload_layers
 )
 from core.ai.model_dependencies import DependencyManager
 from core.ai.model_benchmark import ModelBenchmark, BenchmarkResult
 from core.ai.model_manager import ModelDownloadManager
+from core.ai import device_compatibility as device_compatibility_module
 from core.ai.device_compatibility import DeviceCompatibilityChecker, CompatibilityIssue
 
+_compat_cache_dir = None
+_compat_cache_patch = None
+
+def setUpModule():
+    """兼容性缓存写入临时目录，不触碰真实的 ~/.cache/life/compat.json"""
+    global _compat_cache_dir, _compat_cache_patch
+    _compat_cache_dir = tempfile.mkdtemp()
+    _compat_cache_patch = patch.object(
+        device_compatibility_module, "_COMPAT_CACHE_PATH", os.path.join(_compat_cache_dir, "compat.json")
+    )
+    _compat_cache_patch.start()
+    device_compatibility_module.get_device_compatibility_checker.cache_clear()
+
+def tearDownModule():
+    """恢复兼容性缓存路径"""
+    import shutil
+    _compat_cache_patch.stop()
+    device_compatibility_module.get_device_compatibility_checker.cache_clear()
+    shutil.rmtree(_compat_cache_dir, ignore_errors=True)
+
 class TestLocalModelLoader(unittest.TestCase):
     """测试本地模型加载器"""
     
@@ -52,6 +75,11 @@ class TestLocalModelLoader(unittest.TestCase):
         self.assertEqual(config.size, ModelSize.TINY)
         self.assertEqual(config.min_ram_gb, 1.5)
         self.assertEqual(config.quality_score, 60)
+        
+        # 配置不可变且可哈希
+        with self.assertRaises(FrozenInstanceError):
+            config.min_ram_gb = 2.0
+        self.assertIn(config, {config})
     
     def test_device_profile_creation(self):
         """测试设备档案创建"""
@@ -87,6 +115,48 @@ class TestLocalModelLoader(unittest.TestCase):
         self.assertEqual(manager.device_profile.total_ram_gb, 8.0)
         self.assertEqual(manager.device_profile.cpu_cores, 4)
     
+    @patch('core.ai.local_model_loader.psutil.virtual_memory')
+    def test_memory_reading_cached(self, mock_virtual_memory):
+        """测试内存读数在TTL内复用"""
+        from core.ai.local_model_loader import _get_mem
+        mock_virtual_memory.return_value = Mock(total=8 * 1024**3, available=4 * 1024**3)
+
+        self.assertEqual(_get_mem(refresh=True)["avail_gb"], 4.0)
+        self.model_manager._check_memory(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+        self.model_manager._check_memory(self.model_manager._find_model_by_name("phi-2-q4"))
+        self.assertEqual(mock_virtual_memory.call_count, 1)
+
+    def test_global_manager_is_lazy(self):
+        """测试全局管理器在首次访问时才创建"""
+        import core.ai.local_model_loader as loader
+        with patch.object(loader, "_local_model_manager", None), \
+                patch.object(loader, "LocalModelManager", return_value=self.model_manager) as mock_cls:
+            self.assertIsNone(loader._local_model_manager)
+            self.assertIs(loader.local_model_manager, self.model_manager)
+            self.assertIs(loader.local_model_manager, self.model_manager)
+            mock_cls.assert_called_once()
+
+    def test_gpu_summary(self):
+        """测试从兼容性检查器的GPU列表汇总设备GPU信息"""
+        from core.ai.local_model_loader import _gpu_summary
+        with patch.dict(os.environ):
+            os.environ.pop("CUDA_VISIBLE_DEVICES", None)
+            self.assertEqual(_gpu_summary([]), (False, 0, False, ()))
+            self.assertEqual(
+                _gpu_summary([{"vendor": "nvidia", "name": "RTX", "total_memory_mb": 8192, "free_memory_mb": 6000}]),
+                (True, 8.0, False, (8.0,))
+            )
+            self.assertEqual(_gpu_summary([{"vendor": "apple", "name": "Apple M2", "type": "integrated"}]),
+                             (False, 0, True, ()))
+
+            # 不同型号混插：显存按各卡分别记录，总量为各卡之和
+            mixed = [{"vendor": "nvidia", "name": "RTX 4090", "total_memory_mb": 24576},
+                     {"vendor": "nvidia", "name": "RTX 3060", "total_memory_mb": 12288}]
+            self.assertEqual(_gpu_summary(mixed), (True, 36.0, False, (24.0, 12.0)))
+
+            os.environ["CUDA_VISIBLE_DEVICES"] = "1"
+            self.assertEqual(_gpu_summary(mixed), (True, 12.0, False, (12.0,)))
+
     def test_model_config_initialization(self):
         """测试模型配置初始化"""
         self.assertIn(ModelSize.TINY, self.model_manager.model_configs)
@@ -141,7 +211,27 @@ class TestLocalModelLoader(unittest.TestCase):
         
         self.assertIsNotNone(recommended)
         self.assertEqual(recommended.size, ModelSize.TINY)
-    
+        self.assertEqual(recommended.quantization, "Q4_K_M")
+
+    def test_get_recommended_model_quantization(self):
+        """测试高端设备优先选择高精度K-quant模型"""
+        self.model_manager.device_profile = DeviceProfile(
+            tier=DeviceTier.HIGH_END,
+            total_ram_gb=16.0,
+            available_ram_gb=10.0,
+            cpu_cores=8,
+            has_gpu=False,
+            recommended_model=ModelSize.MEDIUM
+        )
+        self.assertEqual(self.model_manager.get_recommended_model().quantization, "Q5_K_M")
+
+        self.model_manager.device_profile = replace(
+            self.model_manager.device_profile, tier=DeviceTier.ULTRA, recommended_model=ModelSize.LARGE
+        )
+        recommended = self.model_manager.get_recommended_model()
+        self.assertEqual(recommended.quantization, "Q6_K")
+        self.assertAlmostEqual(recommended.min_ram_gb, 14.0 * 6.5 / 8 * 1.15, places=1)
+
     def test_get_status(self):
         """测试获取状态"""
         status = self.model_manager.get_status()
@@ -151,7 +241,211 @@ class TestLocalModelLoader(unittest.TestCase):
         self.assertIn("recommended_model", status)
         
         self.assertEqual(status["status"], ModelStatus.NOT_LOADED.value)
-    
+
+    def test_unload_keeps_warm_model(self):
+        """测试卸载后模型保留在热缓存并可快速恢复"""
+        self.model_manager.device_profile = replace(self.model_manager.device_profile, available_ram_gb=16.0)
+        config = self.model_manager._find_model_by_name("qwen-1.5b-chat-q4")
+        model = Mock()
+        self.model_manager.current_model = model
+        self.model_manager.current_config = config
+        self.model_manager.model_status = ModelStatus.READY
+
+        self.assertTrue(self.model_manager.unload_model())
+        model.reset.assert_called_once()
+        self.assertIn(config.path, self.model_manager._warm_cache)
+
+        # 热缓存命中时无需模型文件
+        self.assertTrue(self.model_manager.load_model(model_name=config.name))
+        self.assertIs(self.model_manager.current_model, model)
+        self.assertEqual(self.model_manager.model_status, ModelStatus.READY)
+        self.assertNotIn(config.path, self.model_manager._warm_cache)
+
+    def test_load_model_switches_and_reuses(self):
+        """测试已加载时按GGUF文件判断复用或切换模型"""
+        self.model_manager.device_profile = replace(self.model_manager.device_profile, available_ram_gb=16.0)
+        current = self.model_manager._find_model_by_name("qwen-1.5b-chat-q4")
+        other = self.model_manager._find_model_by_name("phi-2-q4")
+        model, other_model = Mock(), Mock()
+        self.model_manager.current_model = model
+        self.model_manager._on_model_ready(current)
+
+        # 同一文件的另一配置直接复用已加载的模型
+        alias = replace(current, name="qwen-1.5b-chat-q4-alias")
+        with patch.object(self.model_manager, "_find_model_by_name", return_value=alias):
+            self.assertTrue(self.model_manager.load_model(model_name=alias.name))
+        self.assertIs(self.model_manager.current_model, model)
+        self.assertEqual(self.model_manager.current_config, alias)
+
+        # 不同文件：当前模型移入热缓存，新模型从热缓存恢复
+        self.model_manager._warm_cache[other.path] = (other_model, other)
+        self.assertTrue(self.model_manager.load_model(model_name=other.name))
+        self.assertIs(self.model_manager.current_model, other_model)
+        self.assertIn(current.path, self.model_manager._warm_cache)
+
+    def test_estimate_offload_layers(self):
+        """测试按显存估算GPU卸载层数"""
+        config = self.model_manager._find_model_by_name("qwen-7b-chat-q4")
+        self.assertEqual(estimate_offload_layers(config, 0), 0)
+        self.assertEqual(estimate_offload_layers(config, 24.0), -1)
+
+        partial = estimate_offload_layers(config, 2.0)
+        self.assertGreater(partial, 0)
+        self.assertLess(partial, config.n_layers)
+
+        self.assertIn("n_gpu_layers", self.model_manager.get_status())
+
+    def test_generate_events_reuses_prefix_state(self):
+        """测试事件生成复用提示词前缀的KV状态"""
+        model = Mock()
+        model.save_state.return_value = "prefix-state"
+        model.create_completion.side_effect = lambda *args, **kwargs: iter(
+            [{"choices": [{"text": '[{"title": "上学"}]'}]}]
+        )
+        self.model_manager.current_model = model
+        self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+
+        state = Mock(age=8, life_stage="童年", dimensions={})
+        first = self.model_manager.generate_events(state)
+        second = self.model_manager.generate_events(state)
+
+        self.assertEqual(first["events"][0]["title"], "上学")
+        self.assertEqual(second["events"][0]["title"], "上学")
+        model.eval.assert_called_once()
+        model.save_state.assert_called_once()
+        model.load_state.assert_called_once_with("prefix-state")
+
+        self.model_manager.unload_model()
+        self.assertIsNone(self.model_manager._prefix_state)
+
+    def test_generate_events_restores_prefix_under_lock(self):
+        """测试前缀KV状态恢复在生成锁内进行，其他线程的生成无法插入"""
+        import threading
+        model = Mock()
+        model.save_state.return_value = "prefix-state"
+        model.create_completion.side_effect = lambda *args, **kwargs: iter(
+            [{"choices": [{"text": '[{"title": "上学"}]'}]}]
+        )
+        self.model_manager.current_model = model
+        self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+        self.model_manager._prefix_state = "prefix-state"
+
+        acquired = []
+
+        def try_acquire(*args):
+            thread = threading.Thread(
+                target=lambda: acquired.append(self.model_manager._generate_lock.acquire(blocking=False))
+            )
+            thread.start()
+            thread.join()
+
+        model.load_state.side_effect = try_acquire
+        self.model_manager.generate_events(Mock(age=8, life_stage="童年", dimensions={}))
+
+        self.assertEqual(acquired, [False])
+
+    def test_generate_events_truncated_json(self):
+        """测试输出被截断时返回解析错误"""
+        model = Mock()
+        model.create_completion.return_value = iter([{"choices": [{"text": '[{"title": "上'}]}])
+        self.model_manager.current_model = model
+        self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+
+        result = self.model_manager.generate_events(Mock(age=8, life_stage="童年", dimensions={}))
+
+        self.assertEqual(result["events"], [])
+        self.assertIn("解析失败", result["error"])
+        self.assertIn("grammar", model.create_completion.call_args.kwargs)
+
+    def test_generate_events_without_grammar_extracts_array(self):
+        """测试语法不可用时从带说明文字的输出中提取JSON数组"""
+        model = Mock()
+        model.create_completion.return_value = iter([{"choices": [{"text": '好的，事件如下：[{"title": "上学"}] 以上。'}]}])
+        self.model_manager.current_model = model
+        self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+
+        with patch.object(self.model_manager, '_get_events_grammar', return_value=None):
+            result = self.model_manager.generate_events(Mock(age=8, life_stage="童年", dimensions={}))
+
+        self.assertEqual(result["events"], [{"title": "上学"}])
+        self.assertIsNone(model.create_completion.call_args.kwargs["grammar"])
+
+    def test_events_root_rule_caps_count(self):
+        """测试事件语法的根规则限制数组长度"""
+        from core.ai.local_model_loader import _events_root_rule
+        self.assertEqual(_events_root_rule(1), 'root ::= "[" ws event  ws "]"\n')
+        self.assertEqual(_events_root_rule(3).count("event"), 3)
+
+    def test_idle_timer_unloads_model(self):
+        """测试空闲定时器到期后自动卸载模型"""
+        import time
+        self.model_manager.idle_timeout_seconds = 0.05
+        self.model_manager.current_model = Mock()
+        self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+        self.assertEqual(self.model_manager.model_status, ModelStatus.READY)
+
+        time.sleep(0.3)
+        self.assertEqual(self.model_manager.model_status, ModelStatus.NOT_LOADED)
+        self.assertIsNone(self.model_manager._idle_timer)
+
+    def test_idle_timer_rescheduled_under_lock(self):
+        """测试加载就绪与生成时在加载锁内重新安排空闲定时器"""
+        model = Mock()
+        model.create_completion.side_effect = lambda *args, **kwargs: iter([{"choices": [{"text": "好"}]}])
+        self.model_manager.current_model = model
+        held = []
+        with patch.object(self.model_manager, '_reschedule_idle_timer',
+                          side_effect=lambda *args: held.append(self.model_manager.lock.locked())):
+            self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+            self.model_manager.generate("你好")
+        self.assertEqual(held, [True, True])
+
+    def test_unload_waits_for_streaming_generate(self):
+        """测试生成流式输出途中的卸载与空闲触发不会重置正在解码的模型"""
+        import threading
+        model = Mock()
+        self.model_manager.current_model = model
+        self.model_manager._on_model_ready(self.model_manager._find_model_by_name("qwen-1.5b-chat-q4"))
+        self.model_manager.idle_timeout_seconds = 0
+        unloader = threading.Thread(target=self.model_manager.unload_model)
+        seen = []
+
+        def stream(*args, **kwargs):
+            yield {"choices": [{"text": "你"}]}
+            unloader.start()
+            unloader.join(0.1)
+            idle = threading.Thread(target=self.model_manager._idle_fire)
+            idle.start()
+            idle.join()
+            seen.append((model.reset.called, self.model_manager.model_status))
+            yield {"choices": [{"text": "好"}]}
+
+        model.create_completion.side_effect = stream
+        result = self.model_manager.generate("你好")
+        unloader.join()
+
+        self.assertEqual(result["text"], "你好")
+        self.assertEqual(seen, [(False, ModelStatus.READY)])
+        model.reset.assert_called_once()
+        self.assertEqual(self.model_manager.model_status, ModelStatus.NOT_LOADED)
+
+    def test_warm_cache_eviction(self):
+        """测试热缓存按数量淘汰最久未用的模型"""
+        self.model_manager.device_profile = replace(self.model_manager.device_profile, available_ram_gb=64.0)
+        for name in ("qwen-1.5b-chat-q4", "phi-2-q4", "qwen-3b-chat-q4"):
+            self.model_manager.current_model = Mock()
+            self.model_manager.current_config = self.model_manager._find_model_by_name(name)
+            self.model_manager.model_status = ModelStatus.READY
+            self.model_manager.unload_model()
+
+        self.assertEqual(
+            [config.name for _, config in self.model_manager._warm_cache.values()],
+            ["phi-2-q4", "qwen-3b-chat-q4"]
+        )
+
+        self.model_manager.clear_warm_cache()
+        self.assertEqual(len(self.model_manager._warm_cache), 0)
+
     def test_get_available_models(self):
         """测试获取可用模型列表"""
         models = self.model_manager.get_available_models()
@@ -176,17 +470,26 @@ class TestDependencyManager(unittest.TestCase):
         self.assertIsInstance(dep_manager.OPTIONAL_PACKAGES, dict)
     
     @patch('importlib.import_module')
-    def test_check_dependencies(self, mock_import):
+    @patch('importlib.util.find_spec')
+    def test_check_dependencies(self, mock_find_spec, mock_import):
         """测试依赖检查"""
-        # Mock导入成功
-        mock_import.return_value = Mock()
+        # Mock找到模块规格
+        mock_find_spec.return_value = Mock()
         
         dep_manager = DependencyManager()
         missing_required, missing_optional = dep_manager.check_dependencies()
         
         # 由于我们使用了mock，应该没有缺失的包
-        self.assertIsInstance(missing_required, list)
-        self.assertIsInstance(missing_optional, list)
+        self.assertEqual(missing_required, [])
+        self.assertEqual(missing_optional, [])
+        # 只查找规格，不执行模块代码
+        mock_import.assert_not_called()
+
+    @patch('importlib.util.find_spec', return_value=None)
+    def test_missing_dependencies(self, mock_find_spec):
+        """测试找不到模块时记为缺失"""
+        dep_manager = DependencyManager()
+        self.assertEqual(len(dep_manager.missing_required), len(DependencyManager.REQUIRED_PACKAGES))
 
 class TestModelBenchmark(unittest.TestCase):
     """测试模型基准测试"""
@@ -214,6 +517,198 @@ class TestModelBenchmark(unittest.TestCase):
         self.assertEqual(result.model_name, "test-model")
         self.assertTrue(result.success)
         self.assertEqual(result.tokens_per_second, 20.0)
+        if sys.version_info >= (3, 10):
+            self.assertFalse(hasattr(result, "__dict__"))
+
+    @patch('core.ai.model_benchmark.time.perf_counter', side_effect=[10.0, 12.0])
+    @patch('core.ai.model_benchmark.time.sleep')
+    def test_benchmark_model_uses_batch(self, mock_sleep, mock_perf_counter):
+        """测试基准测试一次提交全部提示词"""
+        self.model_manager.load_model.return_value = True
+        self.model_manager.generate.return_value = {"success": True, "text": "ok"}
+        self.model_manager.generate_batch.return_value = [
+            {"success": True, "text": "在学校交到了新朋友", "elapsed": 0.4, "ttft": 0.1, "tpot": 0.05, "tokens_used": 7,
+             "itl": [0.05] * 6},
+            {"success": True, "text": "e f", "elapsed": 0.2, "ttft": 0.3, "tpot": 0.15, "tokens_used": 3,
+             "itl": [0.1, 0.2]},
+        ]
+        config = Mock(size=ModelSize.TINY)
+        config.name = "qwen-1.5b-chat-q4"
+
+        result = self.benchmark.benchmark_model(config, test_prompts=["p1", "p2", "p3"], iterations=2)
+
+        self.assertTrue(result.success)
+        self.model_manager.generate_batch.assert_called_once()
+        self.assertEqual(self.model_manager.generate_batch.call_args.args[0], ["p1", "p2"])
+        self.assertAlmostEqual(result.first_token_time, 0.2)
+        self.assertAlmostEqual(result.avg_token_time, 0.1)
+        self.assertAlmostEqual(result.tokens_per_second, 10.0)
+        # 中文输出按模型token计数，而不是按空格切分
+        self.assertAlmostEqual(result.throughput_tokens_per_second, 5.0)
+        self.assertGreater(result.memory_usage_mb, 0)
+        self.assertAlmostEqual(result.p50_tpot, 0.05)
+        self.assertAlmostEqual(result.p99_tpot, 0.2)
+
+    @patch('core.ai.model_benchmark.time.sleep')
+    def test_warm_up_runs_once_per_model(self, mock_sleep):
+        """测试同一模型只预热一次，卸载后或强制时重新预热"""
+        self.model_manager.load_model.return_value = True
+        self.model_manager.generate.return_value = {"success": True, "text": "ok"}
+        config = Mock(size=ModelSize.TINY, path="qwen.gguf")
+        config.name = "qwen-1.5b-chat-q4"
+
+        self.assertTrue(self.benchmark.warm_up_model(config, warm_up_iterations=1))
+        self.assertTrue(self.benchmark.warm_up_model(config, warm_up_iterations=1))
+        self.assertEqual(self.model_manager.generate.call_count, 1)
+
+        self.benchmark.warm_up_model(config, warm_up_iterations=1, force=True)
+        self.assertEqual(self.model_manager.generate.call_count, 2)
+
+        # 卸载回调清除预热记录
+        unload_callback = self.model_manager.register_unload_callback.call_args.args[0]
+        unload_callback(config)
+        self.benchmark.warm_up_model(config, warm_up_iterations=1)
+        self.assertEqual(self.model_manager.generate.call_count, 3)
+
+    def test_save_results(self):
+        """测试保存结果为JSON（中文原样保留）"""
+        from core.ai import model_benchmark
+        self.benchmark.results = [
+            BenchmarkResult("qwen", "1.5B", 1.0, 0.1, 0.05, 20.0, 500.0, "写一首诗", 10, True)
+        ]
+        temp_dir = tempfile.mkdtemp()
+        filepath = os.path.join(temp_dir, "results.json")
+        try:
+            for module_orjson in (model_benchmark.orjson, None):
+                with patch.object(model_benchmark, "orjson", module_orjson):
+                    self.benchmark.save_results(filepath)
+                with open(filepath, encoding="utf-8") as f:
+                    content = f.read()
+                self.assertIn("写一首诗", content)
+                self.assertEqual(json.loads(content)[0]["tokens_per_second"], 20.0)
+        finally:
+            import shutil
+            shutil.rmtree(temp_dir)
+
+    def test_peak_memory_sampler(self):
+        """测试内存采样器在运行期间记录峰值"""
+        from core.ai.model_benchmark import _PeakMemorySampler
+        size = 64 * 2**20
+        with _PeakMemorySampler(interval=0.01) as sampler:
+            baseline = sampler.peak_uss
+            if baseline == 0:
+                self.skipTest("psutil not available")
+            data = bytearray(size)
+            data[::4096] = b"x" * len(data[::4096])  # 触发实际分配物理页
+            sampler._sample()
+            del data
+        # 释放后峰值仍保留分配期间的占用
+        self.assertGreaterEqual(sampler.peak_uss, baseline + size * 0.9)
+        self.assertFalse(sampler._thread.is_alive())
+
+    def test_peak_memory_sampler_all_gpus(self):
+        """测试显存采样统计所有GPU上本进程的占用（不受 CUDA_VISIBLE_DEVICES 影响）"""
+        from types import SimpleNamespace
+        from core.ai.model_benchmark import _PeakMemorySampler
+        pid = os.getpid()
+        processes = {
+            0: [SimpleNamespace(pid=pid + 1, usedGpuMemory=500)],
+            1: [SimpleNamespace(pid=pid, usedGpuMemory=300)],
+            2: [SimpleNamespace(pid=pid, usedGpuMemory=200)],
+        }
+        fake_pynvml = SimpleNamespace(
+            nvmlInit=lambda: None,
+            nvmlShutdown=lambda: None,
+            nvmlDeviceGetCount=lambda: 3,
+            nvmlDeviceGetHandleByIndex=lambda index: index,
+            nvmlDeviceGetComputeRunningProcesses=lambda handle: processes[handle],
+        )
+        with patch.dict(sys.modules, {"pynvml": fake_pynvml}):
+            with _PeakMemorySampler(interval=0.01) as sampler:
+                pass
+        self.assertEqual(sampler.peak_gpu, 500)
+
+    def _setup_models(self, total_ram_gb, gpu_count=0, gpu_vram_gb=8.0):
+        configs = {
+            "qwen-1.5b-chat-q4": Mock(min_ram_gb=1.2, size=ModelSize.TINY, params_b=1.8, quant_bits=4.5, n_layers=24),
+            "phi-2-q4": Mock(min_ram_gb=1.7, size=ModelSize.TINY, params_b=2.7, quant_bits=4.5, n_layers=32),
+        }
+        self.model_manager.get_available_models.return_value = [
+            {"name": name, "available": True} for name in configs
+        ]
+        self.model_manager._find_model_by_name.side_effect = lambda name: configs[name]
+        for name, config in configs.items():
+            config.name = name
+        self.model_manager.device_profile = Mock(cpu_cores=16, total_ram_gb=total_ram_gb, gpu_count=gpu_count,
+                                                 gpu_vram_gb=(gpu_vram_gb,) * gpu_count)
+        self.model_manager.models_dir = "models/"
+
+    def test_parallel_benchmark(self):
+        """测试多进程并行基准测试"""
+        from concurrent.futures import ThreadPoolExecutor
+        self._setup_models(total_ram_gb=16.0)
+
+        def fake_worker(models_dir, model_name, n_threads, iterations):
+            self.assertEqual(n_threads, 8)
+            return BenchmarkResult(model_name, "1.5B", 1.0, 0.1, 0.05, 20.0, 500.0, "", 0, True)
+
+        with patch("core.ai.model_benchmark.ProcessPoolExecutor",
+                   lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)), \
+                patch("core.ai.model_benchmark._benchmark_in_process", fake_worker):
+            results = self.benchmark.benchmark_all_models_parallel(workers=2)
+
+        self.assertEqual(sorted(r.model_name for r in results), ["phi-2-q4", "qwen-1.5b-chat-q4"])
+        self.assertEqual(len(self.benchmark.results), 2)
+
+    def test_parallel_benchmark_falls_back_to_serial(self):
+        """测试内存不足以同时加载时退回串行测试"""
+        self._setup_models(total_ram_gb=2.0)
+        with patch.object(self.benchmark, "benchmark_all_models", return_value=[]) as mock_serial:
+            self.benchmark.benchmark_all_models_parallel(workers=2)
+        mock_serial.assert_called_once()
+
+    def test_parallel_benchmark_pins_gpus(self):
+        """测试多GPU时每个进程绑定一块GPU"""
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
+        from core.ai.model_benchmark import _pin_gpu
+        self._setup_models(total_ram_gb=2.0, gpu_count=2)
+        pinned = []
+        env_lock = threading.Lock()  # 线程池中的初始化共享同一个 os.environ
+
+        def fake_pin(gpu_ids):
+            with env_lock, patch.dict(os.environ):
+                _pin_gpu(gpu_ids)
+                pinned.append(int(os.environ["CUDA_VISIBLE_DEVICES"]))
+                self.assertEqual(os.environ["CUDA_DEVICE_ORDER"], "PCI_BUS_ID")
+
+        def fake_worker(models_dir, model_name, n_threads, iterations):
+            return BenchmarkResult(model_name, "1.5B", 1.0, 0.1, 0.05, 20.0, 500.0, "", 0, True)
+
+        with patch("core.ai.model_benchmark.ProcessPoolExecutor",
+                   lambda max_workers, mp_context, **kwargs: ThreadPoolExecutor(max_workers, **kwargs)), \
+                patch("core.ai.model_benchmark._pin_gpu", fake_pin), \
+                patch("core.ai.model_benchmark._benchmark_in_process", fake_worker):
+            results = self.benchmark.benchmark_all_models_parallel()
+
+        self.assertEqual(len(results), 2)
+        self.assertTrue(set(pinned) <= {0, 1})
+        self.assertEqual(len(pinned), len(set(pinned)))
+
+    def test_parallel_benchmark_single_gpu_serial(self):
+        """测试只有一块GPU且启用卸载时串行测试，避免多个进程争抢同一块显存"""
+        self._setup_models(total_ram_gb=16.0, gpu_count=1)
+        self.model_manager._get_n_gpu_layers.return_value = 20
+        with patch.object(self.benchmark, "benchmark_all_models", return_value=[]) as mock_serial:
+            self.benchmark.benchmark_all_models_parallel(workers=2)
+        mock_serial.assert_called_once()
+
+    def test_parallel_benchmark_gpu_checks_host_ram(self):
+        """测试多GPU时显存放不下的层仍计入主机内存，内存不足时退回串行测试"""
+        self._setup_models(total_ram_gb=2.0, gpu_count=2, gpu_vram_gb=0.1)
+        with patch.object(self.benchmark, "benchmark_all_models", return_value=[]) as mock_serial:
+            self.benchmark.benchmark_all_models_parallel()
+        mock_serial.assert_called_once()
 
 class TestModelDownloadManager(unittest.TestCase):
     """测试模型下载管理器"""
@@ -244,6 +739,18 @@ class TestModelDownloadManager(unittest.TestCase):
         
         self.assertIsNone(model_info)
     
+    def test_migrates_legacy_filenames(self):
+        """测试旧文件名下已下载的模型被迁移到当前文件名"""
+        import shutil
+        shutil.rmtree(self.temp_dir)
+        os.makedirs(self.temp_dir)
+        with open(os.path.join(self.temp_dir, "phi-2-q4.gguf"), "wb") as f:
+            f.write(b"gguf")
+        
+        manager = ModelDownloadManager(models_dir=self.temp_dir)
+        self.assertTrue(manager.is_model_downloaded("phi-2-q4"))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "phi-2-q4.gguf")))
+    
     def test_is_model_downloaded(self):
         """测试模型下载状态检查"""
         # 模型文件不存在，应该返回False
@@ -261,6 +768,205 @@ class TestModelDownloadManager(unittest.TestCase):
         
         self.assertEqual(status["total_models"], len(self.download_manager.MODEL_REPOSITORIES))
 
+    def test_downloaded_models_cache(self):
+        """测试已下载模型列表按目录mtime缓存"""
+        self.assertEqual(self.download_manager.get_downloaded_models(), [])
+
+        filename = self.download_manager.get_model_info("qwen-1.5b-chat-q4")["filename"]
+        with open(os.path.join(self.temp_dir, filename), "wb") as f:
+            f.write(b"gguf")
+        # 强制更新目录mtime，避免文件系统时间粒度导致缓存未失效
+        os.utime(self.temp_dir, ns=(0, os.stat(self.temp_dir).st_mtime_ns + 1))
+        self.assertEqual([m["name"] for m in self.download_manager.get_downloaded_models()], ["qwen-1.5b-chat-q4"])
+
+        with patch('pathlib.Path.stat', return_value=os.stat(self.temp_dir)) as mock_stat:
+            self.assertEqual(len(self.download_manager.get_downloaded_models()), 1)
+            self.assertEqual(mock_stat.call_count, 1)  # 只检查目录，不再逐个stat模型文件
+
+        self.assertTrue(self.download_manager.delete_model("qwen-1.5b-chat-q4"))
+        self.assertEqual(self.download_manager.get_downloaded_models(), [])
+
+    def _mock_response(self, data):
+        response = Mock()
+        response.headers = {"content-length": str(len(data))}
+        response.raw = io.BytesIO(data)
+        return response
+
+    @patch('core.ai.model_manager.requests.Session.head', return_value=Mock(headers={}))
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_verifies_sha256(self, mock_get, mock_head):
+        """测试下载时流式校验SHA-256"""
+        import hashlib
+        data = b"gguf-model-bytes"
+        model_info = {"url": "https://example.com/m.gguf", "filename": "m.gguf", "size_mb": 0,
+                      "sha256": hashlib.sha256(data).hexdigest()}
+        mock_get.return_value = self._mock_response(data)
+
+        with patch('core.ai.model_manager.os.fsync') as mock_fsync:
+            self.assertTrue(self.download_manager._download_file("m", model_info, None))
+        mock_fsync.assert_called_once()  # 重命名前落盘
+        with open(os.path.join(self.temp_dir, "m.gguf"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    @patch('core.ai.model_manager.requests.Session.head', return_value=Mock(headers={}))
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_truncates_preallocation(self, mock_get, mock_head):
+        """测试声明大小大于实际内容时截断预分配的空间"""
+        data = b"x" * 100
+        response = self._mock_response(data)
+        response.headers = {"content-length": "105"}
+        mock_get.return_value = response
+        model_info = {"url": "https://example.com/m.gguf", "filename": "m.gguf", "size_mb": 0, "sha256": None}
+
+        self.assertTrue(self.download_manager._download_file("m", model_info, None))
+        self.assertEqual(os.path.getsize(os.path.join(self.temp_dir, "m.gguf")), len(data))
+
+    @patch('core.ai.model_manager.requests.Session.head', return_value=Mock(headers={}))
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_rejects_bad_sha256(self, mock_get, mock_head):
+        """测试校验和不匹配时丢弃下载文件"""
+        model_info = {"url": "https://example.com/m.gguf", "filename": "m.gguf", "size_mb": 0,
+                      "sha256": "0" * 64}
+        mock_get.return_value = self._mock_response(b"gguf-model-bytes")
+
+        self.assertFalse(self.download_manager._download_file("m", model_info, None))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    @patch('core.ai.model_manager.PARALLEL_DOWNLOAD_MIN_SIZE', 16)
+    @patch('core.ai.model_manager.requests.Session.head')
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_ranges_in_parallel(self, mock_get, mock_head):
+        """测试支持Range时分段并行下载并按偏移拼接"""
+        import hashlib
+        data = bytes(range(256)) * 4
+        mock_head.return_value = Mock(headers={"accept-ranges": "bytes", "content-length": str(len(data))})
+
+        def ranged_get(url, headers=None, **kwargs):
+            first, last = map(int, headers["Range"][len("bytes="):].split("-"))
+            part = data[first:last + 1]
+            response = Mock(status_code=206)
+            response.raw = io.BytesIO(part)
+            return response
+
+        mock_get.side_effect = ranged_get
+        model_info = {"url": "https://example.com/m.gguf", "filename": "m.gguf", "size_mb": 0,
+                      "sha256": hashlib.sha256(data).hexdigest()}
+        progress_values = []
+
+        self.assertTrue(self.download_manager._download_file("m", model_info, lambda p: progress_values.append(p.downloaded)))
+        self.assertEqual(mock_get.call_count, 8)
+        self.assertEqual(max(progress_values), len(data))
+        with open(os.path.join(self.temp_dir, "m.gguf"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    @patch('core.ai.model_manager.time.sleep')
+    @patch('core.ai.model_manager.PARALLEL_DOWNLOAD_MIN_SIZE', 16)
+    @patch('core.ai.model_manager.requests.Session.head')
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_range_retries_from_offset(self, mock_get, mock_head, mock_sleep):
+        """测试单个分段中断后只重试该分段并从已写入位置续传，未提供校验和时不重读文件"""
+        from urllib3.exceptions import ProtocolError
+        data = bytes(range(256)) * 4
+        mock_head.return_value = Mock(headers={"accept-ranges": "bytes", "content-length": str(len(data))})
+        requested = []
+
+        class _DroppedConnection(io.BytesIO):
+            def readinto(self, buffer):
+                if self.tell() >= 64:
+                    raise ProtocolError("Connection broken")
+                return super().readinto(memoryview(buffer)[:64])
+
+        def ranged_get(url, headers=None, **kwargs):
+            first, last = map(int, headers["Range"][len("bytes="):].split("-"))
+            requested.append((first, last))
+            part = data[first:last + 1]
+            response = Mock(status_code=206)
+            # 第一个分段首次请求传输64字节后断开
+            response.raw = _DroppedConnection(part) if first == 0 else io.BytesIO(part)
+            return response
+
+        mock_get.side_effect = ranged_get
+        model_info = {"url": "https://example.com/m.gguf", "filename": "m.gguf", "size_mb": 0, "sha256": None}
+
+        with patch.object(self.download_manager, '_hash_file') as mock_hash:
+            self.assertTrue(self.download_manager._download_file("m", model_info, None))
+            mock_hash.assert_not_called()
+        self.assertEqual(mock_get.call_count, 9)
+        self.assertIn((64, 127), requested)
+        mock_sleep.assert_called_once()
+        with open(os.path.join(self.temp_dir, "m.gguf"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    @patch('core.ai.model_manager.PARALLEL_DOWNLOAD_MIN_SIZE', 16)
+    @patch('core.ai.model_manager.requests.Session.head')
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_uses_hf_transfer(self, mock_get, mock_head):
+        """测试安装 hf_transfer 时 HuggingFace 链接交给它下载"""
+        data = b"hf" * 64
+        mock_head.return_value = Mock(headers={"accept-ranges": "bytes", "content-length": str(len(data))})
+
+        def fake_download(url, filename, callback=None, **kwargs):
+            with open(filename, "wb") as f:
+                f.write(data)
+            callback(len(data))
+
+        fake_hf_transfer = Mock()
+        fake_hf_transfer.download.side_effect = fake_download
+        model_info = {"url": "https://huggingface.co/org/repo/resolve/main/m.gguf", "filename": "m.gguf",
+                      "size_mb": 0, "sha256": None}
+
+        with patch('core.ai.model_manager.hf_transfer', fake_hf_transfer):
+            self.assertTrue(self.download_manager._download_file("m", model_info, None))
+        fake_hf_transfer.download.assert_called_once()
+        mock_get.assert_not_called()
+        with open(os.path.join(self.temp_dir, "m.gguf"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_progress_reporter_throttles(self):
+        """测试进度回调按字节间隔节流，最后一块总会通知"""
+        from core.ai.model_manager import DownloadProgress, PROGRESS_NOTIFY_BYTES
+        progress = DownloadProgress("m.gguf", PROGRESS_NOTIFY_BYTES * 2, 0, 0, 0, "downloading")
+        calls = []
+        report = self.download_manager._progress_reporter(progress, lambda p: calls.append(p.downloaded))
+
+        chunk = PROGRESS_NOTIFY_BYTES // 4
+        for _ in range(8):
+            report(chunk)
+
+        self.assertEqual(calls, [PROGRESS_NOTIFY_BYTES, PROGRESS_NOTIFY_BYTES * 2])
+        self.assertEqual(progress.percentage, 100)
+
+    def test_progress_reporter_thread_safe(self):
+        """测试多个下载线程（含 hf_transfer 原生线程）并发上报时字节数不丢失"""
+        import threading
+        from core.ai.model_manager import DownloadProgress
+        progress = DownloadProgress("m.gguf", 8 * 20000, 0, 0, 0, "downloading")
+        report = self.download_manager._progress_reporter(progress, None)
+
+        workers = [threading.Thread(target=lambda: [report(1) for _ in range(20000)]) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(progress.downloaded, 8 * 20000)
+        self.assertEqual(progress.percentage, 100)
+
+    @patch('core.ai.model_manager.requests.Session.get')
+    def test_download_from_local_mirror(self, mock_get):
+        """测试file://本地镜像直接复制，不发起网络请求"""
+        from pathlib import Path
+        data = b"local-gguf" * 100
+        source = os.path.join(self.temp_dir, "mirror.gguf")
+        with open(source, "wb") as f:
+            f.write(data)
+        model_info = {"url": Path(source).as_uri(), "filename": "m.gguf", "size_mb": 0, "sha256": None}
+
+        self.assertTrue(self.download_manager._download_file("m", model_info, None))
+        mock_get.assert_not_called()
+        with open(os.path.join(self.temp_dir, "m.gguf"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
 class TestDeviceCompatibilityChecker(unittest.TestCase):
     """测试设备兼容性检查器"""
     
@@ -307,6 +1013,80 @@ class TestDeviceCompatibilityChecker(unittest.TestCase):
         self.assertIn("can_run_local_models", report)
         
         self.assertIsInstance(report["can_run_local_models"], bool)
+    
+    def test_compatibility_report_bytes(self):
+        """测试兼容性报告JSON编码"""
+        report = json.loads(self.compatibility_checker.get_compatibility_report_bytes())
+        
+        self.assertIn(report["system_info"]["os_platform"], {"windows", "linux", "macos", "unknown"})
+        self.assertIsInstance(report["can_run_local_models"], bool)
+    
+    def test_lazy_compatibility_check(self):
+        """测试兼容性检查延迟到首次访问"""
+        checker = DeviceCompatibilityChecker()
+        self.assertIsNone(checker._compatibility_issues)
+        
+        self.assertIsInstance(checker.compatibility_issues, list)
+        self.assertIsNotNone(checker._compatibility_issues)
+    
+    def test_python_version_check(self):
+        """测试Python版本检查"""
+        checker = DeviceCompatibilityChecker()
+        
+        checker.system_info["python_version_info"] = (3, 1, 0)
+        messages = [issue.message for issue in checker.check_compatibility()]
+        self.assertTrue(any("Python版本" in m for m in messages))
+        
+        checker.system_info["python_version_info"] = (3, 10, 4)
+        messages = [issue.message for issue in checker.check_compatibility()]
+        self.assertFalse(any("Python版本" in m for m in messages))
+    
+    def test_static_info_skips_probes(self):
+        """测试使用缓存的静态探测结果时跳过处理器探测，GPU使用本次探测结果"""
+        static_info = {
+            "processor": "cached-cpu",
+            "cpu_count_logical": 8,
+            "cpu_count_physical": 4,
+            "cpu_brand": ""
+        }
+        gpus = [{"vendor": "nvidia", "name": "live-gpu", "total_memory_mb": 8192, "free_memory_mb": 4096}]
+        
+        with patch.object(device_compatibility_module, '_cached_processor') as mock_processor, \
+             patch.object(device_compatibility_module, '_probe_nvidia_gpus') as mock_probe:
+            checker = DeviceCompatibilityChecker(static_info=static_info, nvidia_gpus=gpus)
+            mock_processor.assert_not_called()
+            mock_probe.assert_not_called()
+        
+        self.assertEqual(checker.system_info["processor"], "cached-cpu")
+        self.assertEqual(checker.system_info["gpu_info"][0]["free_memory_mb"], 4096)
+    
+    def test_compat_cache_static_fields_only(self):
+        """测试兼容性缓存只保存静态字段，且GPU型号或驱动变化时失效"""
+        gpus = [{"vendor": "nvidia", "name": "gpu-a", "driver_version": "550.1",
+                 "total_memory_mb": 8192, "free_memory_mb": 4096}]
+        checker = DeviceCompatibilityChecker(nvidia_gpus=gpus)
+        key = device_compatibility_module._compat_cache_key(gpus)
+        if key is None:
+            self.skipTest("psutil not available")
+        
+        device_compatibility_module._save_static_info(key, checker.system_info)
+        with open(device_compatibility_module._COMPAT_CACHE_PATH, encoding="utf-8") as f:
+            cached = f.read()
+        self.assertNotIn("free_memory_mb", cached)
+        self.assertNotIn("gpu-a", cached)
+        self.assertIsNotNone(device_compatibility_module._load_static_info(key))
+        
+        new_driver = [dict(gpus[0], driver_version="560.2")]
+        new_model = [dict(gpus[0], name="gpu-b")]
+        self.assertNotEqual(device_compatibility_module._compat_cache_key(new_driver), key)
+        self.assertNotEqual(device_compatibility_module._compat_cache_key(new_model), key)
+        # 剩余显存不参与缓存键
+        self.assertEqual(device_compatibility_module._compat_cache_key([dict(gpus[0], free_memory_mb=1)]), key)
+    
+    def test_global_checker_is_shared(self):
+        """测试全局检查器只创建一次"""
+        from core.ai.device_compatibility import get_device_compatibility_checker
+        self.assertIs(get_device_compatibility_checker(), get_device_compatibility_checker())
 
 class TestIntegration(unittest.TestCase):
     """集成测试"""
@@ -0,0 +1,102 @@
+"""
+记忆系统单元测试
+"""
+
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ai import memory_system as memory_module
+from core.ai.memory_system import Memory, MemorySystem, MemoryStore
+
+
+def _make_memories():
+    now = datetime.now()
+    specs = [
+        ("m1", 0, 0.5, "short_term", 0.5, 1.0),
+        ("m2", 3, 0.2, "short_term", 0.1, 1.0),
+        ("m3", 40, 0.1, "short_term", 0.1, 0.9),
+        ("m4", 100, 0.7, "long_term", 0.6, 0.3),
+        ("m5", 400, 0.95, "epic", 0.9, 0.5),
+        ("m6", 20, 0.4, "unknown", 0.3, 0.05),
+    ]
+    return [
+        Memory(id=memory_id, profile_id="p1", event_id="e1", summary=memory_id,
+               emotional_weight=emotional, memory_type=memory_type, importance=importance,
+               retention=retention, created_at=(now - timedelta(days=days, hours=1)).isoformat())
+        for memory_id, days, emotional, memory_type, importance, retention in specs
+    ]
+
+
+class TestMemory(unittest.TestCase):
+    """测试单条记忆"""
+
+    def test_timestamps(self):
+        """测试时间内部以Unix秒存储，导出时转为ISO字符串"""
+        created = datetime.now() - timedelta(days=10)
+        memory = Memory(id="m1", profile_id="p1", event_id="e1", summary="测试",
+                        emotional_weight=0.5, created_at=created.isoformat())
+        self.assertEqual(memory.created_at, created.timestamp())
+        self.assertEqual(memory.to_dict()["created_at"], created.isoformat())
+
+        memory.recall()
+        self.assertIsInstance(memory.last_recalled, float)
+        self.assertIsInstance(memory.to_dict()["last_recalled"], str)
+
+        same = Memory(id="m2", profile_id="p1", event_id="e1", summary="测试",
+                      emotional_weight=0.5, created_at=created)
+        self.assertEqual(same.calculate_retention(), memory.calculate_retention())
+
+    def test_slots(self):
+        """测试记忆对象不再携带实例字典"""
+        memory = Memory(id="m1", profile_id="p1", event_id="e1", summary="测试", emotional_weight=0.5)
+        self.assertFalse(hasattr(memory, "__dict__"))
+        self.assertEqual(memory.to_dict()["summary"], "测试")
+
+
+@unittest.skipIf(memory_module.np is None, "numpy 未安装")
+class TestBulkRetention(unittest.TestCase):
+    """测试批量留存率计算"""
+
+    def test_matches_scalar(self):
+        """测试批量计算与逐条计算一致"""
+        memories = _make_memories()
+        store = MemoryStore(memories)
+        now = datetime.now()
+        bulk = MemorySystem.bulk_retention(
+            store.created_ts, store.emotional, store.importance,
+            store.mem_type_code, now.timestamp()
+        )
+
+        self.assertEqual(len(store), len(memories))
+        for memory, retention in zip(memories, bulk):
+            # 分数以uint8量化存储，误差在量化步长量级
+            self.assertAlmostEqual(float(retention), memory.calculate_retention(now), delta=0.01)
+
+    def test_process_memory_forgetting(self):
+        """测试向量化遗忘统计与逐条统计一致"""
+        memories = _make_memories()
+        stats = MemorySystem.process_memory_forgetting(memories)
+
+        with patch.object(memory_module, "np", None):
+            scalar_stats = MemorySystem.process_memory_forgetting(memories)
+
+        self.assertEqual(stats, scalar_stats)
+        self.assertEqual(stats["total"], len(memories))
+        self.assertEqual(stats["forgotten"] + stats["strengthened"] + stats["decayed"], len(memories))
+        self.assertGreater(stats["forgotten"], 0)
+
+    def test_empty(self):
+        """测试空记忆列表"""
+        stats = MemorySystem.process_memory_forgetting([])
+        self.assertEqual(stats["total"], 0)
+        self.assertEqual(stats["forgotten"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -213,6 +213,129 @@ class TestCharacterInitializer(unittest.TestCase):
         result = await self.initializer.initialize_character_state(profile)
         
         self.assertIsNotNone(result)
+    
+    def _profile(self, **kwargs):
+        from shared.types import LifeProfile
+        fields = dict(id="test_profile", name="测试角色", gender="male",
+                      birthDate="1990-01-01", birthLocation="北京")
+        fields.update(kwargs)
+        return LifeProfile(**fields)
+    
+    def test_dimensions_from_flat_values(self):
+        """测试扁平属性数组还原为嵌套字典，且不修改基础模板"""
+        import json
+        
+        wealthy = self.initializer.initialize_character_state_sync(
+            self._profile(familyBackground="wealthy"))
+        poor = self.initializer.initialize_character_state_sync(
+            self._profile(familyBackground="poor", startingAge=18.0))
+        middle = self.initializer.initialize_character_state_sync(self._profile())
+        
+        self.assertEqual(wealthy.dimensions["social"]["economic"]["wealth"], 30)
+        self.assertIsInstance(wealthy.dimensions["social"]["economic"]["wealth"], int)
+        self.assertEqual(poor.dimensions["social"]["economic"]["debt"], 20)
+        self.assertEqual(poor.dimensions["social"]["career"]["level"], 10)
+        self.assertAlmostEqual(poor.dimensions["cognitive"]["knowledge"]["practical"], 18.0)
+        self.assertEqual(middle.dimensions, self.initializer.base_attributes)
+        
+        # 预计算的家庭背景数组不会被成长模拟修改；未知背景回退到基础属性
+        again = self.initializer.initialize_character_state_sync(
+            self._profile(familyBackground="poor"))
+        unknown = self.initializer.initialize_character_state_sync(
+            self._profile(familyBackground="unknown"))
+        self.assertEqual(again.dimensions["cognitive"]["knowledge"]["practical"], 0)
+        self.assertEqual(unknown.dimensions, self.initializer.base_attributes)
+        self.assertEqual(self.initializer.base_attributes["social"]["economic"]["wealth"], 0)
+        json.dumps(poor.to_dict())
+    
+    def test_adjustment_tables(self):
+        """测试模块级调整表按键应用，未知键不调整"""
+        dimensions = self.initializer._load_base_attributes()
+        self.initializer._adjust_by_education(dimensions, "graduate")
+        self.initializer._adjust_by_health(dimensions, "poor")
+        self.initializer._adjust_by_difficulty(dimensions, "unknown")
+        
+        self.assertEqual(dimensions["cognitive"]["knowledge"]["academic"], 25)
+        self.assertEqual(dimensions["social"]["career"]["level"], 10)
+        self.assertEqual(dimensions["physiological"]["health"], 55)
+        self.assertEqual(dimensions["social"]["economic"]["wealth"], 0)
+        
+        # 缺失或非数值的属性被跳过
+        partial = {"social": {"economic": "未知"}, "physiological": {"health": 50}}
+        self.initializer._adjust_by_difficulty(partial, "nightmare")
+        self.assertEqual(partial, {"social": {"economic": "未知"}, "physiological": {"health": 20}})
+    
+    def test_initial_values_cached(self):
+        """测试同一特质组合复用只读的属性数组"""
+        first = self.initializer._initial_values("poor", 18.0)
+        self.assertIs(self.initializer._initial_values("poor", 18.0), first)
+        self.assertIsNot(self.initializer._initial_values("poor", 0.0), first)
+        
+        state = self.initializer.initialize_character_state_sync(
+            self._profile(familyBackground="poor", startingAge=18.0))
+        state.dimensions["social"]["career"]["level"] = 99
+        again = self.initializer.initialize_character_state_sync(
+            self._profile(familyBackground="poor", startingAge=18.0))
+        self.assertEqual(again.dimensions["social"]["career"]["level"], 10)
+    
+    def test_profile_birth_date_cached(self):
+        """测试档案出生日期只解析一次，修改后重新解析"""
+        profile = self._profile()
+        self.assertEqual(profile.birth_date_obj, datetime(1990, 1, 1))
+        self.assertIs(profile.birth_date_obj, profile.birth_date_obj)
+        
+        profile.birthDate = "2000-06-15"
+        self.assertEqual(profile.birth_date_obj, datetime(2000, 6, 15))
+        self.assertNotIn("birth_date_obj", profile.to_dict())
+    
+    def test_slotted_state_pickle(self):
+        """测试启用 __slots__ 后快照可序列化，且兼容旧快照"""
+        import pickle
+        import shared.types as types_module
+        from shared.types import CharacterState
+        
+        state = self.initializer.initialize_character_state_sync(self._profile(startingAge=8.0))
+        self.assertFalse(hasattr(state, "__dict__"))
+        self.assertEqual(pickle.loads(pickle.dumps(state)).to_dict(), state.to_dict())
+        
+        # 旧快照：以实例字典保存的同名类
+        class LegacyState:
+            pass
+        LegacyState.__module__, LegacyState.__qualname__ = "shared.types", "CharacterState"
+        legacy = LegacyState()
+        legacy.__dict__.update(state.to_dict())
+        with patch.object(types_module, "CharacterState", LegacyState):
+            blob = pickle.dumps(legacy)
+        self.assertEqual(pickle.loads(blob).to_dict(), state.to_dict())
+    
+    def test_current_date(self):
+        """测试当前日期、整数年龄与存活天数"""
+        state = self.initializer.initialize_character_state_sync(
+            self._profile(birthDate="1990-06-15T08:30:00", startingAge=18.0))
+        self.assertEqual(state.currentDate, "2008-06-14")
+        self.assertEqual(state.age, 17)
+        self.assertEqual(state.daysSurvived, 6574)
+        self.assertEqual(state.lifeStage, "teen")
+    
+    def test_determine_life_stage(self):
+        """测试人生阶段分界（分界年龄属于下一阶段）"""
+        cases = [(0, 'infant'), (0.99, 'infant'), (1, 'toddler'), (12.5, 'childhood'),
+                 (13, 'teen'), (19, 'teen'), (20, 'youngAdult'), (49.9, 'adult'),
+                 (50, 'middleAge'), (65, 'senior'), (90, 'senior')]
+        for age, stage in cases:
+            self.assertEqual(self.initializer._determine_life_stage(age), stage, age)
+    
+    def test_dimensions_without_numpy(self):
+        """测试未安装numpy时结果一致"""
+        import asyncio
+        from core.engine import character as character_module
+        
+        profile = self._profile(familyBackground="poor", startingAge=12.5)
+        expected = self.initializer.initialize_character_state_sync(profile)
+        with patch.object(character_module, "np", None):
+            initializer = character_module.CharacterInitializer()
+            state = asyncio.run(initializer.initialize_character_state(profile))
+        self.assertEqual(state.dimensions, expected.dimensions)
 
 
 class TestMacroEventSystem(unittest.TestCase):